@@ -0,0 +1,236 @@
+# american.py
+# American-exercise pricing for whole option chains. A CRR binomial lattice is
+# stepped backwards for every contract at once, laid out as (nodes, contracts) so
+# each step works on contiguous slices. Discrete cash dividends use the escrowed-
+# dividend model (tree on spot less PV of dividends, exercise against the full
+# spot). The last step uses Black-Scholes and two step counts are Richardson-
+# extrapolated (BBSR), which removes most of the CRR odd/even error. Contracts
+# that cannot exercise early skip the lattice. Barone-Adesi-Whaley is the fast
+# analytic alternative.
+# Greeks: delta/gamma/theta from the first lattice nodes, vega/rho from central
+# bumps run in the same lockstep batch. Units follow greeks.chain_greeks: theta
+# per year, vega per 1.00 of vol, rho per 1.00 of rate.
+import numpy as np
+from scipy.special import ndtr
+
+from greeks import _is_call, bs_price, chain_greeks, years_to_expiry
+from instrumentation import timed
+
+DEFAULT_STEPS = 100  # BBS at 100 and 50 steps, Richardson-extrapolated
+VOL_BUMP = 0.01
+RATE_BUMP = 1e-4
+AMERICAN_GREEKS = ["price", "delta", "gamma", "theta", "vega", "rho"]
+
+
+def _inputs(S, K, T, r, sigma, option_type, q):
+    S, K, T, r, q, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (S, K, T, r, q, sigma)))
+    shape = S.shape
+    call = _is_call(option_type, shape).ravel()
+    flat = [a.ravel() for a in (S, K, np.maximum(T, 0.0), r, q, np.maximum(sigma, 1e-8))]
+    return shape, call, flat
+
+
+def _dividend_pv(dividends, t, T, r):
+    # PV at time t of the cash dividends paid in (t, T); t, T, r are per contract
+    pv = np.zeros(np.broadcast(t, T).shape)
+    for when, amount in dividends or ():
+        live = (when > t) & (when < T)
+        pv += np.where(live, amount * np.exp(-r * (when - t)), 0.0)
+    return pv
+
+
+def _lattice(S, K, T, r, q, sigma, call, steps, dividends, keep_nodes=False):
+    # Backward induction in lockstep over 1-D contract arrays. Returns the price,
+    # plus the level-1 and level-2 values and spots when keep_nodes (for greeks).
+    n = S.size
+    steps = max(int(steps), 4)
+    live = T > 0
+    t_eff = np.where(live, T, 1.0)
+    dt = t_eff / steps
+    log_u = sigma * np.sqrt(dt)
+    u = np.exp(log_u)
+    d = 1.0 / u
+    p = np.clip((np.exp((r - q) * dt) - d) / (u - d), 0.0, 1.0)
+    disc = np.exp(-r * dt)
+    p_up, p_down = disc * p, disc * (1 - p)
+    sign = np.where(call, 1.0, -1.0)
+    s_star = S - _dividend_pv(dividends, 0.0, t_eff, r)
+
+    # spot at node j of level i is s_star * u^(2j - i) + PV(remaining dividends);
+    # the payoff sign is folded into the node powers once
+    signed_up2 = sign * np.exp(2.0 * np.arange(steps + 1)[:, None] * log_u)    # (nodes, contracts)
+
+    def spots(i):
+        return s_star * np.exp(-i * log_u) * sign * signed_up2[:i + 1], _dividend_pv(dividends, i * dt, t_eff, r)
+
+    # BBS: the European value over the final step replaces the last two tree levels
+    star, pv = spots(steps - 1)
+    cont = bs_price(star, K, dt, r, sigma, np.broadcast_to(call, star.shape), q)
+    value = np.empty((steps + 1, n))
+    value[:steps] = np.maximum(cont, sign * (star + pv - K))
+    nodes = {}
+    tmp = np.empty((steps, n))
+    exercise = np.empty((steps, n))
+    for i in range(steps - 2, -1, -1):
+        lo, c, ex = value[:i + 1], tmp[:i + 1], exercise[:i + 1]
+        np.multiply(value[1:i + 2], p_up, out=c)
+        np.multiply(lo, p_down, out=ex)
+        c += ex
+        np.multiply(signed_up2[:i + 1], s_star * np.exp(-i * log_u), out=ex)
+        pv = _dividend_pv(dividends, i * dt, t_eff, r) if dividends else 0.0
+        ex += sign * (pv - K)
+        np.maximum(c, ex, out=lo)
+        if keep_nodes and i in (1, 2):
+            star, pv = spots(i)
+            nodes[i] = (lo.copy(), star + pv)
+
+    price = np.where(live, value[0], np.maximum(sign * (S - K), 0.0))
+    if keep_nodes:
+        return price, nodes, dt
+    return price
+
+
+def _baw(S, K, T, r, q, sigma, call, iterations=50, tol=1e-8):
+    # Barone-Adesi-Whaley quadratic approximation; the critical spot is found by
+    # Newton iterations run in lockstep (Haug's seed and update)
+    european = bs_price(S, K, T, r, sigma, call, q)
+    sign = np.where(call, 1.0, -1.0)
+    price = european.copy()
+    # no early exercise: calls without a dividend yield, puts at non-positive rates
+    early = (T > 0) & np.where(call, q > 0, r > 0)
+    if not early.any():
+        return np.where(T > 0, price, np.maximum(sign * (S - K), 0.0))
+    s, k, t, rr, qq, v, cl, sg = (a[early] for a in (S, K, T, r, q, sigma, call, sign))
+    vst = v * np.sqrt(t)
+    big_m = 2 * rr / (v * v)
+    big_n = 2 * (rr - qq) / (v * v)
+    kk = 1 - np.exp(-rr * t)
+    disc_q = np.exp(-qq * t)
+    root = np.sqrt((big_n - 1) ** 2 + 4 * big_m / kk)
+    q_exp = np.where(cl, (-(big_n - 1) + root) / 2, (-(big_n - 1) - root) / 2)
+
+    # seed: the perpetual critical price blended towards the strike (Haug)
+    q_inf = np.where(cl, (-(big_n - 1) + np.sqrt((big_n - 1) ** 2 + 4 * big_m)) / 2,
+                     (-(big_n - 1) - np.sqrt((big_n - 1) ** 2 + 4 * big_m)) / 2)
+    s_inf = k / (1 - 1 / q_inf)
+    h = np.where(cl, -((rr - qq) * t + 2 * vst) * k / (s_inf - k), ((rr - qq) * t - 2 * vst) * k / (k - s_inf))
+    crit = np.where(cl, k + (s_inf - k) * (1 - np.exp(h)), s_inf + (k - s_inf) * np.exp(h))
+
+    done = np.zeros(crit.shape, dtype=bool)
+    for _ in range(iterations):
+        d1 = (np.log(crit / k) + (rr - qq + 0.5 * v * v) * t) / vst
+        nd1 = ndtr(sg * d1)
+        pdf = np.exp(-0.5 * d1 * d1) / np.sqrt(2 * np.pi)
+        euro = bs_price(crit, k, t, rr, v, cl, qq)
+        rhs = euro + sg * (1 - disc_q * nd1) * crit / q_exp
+        lhs = sg * (crit - k)
+        slope = sg * disc_q * nd1 * (1 - 1 / q_exp) + (1 - sg * disc_q * pdf / vst) / q_exp * sg
+        nxt = np.where(cl, (k + rhs - slope * crit) / (1 - slope), (k - rhs + slope * crit) / (1 + slope))
+        nxt = np.where(done | ~np.isfinite(nxt) | (nxt <= 0), crit, nxt)
+        done |= np.abs(lhs - rhs) / k < tol
+        crit = nxt
+        if done.all():
+            break
+
+    d1 = (np.log(crit / k) + (rr - qq + 0.5 * v * v) * t) / vst
+    a = sg * (crit / q_exp) * (1 - disc_q * ndtr(sg * d1))
+    exercise_now = np.where(cl, s >= crit, s <= crit)
+    early_price = np.where(exercise_now, sg * (s - k), european[early] + a * (s / crit) ** q_exp)
+    price[early] = early_price
+    return np.where(T > 0, price, np.maximum(sign * (S - K), 0.0))
+
+
+def _early_exercise(call, T, r, q, dividends):
+    # contracts that can be worth more than their European value; calls without a
+    # yield or a dividend before expiry never are and go to Black-Scholes directly
+    before_expiry = np.zeros(T.shape, dtype=bool)
+    for when, amount in dividends or ():
+        before_expiry |= (when > 0) & (when < T) & (amount > 0)
+    return (T > 0) & (~call | (q > 0) | before_expiry)
+
+
+def _bbsr(S, K, T, r, q, sigma, call, steps, dividends):
+    # Richardson extrapolation of the BBS lattice over steps and steps / 2
+    return 2 * _lattice(S, K, T, r, q, sigma, call, steps, dividends) - \
+        _lattice(S, K, T, r, q, sigma, call, steps // 2, dividends)
+
+
+def _lattice_greeks(S, K, T, r, q, sigma, call, steps, dividends):
+    # price, delta, gamma and theta read off the first two levels of the tree
+    price, nodes, dt = _lattice(S, K, T, r, q, sigma, call, steps, dividends, keep_nodes=True)
+    (v1, s1), (v2, s2) = nodes[1], nodes[2]
+    up = (v2[2] - v2[1]) / (s2[2] - s2[1])
+    down = (v2[1] - v2[0]) / (s2[1] - s2[0])
+    return {
+        "price": price,
+        "delta": (v1[1] - v1[0]) / (s1[1] - s1[0]),
+        "gamma": (up - down) / (0.5 * (s2[2] - s2[0])),
+        "theta": (v2[1] - price) / (2 * dt),
+    }
+
+
+def american_price(S, K, T, r, sigma, option_type='call', q=0.0, dividends=None, method="lattice",
+                   steps=DEFAULT_STEPS):
+    # dividends: [(years from now, cash amount), ...] for the underlying, shared by
+    # every contract. method="baw" applies them by escrowing their PV from the spot,
+    # which ignores early exercise of calls ahead of a dividend; prefer the lattice then.
+    shape, call, (S, K, T, r, q, sigma) = _inputs(S, K, T, r, sigma, option_type, q)
+    if method == "baw":
+        return _baw(S - _dividend_pv(dividends, 0.0, T, r), K, T, r, q, sigma, call).reshape(shape)
+    price = bs_price(S, K, T, r, sigma, call, q)
+    early = _early_exercise(call, T, r, q, dividends)
+    if early.any():
+        price[early] = _bbsr(*(a[early] for a in (S, K, T, r, q, sigma, call)), steps, dividends)
+    return price.reshape(shape)
+
+
+@timed()
+def american_greeks(S, K, T, r, sigma, option_type='call', q=0.0, dividends=None, method="lattice",
+                    steps=DEFAULT_STEPS):
+    # price and greeks for every contract. Lattice: delta/gamma/theta from the tree
+    # nodes; the vol- and rate-bumped copies of each contract run in the same
+    # lockstep pass as the base ones. Contracts with no early exercise use the
+    # closed-form Black-Scholes greeks.
+    shape, call, (S, K, T, r, q, sigma) = _inputs(S, K, T, r, sigma, option_type, q)
+    euro = chain_greeks(S, K, T, r, sigma, call, q)
+    out = {name: euro[name].copy() for name in AMERICAN_GREEKS}
+    early = np.ones(S.shape, dtype=bool) if method == "baw" else _early_exercise(call, T, r, q, dividends)
+    if early.any():
+        s, k, t, rr, qq, v, cl = (a[early] for a in (S, K, T, r, q, sigma, call))
+        n = s.size
+        tile = lambda a: np.tile(a, 5)
+        bump_v = np.repeat([0.0, VOL_BUMP, -VOL_BUMP, 0.0, 0.0], n)
+        bump_r = np.repeat([0.0, 0.0, 0.0, RATE_BUMP, -RATE_BUMP], n)
+        args = (tile(s), tile(k), tile(t), tile(rr) + bump_r, tile(qq), np.maximum(tile(v) + bump_v, 1e-8), tile(cl))
+        if method == "baw":
+            prices = _baw(args[0] - _dividend_pv(dividends, 0.0, args[2], args[3]), *args[1:])
+            # spot and time bumps for the analytic model
+            h = 1e-3 * s
+            dt = np.minimum(1 / 365, t)
+            up, down, later = (_baw(x - _dividend_pv(dividends, 0.0, tt, rr), k, tt, rr, qq, v, cl)
+                               for x, tt in ((s + h, t), (s - h, t), (s, t - dt)))
+            price = prices[:n]
+            g = {"delta": (up - down) / (2 * h), "gamma": (up - 2 * price + down) / (h * h),
+                 "theta": np.where(dt > 0, (later - price) / np.where(dt > 0, dt, 1.0), 0.0)}
+        else:
+            full = _lattice_greeks(*args, steps, dividends)
+            half = _lattice_greeks(*args, steps // 2, dividends)
+            prices = 2 * full["price"] - half["price"]
+            g = {name: 2 * full[name][:n] - half[name][:n] for name in ("delta", "gamma", "theta")}
+        g["price"] = prices[:n]
+        g["vega"] = (prices[n:2 * n] - prices[2 * n:3 * n]) / (2 * VOL_BUMP)
+        g["rho"] = (prices[3 * n:4 * n] - prices[4 * n:]) / (2 * RATE_BUMP)
+        for name in AMERICAN_GREEKS:
+            out[name][early] = g[name]
+    return {name: out[name].reshape(shape) for name in AMERICAN_GREEKS}
+
+
+@timed(rows=True)
+def american_greeks_for_chain(chain, S, r, q=0.0, dividends=None, iv_col='impliedVolatility', now=None,
+                              method="lattice", steps=DEFAULT_STEPS):
+    # same chain layout as greeks.greeks_for_chain; adds price/delta/gamma/theta/vega/rho
+    T = chain['T'].to_numpy(float) if 'T' in chain else years_to_expiry(chain['expiry'], now)
+    spot = chain[S].to_numpy(float) if isinstance(S, str) else S
+    g = american_greeks(spot, chain['strike'].to_numpy(float), T, r, chain[iv_col].to_numpy(float),
+                        chain['type'].to_numpy(), q, dividends, method, steps)
+    return chain.assign(**g)
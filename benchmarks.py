@@ -0,0 +1,317 @@
+# benchmarks.py
+# Reproducible timings of the hot paths on deterministic synthetic inputs (no
+# network). Each case is timed at several sizes; results (best/median seconds,
+# throughput, peak traced memory) go to a JSON file, and --compare flags
+# regressions against a stored baseline.
+#   python benchmarks.py --output bench.json
+#   python benchmarks.py --quick --compare bench.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import synthetic_data as sd
+
+BENCHMARKS = {}
+
+
+def benchmark(name, sizes, quick, unit):
+    # setup(size) builds inputs outside the timed region and returns (run, units), or
+    # (run, units, teardown) when it leaves something to clean up
+    def register(setup):
+        BENCHMARKS[name] = {"setup": setup, "sizes": sizes, "quick": quick, "unit": unit}
+        return setup
+    return register
+
+
+@benchmark("chain_greeks", [1_000, 10_000, 100_000, 1_000_000], [1_000, 100_000], "contracts")
+def _chain_greeks(n):
+    from greeks import chain_greeks
+    c = sd.synthetic_chain(n)
+    S, K, T, iv, kind = (c[k].to_numpy() for k in ("S", "strike", "T", "impliedVolatility", "type"))
+    return lambda: chain_greeks(S, K, T, 0.04, iv, kind), n
+
+
+@benchmark("american_chain", [1_000, 5_000], [1_000], "contracts")
+def _american_chain(n):
+    from american import american_price
+    c = sd.synthetic_chain(n)
+    S, K, T, iv, kind = (c[k].to_numpy() for k in ("S", "strike", "T", "impliedVolatility", "type"))
+    return lambda: american_price(S, K, T, 0.04, iv, kind, q=0.01), n
+
+
+@benchmark("black_scholes_greeks_scalar", [1_000, 10_000], [1_000], "calls")
+def _bs_scalar(n):
+    from greeks import black_scholes_greeks
+    rows = sd.synthetic_chain(n)[["S", "strike", "T", "impliedVolatility", "type"]].to_numpy().tolist()
+    return lambda: [black_scholes_greeks(S, K, T, 0.04, v, t) for S, K, T, v, t in rows], n
+
+
+@benchmark("signals_backtest", [(50, 252 * 10), (500, 252 * 30)], [(50, 252 * 10)], "ticker_days")
+def _signals_backtest(size):
+    from backtest import simple_backtest
+    from signals import compute_signals
+    n_tickers, n_days = size
+    prices = sd.synthetic_prices(n_tickers, n_days)
+    frames = [prices[[t]].rename(columns={t: "Close"}) for t in prices.columns]
+    return lambda: [simple_backtest(compute_signals(f)) for f in frames], n_tickers * n_days
+
+
+@benchmark("signal_panel", [(50, 2_520), (500, 2_520)], [(50, 2_520)], "ticker_days")
+def _signal_panel(size):
+    from signals import compute_panel_signals
+    n_tickers, n_days = size
+    prices = sd.synthetic_prices(n_tickers, n_days)
+    return lambda: compute_panel_signals(prices), n_tickers * n_days
+
+
+@benchmark("signal_update", [500, 5_000], [500], "tickers")
+def _signal_update(n):
+    # one nightly bar appended to carried state (no re-rolling over history)
+    from signals import SignalEngine
+    prices = sd.synthetic_prices(n, 301)
+    engine = SignalEngine()
+    engine.run(prices.iloc[:300])
+    bar, dates = prices.iloc[-1], iter(pd.bdate_range(prices.index[-1], periods=10_000))
+    return lambda: engine.update(next(dates), bar), n
+
+
+@benchmark("volume_zscore", [(500, 60), (100_000, 60)], [(500, 60)], "key_days")
+def _volume_zscore(size):
+    from volume_store import RollingStats, flag_anomalies
+    n_keys, n_days = size
+    days = [(d, g) for d, g in sd.synthetic_volume_history(n_keys, n_days).groupby("date", sort=True)]
+
+    def run():
+        stats = RollingStats()
+        for date, day in days:
+            z = stats.update(date, day["ticker"], day["total_volume"].to_numpy())
+        return flag_anomalies(day.assign(z_score=z))
+    return run, n_keys * n_days
+
+
+@benchmark("run_kmeans", [10_000, 100_000], [10_000], "rows")
+def _run_kmeans(n):
+    from cluster_analysis import run_kmeans
+    frame = sd.synthetic_features(n, ["Close", "volatility", "volume"], dated=False)
+    return lambda: run_kmeans(frame), n
+
+
+@benchmark("rank_trades", [1_000, 100_000], [1_000], "trades")
+def _rank_trades(n):
+    from portfolio_manager import rank_trades
+    rng = np.random.default_rng(0)
+    trades = [{"ticker": f"T{i}", "expected_gain": g, "max_loss": l}
+              for i, (g, l) in enumerate(zip(rng.normal(1, 2, n), rng.uniform(0.1, 5, n)))]
+    return lambda: rank_trades(trades), n
+
+
+@benchmark("regression_full", [500, 7_560], [500], "rows")
+def _regression_full(n):
+    from run_regression import FEATURES, fit_ols
+    frame = sd.synthetic_features(n, FEATURES)
+    return lambda: fit_ols(frame), n
+
+
+@benchmark("regression_rolling", [(500, 60), (7_560, 252)], [(500, 60)], "windows")
+def _regression_rolling(size):
+    from run_regression import FEATURES, rolling_ols
+    n, window = size
+    frame = sd.synthetic_features(n, FEATURES)
+    return lambda: rolling_ols(frame, window=window), n - window + 1
+
+
+@benchmark("vol_surface_fit", [8, 32], [8], "expiries")
+def _vol_surface_fit(n):
+    from data_fetch import normalize_chain
+    from vol_surface import VolSurface
+    src = sd.SyntheticChainSource(n_expiries=n)
+    S = src.spot("SYN")
+    chain = pd.concat([normalize_chain("SYN", e, *src.chain("SYN", e)) for e in src.expirations("SYN")],
+                      ignore_index=True)
+    return lambda: VolSurface.fit(chain, S, 0.04), n
+
+
+@benchmark("vol_surface_query", [10_000, 1_000_000], [10_000], "queries")
+def _vol_surface_query(n):
+    from data_fetch import normalize_chain
+    from vol_surface import VolSurface
+    src = sd.SyntheticChainSource()
+    S = src.spot("SYN")
+    chain = pd.concat([normalize_chain("SYN", e, *src.chain("SYN", e)) for e in src.expirations("SYN")],
+                      ignore_index=True)
+    surface = VolSurface.fit(chain, S, 0.04)
+    rng = np.random.default_rng(0)
+    K, T = S * rng.uniform(0.7, 1.3, n), rng.uniform(0.01, 0.2, n)
+    return lambda: surface.iv(K, T), n
+
+
+@benchmark("spread_optimizer", [(8, 40), (20, 200)], [(8, 40)], "contracts")
+def _spread_optimizer(size):
+    from data_fetch import normalize_chain
+    from spread_optimizer import optimize_spreads
+    n_expiries, strikes = size
+    src = sd.SyntheticChainSource(n_expiries=n_expiries, strikes_per_expiry=strikes)
+    S = src.spot("SYN")
+    chain = pd.concat([normalize_chain("SYN", e, *src.chain("SYN", e)) for e in src.expirations("SYN")],
+                      ignore_index=True)
+    return lambda: optimize_spreads(chain, S, 0.04, max_loss=5, delta_band=(-0.25, 0.25)), len(chain)
+
+
+@benchmark("options_backtest", [63, 252], [63], "days")
+def _options_backtest(n):
+    from chain_store import ChainStore
+    from options_backtest import TargetDeltaStrategy, run_backtest
+    tmp = tempfile.TemporaryDirectory(prefix="bench_chains_")
+    store = ChainStore(tmp.name)
+    for date, chain in sd.synthetic_chain_history("SYN", n):
+        store.write_day("SYN", date, chain)
+    return lambda: run_backtest("SYN", TargetDeltaStrategy(), store), n, tmp.cleanup
+
+
+@benchmark("feature_store_refresh", [252, 2_520], [252], "refreshes")
+def _feature_store_refresh(n):
+    # one new daily macro row and options snapshot appended, then re-materialized
+    from feature_store import FeatureStore
+    tmp = tempfile.TemporaryDirectory(prefix="bench_features_")
+    store = FeatureStore(tmp.name)
+    frame = sd.synthetic_features(n, ["interest_rate", "sentiment_score", "implied_volatility_30d"])
+    store.write("SYN", "macro", frame.drop(columns="implied_volatility_30d"), spine=True)
+    store.write("SYN", "options", frame[["implied_volatility_30d"]].iloc[::5], tolerance="5D")
+    store.materialize("SYN")
+    days = iter(pd.bdate_range(frame.index[-1], periods=10_000)[1:])
+
+    def run():
+        day = pd.DatetimeIndex([next(days)], name="date")
+        store.write("SYN", "macro", pd.DataFrame({"stock_return": 0.0, "interest_rate": 0.04, "sentiment_score": 0.5},
+                                                 index=day), spine=True)
+        store.write("SYN", "options", pd.DataFrame({"implied_volatility_30d": 0.3}, index=day), tolerance="5D")
+        return store.materialize("SYN")
+    return run, 1, tmp.cleanup
+
+
+def _peak_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(name, size, repeat=3, memory=True):
+    spec = BENCHMARKS[name]
+    fn, units, *teardown = spec["setup"](size)
+    try:
+        fn()  # warm-up: first-call imports and caches stay out of the timings
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        best = min(times)
+        peak_mb = _peak_mb(fn) if memory else None
+    finally:
+        for cleanup in teardown:
+            cleanup()
+    return {
+        "name": name,
+        "size": size if np.isscalar(size) else list(size),
+        "units": units,
+        "unit": spec["unit"],
+        "seconds": best,
+        "median": float(np.median(times)),
+        "throughput": units / best if best > 0 else float("inf"),
+        "peak_mb": peak_mb,
+    }
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(names=None, quick=False, repeat=3, memory=True, log=print):
+    results = []
+    for name in names or BENCHMARKS:
+        spec = BENCHMARKS[name]
+        for size in spec["quick"] if quick else spec["sizes"]:
+            row = run_case(name, size, repeat, memory)
+            results.append(row)
+            if log:
+                mem = f"{row['peak_mb']:9.1f} MB" if row["peak_mb"] is not None else ""
+                log(f"{name:<28} {str(row['size']):>16} {row['seconds']:10.4f}s "
+                    f"{row['throughput']:14,.0f} {row['unit']}/s {mem}")
+    return {"meta": _meta(), "results": results}
+
+
+def compare(current, baseline, tolerance=0.25, memory_tolerance=0.5, min_delta=0.005):
+    # rows present in both runs; slower/heavier than tolerance are regressions.
+    # Slowdowns under min_delta seconds (or 1 MB) are noise on the tiny cases.
+    key = lambda r: (r["name"], json.dumps(r["size"]))
+    base = {key(r): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        ratio = r["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        mem_ratio = (r["peak_mb"] / b["peak_mb"]) if r.get("peak_mb") and b.get("peak_mb") else None
+        rows.append({
+            "name": r["name"], "size": str(r["size"]),
+            "baseline_s": b["seconds"], "current_s": r["seconds"], "ratio": ratio,
+            "mem_ratio": mem_ratio,
+            "regression": (ratio > 1 + tolerance and r["seconds"] - b["seconds"] > min_delta)
+            or (mem_ratio is not None and mem_ratio > 1 + memory_tolerance and r["peak_mb"] - b["peak_mb"] > 1),
+        })
+    return pd.DataFrame(rows, columns=["name", "size", "baseline_s", "current_s", "ratio", "mem_ratio", "regression"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths on synthetic data")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="subset of benchmarks")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.only, args.quick, args.repeat, not args.no_memory)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results -> {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        table = compare(report, baseline, args.tolerance)
+        print(table.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+        if table["regression"].any():
+            print(f"{int(table['regression'].sum())} regression(s) against {args.compare}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+# chain_store.py
+# Daily option-chain snapshots, one Parquet file per (ticker, day), so a replay can
+# stream a single day's chain at a time and tickers can be split across processes.
+#   <root>/ticker=AAPL/date=YYYY-MM-DD/part-0.parquet
+# Snapshots keep only what a backtest needs (expiry, type, strike, quotes, volume,
+# open interest, IV and spot) in narrow dtypes with zstd compression; a 40-strike x
+# 8-expiry chain is a few KB per day.
+#   python chain_store.py snapshot --tickers AAPL MSFT --root chain_store
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+
+STORE_DIR = "chain_store"
+PARTITIONING = ds.partitioning(pa.schema([("ticker", pa.string()), ("date", pa.string())]), flavor="hive")
+SNAPSHOT_SCHEMA = pa.schema([
+    ("expiry", pa.date32()),
+    ("type", pa.dictionary(pa.int8(), pa.string())),
+    ("strike", pa.float64()),
+    ("bid", pa.float32()),
+    ("ask", pa.float32()),
+    ("lastPrice", pa.float32()),
+    ("volume", pa.int32()),
+    ("openInterest", pa.int32()),
+    ("impliedVolatility", pa.float32()),
+    ("spot", pa.float64()),
+])
+SNAPSHOT_COLUMNS = SNAPSHOT_SCHEMA.names
+
+
+def _day(date):
+    return f"{pd.Timestamp(date):%Y-%m-%d}"
+
+
+def _compact(chain, spot):
+    # long-format chain (data_fetch.normalize_chain) -> the snapshot columns
+    frame = pd.DataFrame({
+        "expiry": pd.to_datetime(chain["expiry"]).dt.date,
+        "type": chain["type"].astype(str).str.lower().to_numpy(),
+        "strike": chain["strike"].to_numpy(float),
+    })
+    for col in ("bid", "ask", "lastPrice", "impliedVolatility"):
+        frame[col] = chain[col].to_numpy(np.float32, na_value=np.nan) if col in chain else np.float32(np.nan)
+    for col in ("volume", "openInterest"):
+        frame[col] = chain[col].to_numpy(float, na_value=0).astype(np.int32) if col in chain else 0
+    if spot is None:
+        spot = chain["spot"].to_numpy(float) if "spot" in chain else np.nan
+    frame["spot"] = spot
+    return frame.sort_values(["expiry", "type", "strike"], kind="stable")
+
+
+class ChainStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ticker, date):
+        return os.path.join(self.root, f"ticker={ticker}", f"date={_day(date)}", "part-0.parquet")
+
+    def write_day(self, ticker, date, chain, spot=None):
+        # rewriting a day replaces its snapshot; other days are never touched
+        path = self._path(ticker, date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(_compact(chain, spot), schema=SNAPSHOT_SCHEMA, preserve_index=False)
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+
+    @timed(rows=True)
+    def write_chains(self, chains, date):
+        # one long frame for many tickers (fetch_option_chains(..., with_spot=True))
+        for ticker, chain in chains.groupby("ticker", sort=False):
+            self.write_day(ticker, date, chain)
+        return chains
+
+    def tickers(self):
+        return sorted(d.split("=", 1)[1] for d in os.listdir(self.root) if d.startswith("ticker="))
+
+    def dates(self, ticker, start=None, end=None):
+        folder = os.path.join(self.root, f"ticker={ticker}")
+        if not os.path.isdir(folder):
+            return []
+        days = sorted(d.split("=", 1)[1] for d in os.listdir(folder) if d.startswith("date="))
+        lo = _day(start) if start is not None else ""
+        hi = _day(end) if end is not None else "9999"
+        return [pd.Timestamp(d) for d in days if lo <= d <= hi]
+
+    def read_day(self, ticker, date, columns=None):
+        table = pq.read_table(self._path(ticker, date), columns=columns)
+        if "type" in table.column_names:
+            # decode the dictionary in Arrow; a pandas categorical round trip costs more
+            i = table.schema.get_field_index("type")
+            table = table.set_column(i, "type", table.column(i).cast(pa.string()))
+        return table.to_pandas(date_as_object=False)
+
+    def iter_days(self, ticker, start=None, end=None, columns=None):
+        # the replay stream: (date, chain) in date order, one day in memory at a time
+        for date in self.dates(ticker, start, end):
+            yield date, self.read_day(ticker, date, columns)
+
+    def read(self, tickers=None, start=None, end=None, columns=None):
+        # whole-store query (all days at once) for research, not for replays
+        if not self.tickers():
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset(self.root, format="parquet", partitioning=PARTITIONING)
+        expr = None
+        for cond in (
+            ds.field("date") >= _day(start) if start is not None else None,
+            ds.field("date") <= _day(end) if end is not None else None,
+            ds.field("ticker").isin(list(tickers)) if tickers is not None else None,
+        ):
+            if cond is not None:
+                expr = cond if expr is None else expr & cond
+        cols = None if columns is None else list(dict.fromkeys(["ticker", "date", *columns]))
+        return dataset.to_table(columns=cols, filter=expr).to_pandas()
+
+
+def snapshot(tickers, store, source=None, date=None, min_dte=None, max_dte=None, max_workers=8, errors=None):
+    # fetch every listed expiry (within the DTE filter) and write today's snapshots
+    from data_fetch import fetch_option_chains
+    errors = {} if errors is None else errors
+    chains = fetch_option_chains(tickers, min_dte, max_dte, source=source, max_workers=max_workers,
+                                 errors=errors, with_spot=True)
+    if len(chains):
+        store.write_chains(chains, date or pd.Timestamp.today())
+    return chains
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Daily option-chain snapshot store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snap = sub.add_parser("snapshot", help="fetch today's chains and store them")
+    snap.add_argument("--tickers", nargs="+", default=["AAPL"])
+    snap.add_argument("--min-dte", type=int, default=None)
+    snap.add_argument("--max-dte", type=int, default=120)
+    snap.add_argument("--workers", type=int, default=8)
+    snap.add_argument("--synthetic", action="store_true", help="use the offline synthetic data source")
+    hist = sub.add_parser("synthetic", help="fill the store with synthetic daily history")
+    hist.add_argument("--tickers", nargs="+", default=["SYN"])
+    hist.add_argument("--days", type=int, default=252)
+    hist.add_argument("--start", default="2022-01-03")
+    info = sub.add_parser("info", help="list stored tickers and date ranges")
+    for p in (snap, hist, info):
+        p.add_argument("--root", default=STORE_DIR)
+    args = parser.parse_args(argv)
+
+    store = ChainStore(args.root)
+    if args.command == "snapshot":
+        source = None
+        if args.synthetic:
+            from synthetic_data import SyntheticChainSource
+            source = SyntheticChainSource()
+        errors = {}
+        chains = snapshot(args.tickers, store, source, min_dte=args.min_dte, max_dte=args.max_dte,
+                          max_workers=args.workers, errors=errors)
+        print(f"stored {len(chains)} contracts for {chains['ticker'].nunique() if len(chains) else 0} tickers"
+              + (f", failed: {', '.join(map(str, errors))}" if errors else ""))
+    elif args.command == "synthetic":
+        from synthetic_data import synthetic_chain_history
+        for ticker in args.tickers:
+            for date, chain in synthetic_chain_history(ticker, args.days, start=args.start):
+                store.write_day(ticker, date, chain)
+            print(f"{ticker}: {args.days} days -> {args.root}")
+    else:
+        for ticker in store.tickers():
+            days = store.dates(ticker)
+            print(f"{ticker}: {len(days)} days, {days[0]:%Y-%m-%d} .. {days[-1]:%Y-%m-%d}" if days else ticker)
+
+
+if __name__ == "__main__":
+    main()
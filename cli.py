@@ -0,0 +1,216 @@
+# cli.py
+# Single entry point: python cli.py <command> [options]. Only the standard library
+# is imported up front; each command imports what it needs when it runs, so
+# `greeks` on one contract never loads pandas, yfinance, sklearn or statsmodels.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def cmd_greeks(argv):
+    parser = argparse.ArgumentParser(prog="cli.py greeks", description="Black-Scholes price and greeks")
+    parser.add_argument("--spot", type=float, required=True)
+    parser.add_argument("--strike", type=float, required=True)
+    expiry = parser.add_mutually_exclusive_group(required=True)
+    expiry.add_argument("--days", type=float, help="calendar days to expiry")
+    expiry.add_argument("--years", type=float)
+    parser.add_argument("--rate", type=float, default=0.04)
+    parser.add_argument("--div", type=float, default=0.0, help="continuous dividend yield")
+    parser.add_argument("--type", choices=["call", "put"], default="call")
+    vol = parser.add_mutually_exclusive_group(required=True)
+    vol.add_argument("--vol", type=float, help="implied volatility, e.g. 0.25")
+    vol.add_argument("--price", type=float, help="option price; the implied vol is solved for")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    from greeks import chain_greeks
+
+    T = args.years if args.years is not None else args.days / 365
+    sigma = args.vol
+    if sigma is None:
+        from implied_vol import implied_volatility
+        sigma = float(implied_volatility(args.price, args.spot, args.strike, T, args.rate, args.type, args.div))
+    g = chain_greeks(args.spot, args.strike, T, args.rate, sigma, args.type, args.div)
+    out = {"iv": sigma, **{k: float(v) for k, v in g.items()}}
+    if args.json:
+        print(json.dumps(out))
+    else:
+        for k, v in out.items():
+            print(f"{k:>6}: {v:.6f}")
+
+
+def cmd_backtest(argv):
+    parser = argparse.ArgumentParser(prog="cli.py backtest", description="SMA crossover backtest")
+    parser.add_argument("--ticker", default="AAPL")
+    parser.add_argument("--start", default="2023-01-01")
+    parser.add_argument("--end", default="2023-12-31")
+    parser.add_argument("--fast", type=int, default=20)
+    parser.add_argument("--slow", type=int, default=50)
+    parser.add_argument("--capital", type=float, default=10000)
+    parser.add_argument("--grid", action="store_true", help="sweep every fast/slow pair and show the best")
+    parser.add_argument("--plot", action="store_true")
+    args = parser.parse_args(argv)
+
+    from backtest import simple_backtest, sweep_sma_grid
+    from data_fetch import fetch_stock_data
+    from signals import compute_signals
+
+    hist = fetch_stock_data(args.ticker, args.start, args.end)
+    if args.grid:
+        grid = sweep_sma_grid(hist["Close"].rename(args.ticker), range(5, 55, 5), range(20, 210, 10))
+        print(grid.sort_values("sharpe", ascending=False).head(10).to_string(index=False))
+        return
+    portfolio = simple_backtest(compute_signals(hist, args.fast, args.slow), args.capital)
+    print(f"{args.ticker} SMA {args.fast}/{args.slow}: {args.capital:,.0f} -> {portfolio.iloc[-1]:,.2f}")
+    if args.plot:
+        import matplotlib.pyplot as plt
+        portfolio.plot(title="Backtest Portfolio Value")
+        plt.show()
+
+
+def _delegate(module):
+    # commands that already have their own argparse main(argv)
+    def run(argv):
+        return __import__(module).main(argv)
+    return run
+
+
+# --- Import budget ---
+_GUARD = """
+import json, os, socket, sys, time
+sys.path.insert(0, {here!r})
+def _blocked(*a, **k):
+    raise RuntimeError("network access during import")
+socket.socket.connect = _blocked
+socket.create_connection = _blocked
+before = set(os.listdir("."))
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+created = sorted(set(os.listdir(".")) - before)
+print(json.dumps([elapsed, created]))
+"""
+
+
+def _modules():
+    skip = {"cli"}
+    return sorted(f[:-3] for f in os.listdir(HERE) if f.endswith(".py") and f[:-3] not in skip)
+
+
+def _import_in_clean_interpreter(module, cwd):
+    # (seconds, files created) for importing module in a fresh interpreter with
+    # network access blocked; raises RuntimeError with the import's last error line
+    proc = subprocess.run([sys.executable, "-c", _GUARD.format(here=HERE, module=module)],
+                          cwd=cwd, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    elapsed, created = json.loads(proc.stdout.strip().splitlines()[-1])
+    return elapsed, created
+
+
+GREEKS_ARGV = ["greeks", "--spot", "100", "--strike", "105", "--days", "30", "--vol", "0.25"]
+GREEKS_BUDGET = 1.0  # seconds for one contract, interpreter start-up included
+
+
+def _time_command(argv, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(HERE, "cli.py"), *argv], check=True,
+                       capture_output=True)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def cmd_import_check(argv):
+    # Every module must import without network access or creating files, and
+    # `greeks` must finish within the budget. Exits non-zero on any violation; the
+    # same checks run under pytest in tests/test_import_budget.py.
+    parser = argparse.ArgumentParser(prog="cli.py import-check")
+    parser.add_argument("--budget", type=float, default=GREEKS_BUDGET, help="seconds allowed for `cli.py greeks`")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for module in _modules():
+            try:
+                elapsed, created = _import_in_clean_interpreter(module, scratch)
+            except RuntimeError as e:
+                failures.append(f"{module}: {e}")
+                print(f"{module:<28} FAILED")
+                continue
+            if created:
+                failures.append(f"{module}: created {created} on import")
+            print(f"{module:<28} {elapsed:6.3f}s{'  created ' + str(created) if created else ''}")
+
+    greeks = _time_command(GREEKS_ARGV)
+    print(f"\n`cli.py greeks` on one contract: {greeks:.3f}s (budget {args.budget:.3f}s)")
+    if greeks > args.budget:
+        failures.append(f"greeks took {greeks:.3f}s > {args.budget:.3f}s")
+    for f in failures:
+        print("FAIL", f)
+    return 1 if failures else 0
+
+
+COMMANDS = {
+    "greeks": (cmd_greeks, "price and greeks for one contract"),
+    "scan": (_delegate("options_volume_tracker"), "options volume anomaly scan"),
+    "pipeline": (_delegate("pipeline"), "company data pipeline (fetch, join, save, regress)"),
+    "backtest": (cmd_backtest, "SMA crossover backtest or parameter grid"),
+    "flow": (_delegate("options_flow_visualizer"), "options flow sentiment card"),
+    "track": (_delegate("flow_tracker"), "poll options flow intraday and keep per-strike deltas"),
+    "spreads": (_delegate("spread_optimizer"), "search multi-leg option structures over a full chain"),
+    "snapshot": (_delegate("chain_store"), "store daily option-chain snapshots"),
+    "optbacktest": (_delegate("options_backtest"), "replay stored chains through a rolling option strategy"),
+    "regress": (_delegate("run_regression"), "factor regressions across tickers"),
+    "features": (_delegate("feature_store"), "point-in-time feature tables (materialize, export)"),
+    "bench": (_delegate("benchmarks"), "time the hot paths on synthetic data"),
+    "import-check": (cmd_import_check, "import every module in a clean interpreter and time `greeks`"),
+}
+
+
+GLOBAL_OPTIONS = {
+    "--metrics": "write a metrics snapshot on exit (.prom/.txt: Prometheus text, else JSON)",
+    "--profile": "sample-profile a pipeline stage into profiles/<stage>.folded (repeatable)",
+}
+
+
+def _global_options(argv):
+    # leading --metrics PATH / --profile STAGE, stripped before dispatch
+    metrics, profile = None, []
+    while len(argv) >= 2 and argv[0] in GLOBAL_OPTIONS:
+        option, value, argv = argv[0], argv[1], argv[2:]
+        if option == "--metrics":
+            metrics = value
+        else:
+            profile.append(value)
+    return metrics, profile, argv
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    metrics, profile, argv = _global_options(argv)
+    if not argv or argv[0] in ("-h", "--help") or argv[0] not in COMMANDS:
+        print("usage: cli.py [--metrics PATH] [--profile STAGE] <command> [options]\n\ncommands:")
+        for name, (_, help_text) in COMMANDS.items():
+            print(f"  {name:<13} {help_text}")
+        print("\noptions:")
+        for name, help_text in GLOBAL_OPTIONS.items():
+            print(f"  {name:<13} {help_text}")
+        return 0 if not argv or argv[0] in ("-h", "--help") else 2
+    if metrics or profile:
+        import instrumentation
+        instrumentation.enable(profile_stages=profile)
+        if metrics:
+            instrumentation.snapshot_at_exit(metrics)
+    return COMMANDS[argv[0]][0](argv[1:]) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
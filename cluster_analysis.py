@@ -1,13 +1,172 @@
 # 7. cluster_analysis.py
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+# Full-batch k-means for small frames plus a streaming path for large feature panels:
+# an online scaler + MiniBatchKMeans updated batch by batch (new days update the
+# model instead of refitting), a bounded reservoir sample for model selection, and
+# k selection run in parallel. Labels are always returned on the input's index.
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
 
+from instrumentation import timed
+
+
+@timed(rows=True)
 def run_kmeans(df, n_clusters=3):
+    # rows with NaNs are not clustered and get a missing label; labels are placed by
+    # position, so a panel index that repeats (one date per ticker) is fine
+    ok = df.notna().all(axis=1).to_numpy()
     scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(df.dropna())
+    X_scaled = scaler.fit_transform(df[ok])
     kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    labels = kmeans.fit_predict(X_scaled)
     df_clustered = df.copy()
-    df_clustered['cluster'] = labels
+    df_clustered['cluster'] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    df_clustered.loc[ok, 'cluster'] = kmeans.fit_predict(X_scaled)
     return df_clustered
+
+
+# --- Streaming ---
+def iter_batches(source, columns=None, batch_size=65536):
+    # DataFrame, iterable of DataFrames, or a Parquet file/dataset directory; yields
+    # DataFrames of at most batch_size rows without materialising the whole panel
+    if isinstance(source, pd.DataFrame):
+        frame = source if columns is None else source[columns]
+        for lo in range(0, len(frame), batch_size):
+            yield frame.iloc[lo:lo + batch_size]
+    elif isinstance(source, (str, os.PathLike)):
+        dataset = ds.dataset(source, format="parquet", partitioning="hive")
+        for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+            yield batch.to_pandas()
+    else:
+        for frame in source:
+            yield from iter_batches(frame, columns, batch_size)
+
+
+class StreamingKMeans:
+    # Online StandardScaler + MiniBatchKMeans. partial_fit can be called on every new
+    # day's rows; the scaler's running moments converge as history grows, so later
+    # batches barely move the scaled space the centres live in.
+    def __init__(self, n_clusters=3, columns=None, batch_size=4096, random_state=42):
+        self.n_clusters = n_clusters
+        self.columns = columns
+        self.batch_size = batch_size
+        self.scaler = StandardScaler()
+        self.model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=random_state,
+                                     n_init=3)
+        self.n_seen = 0
+        self._pending = None
+
+    def _matrix(self, frame):
+        frame = frame if self.columns is None else frame[self.columns]
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        ok = frame.notna().all(axis=1).to_numpy()
+        return ok, frame[ok].to_numpy(float)
+
+    def partial_fit(self, frame):
+        _, X = self._matrix(frame)
+        if len(X) == 0:
+            return self
+        if self._pending is not None:
+            # MiniBatchKMeans needs at least n_clusters rows for its first step
+            X = np.vstack([self._pending, X])
+            self._pending = None
+        if not hasattr(self.model, "cluster_centers_") and len(X) < self.n_clusters:
+            self._pending = X
+            return self
+        self.scaler.partial_fit(X)
+        self.model.partial_fit(self.scaler.transform(X))
+        self.n_seen += len(X)
+        return self
+
+    def fit_stream(self, source, batch_size=None):
+        for batch in iter_batches(source, self.columns, batch_size or self.batch_size):
+            self.partial_fit(batch)
+        return self
+
+    def predict(self, frame):
+        # labels on frame's index, by position; rows with NaNs get <NA>
+        ok, X = self._matrix(frame)
+        labels = pd.Series(pd.NA, index=frame.index, dtype="Int64")
+        if len(X):
+            labels[ok] = self.model.predict(self.scaler.transform(X))
+        return labels
+
+    def predict_stream(self, source, batch_size=None):
+        for batch in iter_batches(source, self.columns, batch_size or self.batch_size):
+            yield self.predict(batch)
+
+    def save(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+
+@timed(rows=True)
+def reservoir_sample(source, columns=None, size=20000, batch_size=65536, seed=0):
+    # Uniform sample of complete rows from a stream of any length in O(size) memory:
+    # every row draws a random priority and the `size` smallest are kept.
+    rng = np.random.default_rng(seed)
+    sample, prio = None, np.empty(0)
+    for batch in iter_batches(source, columns, batch_size):
+        X = batch.dropna().to_numpy(float)
+        if len(X) == 0:
+            continue
+        sample = X if sample is None else np.vstack([sample, X])
+        prio = np.concatenate([prio, rng.random(len(X))])
+        if len(prio) > size:
+            keep = np.argpartition(prio, size)[:size]
+            sample, prio = sample[keep], prio[keep]
+    return np.empty((0, len(columns or []))) if sample is None else sample
+
+
+def _score_k(args):
+    X, k, silhouette_size, seed = args
+    model = MiniBatchKMeans(n_clusters=k, batch_size=4096, random_state=seed, n_init=3).fit(X)
+    sil = silhouette_score(X, model.labels_, sample_size=min(silhouette_size, len(X)), random_state=seed)
+    return {"k": k, "inertia": model.inertia_ / len(X), "silhouette": sil}
+
+
+@timed()
+def select_k(source, k_range=range(2, 11), columns=None, sample_size=20000, silhouette_size=5000,
+             workers=None, seed=0):
+    # One streaming pass builds a scaled reservoir sample; every k is then fitted and
+    # scored on it in a process pool. Returns one row per k with per-row inertia,
+    # sampled silhouette and the inertia elbow.
+    X = reservoir_sample(source, columns, sample_size, seed=seed)
+    ks = [k for k in k_range if 1 < k < len(X)]
+    if ks:
+        X = StandardScaler().fit_transform(X)
+    tasks = [(X, k, silhouette_size, seed) for k in ks]
+    if not tasks:
+        rows = []
+    elif workers == 1:
+        rows = list(map(_score_k, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers or max(1, min(len(tasks), os.cpu_count() or 1))) as pool:
+            rows = list(pool.map(_score_k, tasks))
+    scores = pd.DataFrame(rows, columns=["k", "inertia", "silhouette"])
+    scores["elbow"] = False
+    if len(scores) >= 3:
+        # elbow: point furthest below the chord joining the first and last inertia
+        k = scores["k"].to_numpy(float)
+        y = scores["inertia"].to_numpy(float)
+        chord = y[0] + (y[-1] - y[0]) * (k - k[0]) / (k[-1] - k[0])
+        scores.loc[int(np.argmax(chord - y)), "elbow"] = True
+    return scores
+
+
+def best_k(scores):
+    return int(scores.loc[scores["silhouette"].idxmax(), "k"])
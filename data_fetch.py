@@ -1,18 +1,145 @@
 # 1. data_fetch.py
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import yfinance as yf
 import pandas as pd
 
-def fetch_stock_data(ticker, start_date, end_date):
-    stock = yf.Ticker(ticker)
-    hist = stock.history(start=start_date, end=end_date)
-    return hist
+from instrumentation import count, timed
+from market_cache import default_cache
+from net_utils import TokenBucket, retry_call, yahoo_session
+
+CHAIN_COLUMNS = ["ticker", "expiry", "dte", "type", "strike"]
 
-def fetch_option_chain(ticker):
+
+@timed(rows=True)
+def fetch_stock_data(ticker, start_date, end_date, cache=None):
     stock = yf.Ticker(ticker)
-    expirations = stock.options
+    cache = default_cache() if cache is None else cache
+    if not cache:
+        return stock.history(start=start_date, end=end_date)
+    return cache.history(ticker, start_date, end_date,
+                         lambda start, end: stock.history(start=start, end=end))
+
+@timed()
+def fetch_option_chain(ticker, min_dte=None, max_dte=None, source=None):
+    # legacy {expiry: {"calls", "puts"}} shape over fetch_option_chains; every expiry
+    # in the DTE window, and the first failure is raised
+    errors = {}
+    frame = fetch_option_chains(ticker, min_dte, max_dte, source=source, errors=errors)
+    if errors:
+        raise next(iter(errors.values()))
     chains = {}
-    for expiry in expirations[:2]:  # limit for speed
-        calls = stock.option_chain(expiry).calls
-        puts = stock.option_chain(expiry).puts
-        chains[expiry] = {"calls": calls, "puts": puts}
+    for expiry, chain in frame.groupby("expiry", sort=True):
+        side = chain.pop("type")
+        chain = chain.drop(columns=["ticker", "expiry", "dte"])
+        chains[expiry.strftime("%Y-%m-%d")] = {"calls": chain[side == "call"].reset_index(drop=True),
+                                              "puts": chain[side == "put"].reset_index(drop=True)}
     return chains
+
+
+# --- Network layer (swap in a local stand-in for tests) ---
+class YahooChainSource:
+    def __init__(self, session=None, rate=5, retries=3, backoff=0.5, cache=None):
+        # cache=False disables the on-disk market data cache
+        self.cache = default_cache() if cache is None else cache
+        self.session = session or yahoo_session()
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self._tickers = {}
+        self._lock = threading.Lock()
+
+    def _ticker(self, symbol):
+        with self._lock:
+            if symbol not in self._tickers:
+                self._tickers[symbol] = yf.Ticker(symbol, session=self.session)
+            return self._tickers[symbol]
+
+    def _call(self, fn):
+        def attempt():
+            self.bucket.acquire()
+            count("http_requests_total", service="yahoo")
+            return fn()
+        return retry_call(attempt, retries=self.retries, backoff=self.backoff)
+
+    def expirations(self, symbol):
+        fetch = lambda: list(self._call(lambda: self._ticker(symbol).options))
+        if not self.cache:
+            return fetch()
+        return self.cache.get_or_fetch(symbol, "expirations", None, fetch)
+
+    def chain(self, symbol, expiry):
+        def fetch():
+            chain = self._call(lambda: self._ticker(symbol).option_chain(expiry))
+            return pd.concat([chain.calls.assign(_side="call"), chain.puts.assign(_side="put")],
+                             ignore_index=True)
+        both = self.cache.get_or_fetch(symbol, "chain", {"expiry": expiry}, fetch) if self.cache else fetch()
+        side = both.pop("_side")
+        return both[side == "call"].reset_index(drop=True), both[side == "put"].reset_index(drop=True)
+
+    def spot(self, symbol):
+        return float(self._call(lambda: self._ticker(symbol).fast_info["last_price"]))
+
+
+def _select_expiries(expirations, min_dte, max_dte, today):
+    if min_dte is None and max_dte is None:
+        return list(expirations)
+    dte = (pd.to_datetime(pd.Series(expirations)) - today).dt.days
+    keep = pd.Series(True, index=dte.index)
+    if min_dte is not None:
+        keep &= dte >= min_dte
+    if max_dte is not None:
+        keep &= dte <= max_dte
+    return [e for e, k in zip(expirations, keep) if k]
+
+
+def normalize_chain(ticker, expiry, calls, puts, today=None):
+    today = pd.Timestamp.today().normalize() if today is None else today
+    frame = pd.concat([calls.assign(type="call"), puts.assign(type="put")], ignore_index=True)
+    frame["ticker"] = ticker
+    frame["expiry"] = pd.Timestamp(expiry)
+    frame["dte"] = (frame["expiry"] - today).dt.days
+    return frame[CHAIN_COLUMNS + [c for c in frame.columns if c not in CHAIN_COLUMNS]]
+
+
+@timed(rows=True)
+def fetch_option_chains(tickers, min_dte=None, max_dte=None, source=None, max_workers=8, errors=None,
+                        expiry_index=None, with_spot=False):
+    # One request per (ticker, expiry) through a bounded pool; returns one long-format
+    # frame. expiry_index picks a single expiry (after the DTE filter) per ticker and
+    # with_spot adds the underlying price. Failures are collected in `errors` (dict)
+    # rather than aborting the run.
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    source = source or YahooChainSource()
+    errors = {} if errors is None else errors
+    today = pd.Timestamp.today().normalize()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        exp_futures = {t: pool.submit(source.expirations, t) for t in tickers}
+        spot_futures = {t: pool.submit(source.spot, t) for t in tickers} if with_spot else {}
+        tasks = []
+        for t, fut in exp_futures.items():
+            try:
+                expiries = _select_expiries(fut.result(), min_dte, max_dte, today)
+                if expiry_index is not None:
+                    expiries = expiries[expiry_index:][:1]
+                for expiry in expiries:
+                    tasks.append((t, expiry, pool.submit(source.chain, t, expiry)))
+            except Exception as e:
+                errors[t] = e
+        frames = []
+        for t, expiry, fut in tasks:
+            try:
+                calls, puts = fut.result()
+                frame = normalize_chain(t, expiry, calls, puts, today)
+                if with_spot:
+                    frame.insert(len(CHAIN_COLUMNS), "spot", spot_futures[t].result())
+                frames.append(frame)
+            except Exception as e:
+                errors[(t, expiry)] = e
+
+    if not frames:
+        return pd.DataFrame(columns=CHAIN_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
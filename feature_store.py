@@ -0,0 +1,244 @@
+# feature_store.py
+# Point-in-time feature tables per ticker. Sources (macro, insider, options, ...)
+# arrive at their own frequencies and are appended as raw observations. A ticker's
+# feature table is the as-of join of every source (utils.merge_external_data: a row
+# only sees observations dated on or before it) onto the dates of its spine sources.
+# New observations re-materialize only the rows from their earliest date on, as a new
+# part, so regression and clustering read ready-made matrices instead of re-joining.
+#   <root>/sources/ticker=AAPL/source=options/part-00000.parquet   raw observations
+#   <root>/features/ticker=AAPL/part-00000.parquet                 materialized rows
+#   <root>/_state/AAPL.json                                        source config, watermarks
+#   python feature_store.py matrix --root data/features --columns stock_return insider_sell_7d
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+from utils import _parts, _write_part, merge_external_data
+
+STORE_DIR = "data/features"
+MAX_PARTS = 32  # parts per feature table / source before they are compacted into one
+VERSION = "_version"
+
+
+def _dated(frame):
+    # date-indexed copy, one row per date (the last one wins)
+    if "date" in frame.columns:
+        frame = frame.set_index("date")
+    frame = frame.set_axis(pd.DatetimeIndex(pd.to_datetime(frame.index), name="date"))
+    return frame[~frame.index.duplicated(keep="last")].sort_index(kind="stable")
+
+
+def _read_parts(parts, columns=None):
+    frames = [pq.read_table(p, columns=columns).to_pandas() for p in parts]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+
+class FeatureStore:
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _source_dir(self, ticker, source):
+        return os.path.join(self.root, "sources", f"ticker={ticker}", f"source={source}")
+
+    def _feature_dir(self, ticker):
+        return os.path.join(self.root, "features", f"ticker={ticker}")
+
+    def _state_path(self, ticker):
+        return os.path.join(self.root, "_state", f"{ticker}.json")
+
+    def _state(self, ticker):
+        try:
+            with open(self._state_path(ticker)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"sources": {}, "columns": None, "version": 0, "rebuild": False}
+
+    def _save_state(self, ticker, state):
+        path = self._state_path(ticker)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def tickers(self):
+        folder = os.path.join(self.root, "_state")
+        return sorted(f[:-5] for f in os.listdir(folder) if f.endswith(".json")) if os.path.isdir(folder) else []
+
+    def sources(self, ticker):
+        return self._state(ticker)["sources"]
+
+    def read_source(self, ticker, source):
+        frame = _read_parts(_parts(self._source_dir(ticker, source)))
+        if frame.empty:
+            return pd.DataFrame(index=pd.DatetimeIndex([], name="date"))
+        return _dated(frame)
+
+    @timed(rows=True)
+    def write(self, ticker, source, frame, spine=False, tolerance=None, fill=None):
+        # Appends the rows of `frame` (date index or column) that are new or changed
+        # and returns them. spine sources set the feature table's dates; the others
+        # are joined as of each date, no older than `tolerance`, with `fill` for dates
+        # they do not cover.
+        state = self._state(ticker)
+        config = {"spine": bool(spine), "tolerance": tolerance, "fill": fill}
+        known = state["sources"].get(source)
+        if known is not None and any(known.get(k) != v for k, v in config.items()):
+            state["rebuild"] = True
+        state["sources"][source] = {**config, "materialized": (known or {}).get("materialized", 0)}
+
+        frame = _dated(frame)
+        old = self.read_source(ticker, source)
+        fresh = frame
+        if len(old) and set(frame.columns) <= set(old.columns):
+            prev = old.reindex(frame.index)[frame.columns]
+            same = ((prev == frame) | (prev.isna() & frame.isna())).all(axis=1)
+            fresh = frame[~(frame.index.isin(old.index) & same.to_numpy())]
+        if len(fresh):
+            _write_part(self._source_dir(ticker, source), fresh)
+        self._save_state(ticker, state)
+        return fresh
+
+    @timed(rows=True)
+    def materialize(self, ticker, full=False):
+        # Brings the ticker's feature table up to date with its sources and returns
+        # the rows (re)written. Only dates from the earliest new observation on are
+        # rebuilt unless the column set or a source's config changed.
+        state = self._state(ticker)
+        sources = state["sources"]
+        frames, cutoff, pending = {}, None, False
+        for name, config in sources.items():
+            parts = _parts(self._source_dir(ticker, name))
+            new = parts[config.get("materialized", 0):]
+            if new:
+                pending = True
+                earliest = _dated(_read_parts(new, ["date"])).index.min()
+                cutoff = earliest if cutoff is None else min(cutoff, earliest)
+            frames[name] = self.read_source(ticker, name)
+            config["materialized"] = len(parts)
+        columns = [c for f in frames.values() for c in f.columns]
+        folder = self._feature_dir(ticker)
+        if full or state["rebuild"] or state["columns"] != columns or not _parts(folder):
+            cutoff = None
+        elif not pending:
+            return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="date"))
+
+        spine = [n for n, c in sources.items() if c["spine"]] or list(sources)
+        dates = pd.DatetimeIndex([], name="date")
+        for name in spine:
+            dates = dates.union(frames[name].index)
+        if cutoff is not None:
+            dates = dates[dates >= cutoff]
+        table = pd.DataFrame(index=pd.DatetimeIndex(dates, name="date"))
+        for name, config in sources.items():
+            table = merge_external_data(table, frames[name], tolerance=config["tolerance"])
+            if config["fill"] is not None:
+                table[frames[name].columns] = table[frames[name].columns].fillna(config["fill"])
+        # numbers as float64 so parts and tickers share one schema
+        numeric = table.select_dtypes(include=[np.number, "bool"]).columns
+        table = table.astype({c: "float64" for c in numeric})
+
+        if cutoff is None:
+            for old in _parts(folder):
+                os.remove(old)
+        state["version"] += 1
+        if len(table):
+            _write_part(folder, table.assign(**{VERSION: state["version"]}))
+        if len(_parts(folder)) > MAX_PARTS:
+            self._compact(ticker)
+        for name, config in sources.items():
+            # daily appends would otherwise leave one tiny part per day per source
+            source_dir = self._source_dir(ticker, name)
+            if config["materialized"] > MAX_PARTS:
+                for old in _parts(source_dir):
+                    os.remove(old)
+                _write_part(source_dir, frames[name])
+                config["materialized"] = 1
+        state.update(columns=columns, rebuild=False)
+        self._save_state(ticker, state)
+        return table
+
+    def _compact(self, ticker):
+        folder = self._feature_dir(ticker)
+        merged = self._load_parts(folder)
+        for old in _parts(folder):
+            os.remove(old)
+        _write_part(folder, merged)
+
+    def _load_parts(self, folder, columns=None, start=None, end=None):
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("date", "<=", pd.Timestamp(end)))
+        cols = None if columns is None else ["date", *[c for c in columns if c not in ("date", VERSION)], VERSION]
+        frames = [pq.read_table(p, columns=cols, filters=filters or None).to_pandas() for p in _parts(folder)]
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=cols or ["date", VERSION])
+        # rows from later materializations replace earlier ones
+        frame = frame.sort_values(["date", VERSION], kind="stable").drop_duplicates("date", keep="last")
+        return frame.reset_index(drop=True)
+
+    @timed(rows=True)
+    def load(self, ticker, columns=None, start=None, end=None):
+        # one ticker's materialized features, date-indexed (the load_company_data shape)
+        if columns is not None:
+            available = self._state(ticker)["columns"] or []
+            missing = [c for c in columns if c not in available]
+            columns = [c for c in columns if c in available]
+        frame = self._load_parts(self._feature_dir(ticker), columns, start, end)
+        frame = frame.drop(columns=VERSION).set_index("date")
+        frame.index = pd.DatetimeIndex(frame.index, name="date")
+        if columns is not None:
+            frame = frame.reindex(columns=columns + missing)
+        return frame
+
+    @timed(rows=True)
+    def matrix(self, tickers=None, columns=None, start=None, end=None):
+        # feature matrix for a universe, indexed by (ticker, date); columns a ticker
+        # does not have come back as NaN
+        frames = {t: self.load(t, columns, start, end) for t in (self.tickers() if tickers is None else tickers)}
+        frames = {t: f for t, f in frames.items() if len(f)}
+        if not frames:
+            index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names=["ticker", "date"])
+            return pd.DataFrame(columns=columns, index=index)
+        return pd.concat(frames, names=["ticker", "date"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Point-in-time feature store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    info = sub.add_parser("info", help="list tickers, sources and materialized columns")
+    build = sub.add_parser("materialize", help="bring feature tables up to date with their sources")
+    build.add_argument("--full", action="store_true", help="rebuild instead of appending")
+    export = sub.add_parser("matrix", help="write a feature matrix for a universe and date range")
+    export.add_argument("--columns", nargs="*", default=None)
+    export.add_argument("--start", default=None)
+    export.add_argument("--end", default=None)
+    export.add_argument("--output", default="feature_matrix.parquet")
+    for p in (info, build, export):
+        p.add_argument("--root", default=STORE_DIR)
+    for p in (build, export):
+        p.add_argument("--tickers", nargs="*", default=None, help="default: every ticker in the store")
+    args = parser.parse_args(argv)
+
+    store = FeatureStore(args.root)
+    if args.command == "info":
+        for ticker in store.tickers():
+            state = store._state(ticker)
+            print(f"{ticker}: sources {', '.join(state['sources'])}; columns {', '.join(state['columns'] or [])}")
+    elif args.command == "materialize":
+        for ticker in args.tickers or store.tickers():
+            print(f"{ticker}: {len(store.materialize(ticker, full=args.full))} rows written")
+    else:
+        frame = store.matrix(args.tickers, args.columns, args.start, args.end)
+        frame.reset_index().to_parquet(args.output, index=False)
+        print(f"{len(frame)} rows x {frame.shape[1]} columns -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
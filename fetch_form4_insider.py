@@ -1,19 +1,340 @@
-import requests
-from bs4 import BeautifulSoup
+# fetch_form4_insider.py
+# Incremental SEC Form 4 ingester. Filing lists come from the EDGAR submissions JSON
+# (recent page plus every history page), each new filing's ownership XML is fetched
+# through one pooled, rate-limited session and parsed into transactions, and the
+# results are persisted per CIK keyed by accession number so later runs only
+# download filings they have not seen.
+import glob
+import json
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import instrument_session, timed
+from net_utils import RETRYABLE, TokenBucket, check_response, make_session, retry_call
+
+# Point both at a local fixture server for tests.
+SEC_DATA_URL = os.getenv("SEC_DATA_URL", "https://data.sec.gov")
+SEC_ARCHIVES_URL = os.getenv("SEC_ARCHIVES_URL", "https://www.sec.gov")
+# SEC asks for a descriptive agent with contact details and allows 10 requests/second
+SEC_USER_AGENT = os.getenv("SEC_USER_AGENT", "options-risk-optimization research admin@example.com")
+SEC_RATE = 10
+FORM4_DIR = os.getenv("FORM4_DIR", "data/form4")
+FORMS = ("4", "4/A")
+
+FILING_COLUMNS = ["accession", "cik", "form", "filing_date", "document", "status"]
+TRANSACTION_COLUMNS = [
+    "accession", "ticker", "issuer_cik", "owner", "owner_cik", "is_director", "is_officer",
+    "officer_title", "derivative", "security", "date", "code", "acquired_disposed",
+    "shares", "price", "value", "shares_after", "direct",
+]
+FLOW_COLUMNS = ["ticker", "date", "buy_shares", "sell_shares", "net_shares",
+                "buy_value", "sell_value", "net_value", "buys", "sells"]
+
+
+class SecClient:
+    def __init__(self, session=None, rate=SEC_RATE, retries=3, backoff=0.5, data_url=SEC_DATA_URL,
+                 archives_url=SEC_ARCHIVES_URL, user_agent=SEC_USER_AGENT, pool_size=16):
+        self.session = instrument_session(session or make_session(pool_size, user_agent), "sec")
+        # capacity 1: a smooth 10/s, never a burst of 10 on top of the steady rate
+        self.bucket = TokenBucket(rate, capacity=1)
+        self.retries = retries
+        self.backoff = backoff
+        self.data_url = data_url.rstrip("/")
+        self.archives_url = archives_url.rstrip("/")
+        self.requests = 0
+
+    def get(self, url):
+        def attempt():
+            self.bucket.acquire()
+            self.requests += 1
+            return check_response(self.session.get(url, timeout=30)).content
+        return retry_call(attempt, retries=self.retries, backoff=self.backoff, retry_on=RETRYABLE)
+
+    def submissions(self, cik, page=None):
+        name = page or f"CIK{int(cik):010d}.json"
+        return json.loads(self.get(f"{self.data_url}/submissions/{name}"))
+
+    def document(self, cik, accession, document):
+        # primaryDocument points at the XSL-rendered HTML (xslF345X05/x.xml); the raw
+        # XML sits next to it without the stylesheet directory
+        raw = document.rsplit("/", 1)[-1]
+        return self.get(f"{self.archives_url}/Archives/edgar/data/{int(cik)}/{accession.replace('-', '')}/{raw}")
+
+    def company_tickers(self):
+        return json.loads(self.get(f"{self.archives_url}/files/company_tickers.json"))
+
+
+# --- Parsing ---
+def _text(node, path):
+    found = node.find(path)
+    if found is None:
+        return None
+    value = found.find("value")
+    text = (value if value is not None else found).text
+    return text.strip() if text and text.strip() else None
+
+
+def _num(node, path):
+    text = _text(node, path)
+    try:
+        return float(text.replace(",", "")) if text is not None else None
+    except ValueError:
+        return None
+
+
+def _flag(node, path):
+    return (_text(node, path) or "").lower() in ("1", "true")
+
+
+@timed()
+def parse_form4(xml, accession=None):
+    # one row per reported transaction (non-derivative and derivative tables)
+    root = ET.fromstring(xml)
+    issuer = {
+        "ticker": (_text(root, "issuer/issuerTradingSymbol") or "").upper() or None,
+        "issuer_cik": _text(root, "issuer/issuerCik"),
+    }
+    owners = root.findall("reportingOwner")
+    first = owners[0] if owners else root
+    owner = {
+        "owner": "; ".join(filter(None, (_text(o, "reportingOwnerId/rptOwnerName") for o in owners))) or None,
+        "owner_cik": _text(first, "reportingOwnerId/rptOwnerCik"),
+        "is_director": any(_flag(o, "reportingOwnerRelationship/isDirector") for o in owners),
+        "is_officer": any(_flag(o, "reportingOwnerRelationship/isOfficer") for o in owners),
+        "officer_title": _text(first, "reportingOwnerRelationship/officerTitle"),
+    }
+    rows = []
+    for derivative, path in ((False, "nonDerivativeTable/nonDerivativeTransaction"),
+                             (True, "derivativeTable/derivativeTransaction")):
+        for tx in root.findall(path):
+            shares = _num(tx, "transactionAmounts/transactionShares")
+            price = _num(tx, "transactionAmounts/transactionPricePerShare")
+            rows.append({
+                "accession": accession, **issuer, **owner,
+                "derivative": derivative,
+                "security": _text(tx, "securityTitle"),
+                "date": _text(tx, "transactionDate"),
+                "code": _text(tx, "transactionCoding/transactionCode"),
+                "acquired_disposed": _text(tx, "transactionAmounts/transactionAcquiredDisposedCode"),
+                "shares": shares,
+                "price": price,
+                "value": shares * price if shares is not None and price is not None else None,
+                "shares_after": _num(tx, "postTransactionAmounts/sharesOwnedFollowingTransaction"),
+                "direct": _text(tx, "ownershipNature/directOrIndirectOwnership") != "I",
+            })
+    return rows
+
+
+def _filings_frame(block, cik):
+    # submissions JSON is columnar: {"accessionNumber": [...], "form": [...], ...}
+    frame = pd.DataFrame({
+        "accession": block.get("accessionNumber", []),
+        "form": block.get("form", []),
+        "filing_date": block.get("filingDate", []),
+        "document": block.get("primaryDocument", []),
+    })
+    frame.insert(1, "cik", f"{int(cik):010d}")
+    return frame[frame["form"].isin(FORMS)]
+
+
+def lookup_ciks(tickers, client=None):
+    # ticker -> zero-padded CIK from SEC's company_tickers.json; unknown tickers are left out
+    client = client or SecClient()
+    wanted = {t.upper() for t in tickers}
+    return {row["ticker"]: f"{int(row['cik_str']):010d}" for row in client.company_tickers().values()
+            if row["ticker"] in wanted}
+
+
+# --- Persistence ---
+class Form4Store:
+    # <root>/<cik>/filings-NNNNN.parquet        every filing handled, with its status
+    # <root>/<cik>/transactions-NNNNN.parquet   parsed transactions of those filings
+    # <root>/<cik>/_pages.json                  history pages already listed
+    # Each run adds one part of each kind; nothing already written is rewritten.
+    def __init__(self, root=FORM4_DIR):
+        self.root = root
+
+    def _dir(self, cik):
+        return os.path.join(self.root, f"{int(cik):010d}")
+
+    def _parts(self, cik, kind):
+        return sorted(glob.glob(os.path.join(self._dir(cik), f"{kind}-*.parquet")))
+
+    def _read(self, cik, kind, columns):
+        parts = self._parts(cik, kind)
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pq.read_table(p).to_pandas() for p in parts], ignore_index=True)
+
+    def seen(self, cik):
+        seen = set()
+        for part in self._parts(cik, "filings"):
+            seen.update(pq.read_table(part, columns=["accession"]).column(0).to_pylist())
+        return seen
+
+    def filings(self, cik):
+        return self._read(cik, "filings", FILING_COLUMNS)
+
+    def transactions(self, cik):
+        return self._read(cik, "transactions", TRANSACTION_COLUMNS)
+
+    def pages(self, cik):
+        try:
+            with open(os.path.join(self._dir(cik), "_pages.json")) as f:
+                return set(json.load(f))
+        except FileNotFoundError:
+            return set()
+
+    def add(self, cik, filings, transactions, pages=()):
+        path = self._dir(cik)
+        os.makedirs(path, exist_ok=True)
+        n = len(self._parts(cik, "filings"))
+        for kind, frame, columns in (("transactions", transactions, TRANSACTION_COLUMNS),
+                                     ("filings", filings, FILING_COLUMNS)):
+            if len(frame):
+                table = pa.Table.from_pandas(frame.reindex(columns=columns), preserve_index=False)
+                pq.write_table(table, os.path.join(path, f"{kind}-{n:05d}.parquet"))
+        # filings are written last: a crash in between only means those filings are fetched again
+        if pages:
+            tmp = os.path.join(path, "_pages.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump(sorted(self.pages(cik) | set(pages)), f)
+            os.replace(tmp, os.path.join(path, "_pages.json"))
+
+
+# --- Ingestion ---
+def _list_filings(client, store, cik, since):
+    # recent page is always re-listed; history pages are immutable and listed once.
+    # Each filing carries the history page it came from (None for recent), so a page
+    # is only recorded as done once all of its filings are stored. A run with `since`
+    # skips part of a page's filings and never records pages.
+    sub = client.submissions(cik)
+    frames = [_filings_frame(sub.get("filings", {}).get("recent", {}), cik).assign(page=None)]
+    listed = []
+    done = store.pages(cik)
+    for page in sub.get("filings", {}).get("files", []):
+        if page["name"] in done or (since is not None and page.get("filingTo", "9999") < since):
+            continue
+        frames.append(_filings_frame(client.submissions(cik, page["name"]), cik).assign(page=page["name"]))
+        if since is None:
+            listed.append(page["name"])
+    filings = pd.concat(frames, ignore_index=True).drop_duplicates("accession")
+    if since is not None:
+        filings = filings[filings["filing_date"] >= since]
+    seen = store.seen(cik)
+    return filings[~filings["accession"].isin(seen)], listed
+
+
+def _fetch_filing(client, filing):
+    try:
+        xml = client.document(filing.cik, filing.accession, filing.document)
+    except Exception as e:
+        return "error", [], e
+    try:
+        return "ok", parse_form4(xml, filing.accession), None
+    except ET.ParseError as e:
+        # malformed documents are recorded so they are not fetched on every run
+        return "parse_error", [], e
+
+
+@timed()
+def ingest_form4(ciks, store=None, client=None, max_workers=8, since=None, errors=None):
+    # Lists every CIK's Form 4 filings, downloads the ones not yet in `store` and
+    # persists them. Filings whose download failed are not recorded and are retried
+    # on the next run; failures are collected in `errors` (dict keyed by CIK or
+    # accession). Returns the number of new filings stored per CIK.
+    if isinstance(ciks, (str, int)):
+        ciks = [ciks]
+    store = store or Form4Store()
+    client = client or SecClient(pool_size=max_workers)
+    errors = {} if errors is None else errors
+    since = None if since is None else f"{pd.Timestamp(since):%Y-%m-%d}"
+
+    added = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        listings = {cik: pool.submit(_list_filings, client, store, cik, since) for cik in ciks}
+        jobs = {}
+        for cik, fut in listings.items():
+            try:
+                filings, pages = fut.result()
+            except Exception as e:
+                errors[cik] = e
+                continue
+            jobs[cik] = (filings, pages, [pool.submit(_fetch_filing, client, f)
+                                          for f in filings.itertuples(index=False)])
+        for cik, (filings, pages, futures) in jobs.items():
+            status, rows = [], []
+            for filing, fut in zip(filings.itertuples(index=False), futures):
+                state, tx, err = fut.result()
+                status.append(state)
+                rows.extend(tx)
+                if err is not None:
+                    errors[filing.accession] = err
+            filings = filings.assign(status=status)
+            done = filings[filings["status"] != "error"]
+            # a page with a failed download is listed again next run so it is retried
+            failed = set(filings.loc[filings["status"] == "error", "page"].dropna())
+            pages = [p for p in pages if p not in failed]
+            store.add(cik, done, pd.DataFrame(rows, columns=TRANSACTION_COLUMNS), pages)
+            added[cik] = len(done)
+    return added
+
+
+@timed(rows=True)
+def load_transactions(ciks, store=None):
+    store = store or Form4Store()
+    if isinstance(ciks, (str, int)):
+        ciks = [ciks]
+    frames = [store.transactions(cik) for cik in ciks]
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(columns=TRANSACTION_COLUMNS)
+    tx = pd.concat(frames, ignore_index=True).drop_duplicates()
+    tx["date"] = pd.to_datetime(tx["date"].str[:10], errors="coerce")
+    return tx
+
+
+@timed(rows=True)
+def insider_flow(transactions, buy_codes=("P",), sell_codes=("S",), include_derivative=False):
+    # daily per-ticker open-market flow; by default P(urchase) vs S(ale) of the
+    # underlying shares, ignoring grants, exercises and gifts
+    tx = transactions if include_derivative else transactions[~transactions["derivative"].astype(bool)]
+    buy = tx["code"].isin(buy_codes)
+    sell = tx["code"].isin(sell_codes)
+    tx = tx[buy | sell]
+    if tx.empty:
+        return pd.DataFrame(columns=FLOW_COLUMNS)
+    buy, sell = buy[tx.index], sell[tx.index]
+    shares, value = tx["shares"].fillna(0.0), tx["value"].fillna(0.0)
+    flow = pd.DataFrame({
+        "ticker": tx["ticker"], "date": tx["date"],
+        "buy_shares": shares.where(buy, 0.0), "sell_shares": shares.where(sell, 0.0),
+        "buy_value": value.where(buy, 0.0), "sell_value": value.where(sell, 0.0),
+        "buys": buy.astype(int), "sells": sell.astype(int),
+    }).groupby(["ticker", "date"], as_index=False).sum()
+    flow["net_shares"] = flow["buy_shares"] - flow["sell_shares"]
+    flow["net_value"] = flow["buy_value"] - flow["sell_value"]
+    return flow[FLOW_COLUMNS]
+
+
+def insider_sell_7d(cik, store=None, client=None, ticker=None):
+    # date-indexed shares sold over the trailing 7 calendar days, as the pipelines use it
+    store = store or Form4Store()
+    ingest_form4([cik], store=store, client=client)
+    flow = insider_flow(load_transactions([cik], store))
+    if ticker is not None:
+        flow = flow[flow["ticker"] == ticker.upper()]
+    daily = flow.groupby("date")["sell_shares"].sum().sort_index()
+    return daily.rolling("7D").sum().rename("insider_sell_7d").to_frame()
+
 
-def fetch_form4_insider_trades(cik, limit=10):
-    url = f"https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type=4&owner=only&count={limit}&output=atom"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    r = requests.get(url, headers=headers)
-    soup = BeautifulSoup(r.content, "xml")
-    entries = soup.find_all("entry")
-
-    data = []
-    for entry in entries:
-        title = entry.title.text
-        date = entry.updated.text
-        link = entry.link['href']
-        data.append({"title": title, "date": date, "link": link})
-
-    return pd.DataFrame(data)
+def fetch_form4_insider_trades(cik, store=None, client=None, since=None):
+    # ingests new filings for `cik` and returns all of its stored transactions
+    store = store or Form4Store()
+    ingest_form4([cik], store=store, client=client, since=since)
+    return load_transactions([cik], store)
@@ -0,0 +1,252 @@
+# flow_tracker.py
+# Intraday options-flow polling. The previous chain snapshot per (ticker, expiry)
+# is kept as compact numpy arrays; each poll diffs against it to get new volume per
+# strike, open-interest changes and IV shifts, and pushes the per-poll aggregates
+# into a fixed-size ring buffer so rolling call/put ratios and skew are running
+# sums. Memory is bounded by (tickers x strikes) + (tickers x window).
+#   python flow_tracker.py --tickers AAPL MSFT --interval 60
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_fetch import YahooChainSource
+from instrumentation import timed
+from options_flow_visualizer import generate_lovable_payload
+
+WINDOW = 30  # polls in the rolling ratios (30 x 1 min)
+DELTA_COLUMNS = ["ticker", "expiry", "type", "strike", "volume", "new_volume", "oi_change", "iv_shift"]
+# ring buffer columns, one row per poll
+RING = ["call_new", "put_new", "skew"]
+
+
+def _contract_codes(strikes, is_put):
+    # one sortable int64 per contract: strike in 1/1000ths, low bit = put
+    return np.round(np.asarray(strikes, dtype=float) * 1000).astype(np.int64) * 2 + is_put
+
+
+class _FlowState:
+    # last snapshot (sorted by contract code) plus the rolling ring for one (ticker, expiry)
+    __slots__ = ("expiry", "codes", "volume", "oi", "iv", "ring", "pos", "count", "sums", "summary", "polls")
+
+    def __init__(self, expiry, window):
+        self.expiry = expiry
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.volume = self.oi = self.iv = np.zeros(0, dtype=np.float32)
+        self.ring = np.zeros((window, len(RING)))
+        self.pos = 0
+        self.count = 0
+        self.sums = np.zeros(len(RING))
+        self.summary = None
+        self.polls = 0
+
+    def push(self, row):
+        # O(1): the slot being overwritten leaves the running sums
+        window = len(self.ring)
+        if self.count == window:
+            self.sums -= self.ring[self.pos]
+        self.ring[self.pos] = row
+        self.sums += row
+        self.pos = (self.pos + 1) % window
+        self.count = min(self.count + 1, window)
+
+
+def _column(frame, name, dtype=np.float32):
+    if name not in frame:
+        return np.zeros(len(frame), dtype=dtype)
+    return frame[name].to_numpy(dtype=dtype, na_value=0)
+
+
+class FlowTracker:
+    # poll() fetches the nearest expiry's chain for every ticker through one bounded
+    # pool and returns the per-strike deltas; summary()/payload() read the kept state
+    # without touching the network. At 100 tickers the default 5 req/s Yahoo limit
+    # needs ~20 s of each 60 s cadence.
+    def __init__(self, source=None, window=WINDOW, max_workers=8, expiry_index=0):
+        # chains must not come from the 5-minute market cache or polls would see stale volume
+        self.source = source or YahooChainSource(cache=False)
+        self.window = window
+        self.expiry_index = expiry_index
+        self.states = {}
+        self._expiries = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        self._pool.shutdown()
+
+    def _expiry(self, ticker, today):
+        # expirations are listed once per ticker per day, not on every poll
+        cached = self._expiries.get(ticker)
+        if cached is None or cached[0] != today:
+            expirations = [e for e in self.source.expirations(ticker) if pd.Timestamp(e) >= today]
+            cached = (today, expirations[self.expiry_index])
+            self._expiries[ticker] = cached
+        return cached[1]
+
+    def _poll_one(self, ticker, today):
+        expiry = self._expiry(ticker, today)
+        calls, puts = self.source.chain(ticker, expiry)
+        return expiry, calls, puts
+
+    def _update(self, ticker, expiry, calls, puts, now):
+        with self._lock:
+            state = self.states.get(ticker)
+            if state is None or state.expiry != expiry:
+                # first poll, or the nearest expiry rolled over: start a fresh snapshot
+                state = self.states[ticker] = _FlowState(expiry, self.window)
+
+        is_put = np.r_[np.zeros(len(calls), dtype=np.int64), np.ones(len(puts), dtype=np.int64)]
+        strikes = np.r_[_column(calls, "strike", float), _column(puts, "strike", float)]
+        codes = _contract_codes(strikes, is_put)
+        order = np.argsort(codes, kind="stable")
+        codes, strikes, is_put = codes[order], strikes[order], is_put[order]
+        volume = np.r_[_column(calls, "volume"), _column(puts, "volume")][order]
+        oi = np.r_[_column(calls, "openInterest"), _column(puts, "openInterest")][order]
+        iv = np.r_[_column(calls, "impliedVolatility"), _column(puts, "impliedVolatility")][order]
+
+        # match against the previous snapshot; newly listed strikes count from zero
+        if len(state.codes):
+            at = np.minimum(np.searchsorted(state.codes, codes), len(state.codes) - 1)
+            seen = state.codes[at] == codes
+            prev_volume, prev_oi, prev_iv = state.volume[at], state.oi[at], state.iv[at]
+        else:
+            seen = np.zeros(len(codes), dtype=bool)
+            prev_volume = prev_oi = prev_iv = 0
+        first = state.polls == 0
+        new_volume = np.where(seen, volume - prev_volume, 0 if first else volume)
+        # cumulative day volume only falls when a new session starts
+        new_volume = np.where(new_volume < 0, volume, new_volume)
+        oi_change = np.where(seen, oi - prev_oi, 0)
+        iv_shift = np.where(seen, iv - prev_iv, 0)
+
+        state.codes, state.volume, state.oi, state.iv = codes, volume, oi, iv
+        state.polls += 1
+
+        calls_mask = is_put == 0
+        call_vol, put_vol = float(volume[calls_mask].sum()), float(volume[~calls_mask].sum())
+        iv_calls = float(iv[calls_mask].mean()) if calls_mask.any() else float("nan")
+        iv_puts = float(iv[~calls_mask].mean()) if (~calls_mask).any() else float("nan")
+        call_new, put_new = float(new_volume[calls_mask].sum()), float(new_volume[~calls_mask].sum())
+        if not first:
+            state.push([call_new, put_new, iv_calls - iv_puts])
+        sum_call, sum_put, sum_skew = state.sums
+        vol_ratio = call_vol / put_vol if put_vol > 0 else None
+        state.summary = {
+            # same fields as options_flow_visualizer.fetch_options_flow
+            "call_vol": int(call_vol),
+            "put_vol": int(put_vol),
+            "vol_ratio": round(vol_ratio, 2) if vol_ratio else "N/A",
+            "iv_calls": round(iv_calls, 4),
+            "iv_puts": round(iv_puts, 4),
+            "iv_skew": round(iv_calls - iv_puts, 4),
+            "expiry": expiry,
+            # since the last poll and over the rolling window
+            "new_call_vol": int(call_new),
+            "new_put_vol": int(put_new),
+            "rolling_ratio": round(float(sum_call / sum_put), 2) if sum_put > 0 else "N/A",
+            "rolling_skew": round(float(sum_skew / state.count), 4) if state.count else "N/A",
+            "polls": state.polls,
+            "asof": now,
+        }
+
+        # plain arrays; poll() builds one frame for all tickers
+        changed = (new_volume != 0) | (oi_change != 0) | (iv_shift != 0)
+        n = int(changed.sum())
+        return {
+            "ticker": np.full(n, ticker, dtype=object),
+            "expiry": np.full(n, expiry, dtype=object),
+            "type": np.where(is_put[changed] == 1, "put", "call").astype(object),
+            "strike": strikes[changed],
+            "volume": volume[changed],
+            "new_volume": new_volume[changed],
+            "oi_change": oi_change[changed],
+            "iv_shift": iv_shift[changed],
+        }
+
+    @timed(rows=True)
+    def poll(self, tickers, now=None, errors=None):
+        # one snapshot of every ticker; returns the contracts that changed since the
+        # previous poll. Failures go to `errors` and leave that ticker's state as is.
+        now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+        today = now.normalize()
+        errors = {} if errors is None else errors
+        futures = {t: self._pool.submit(self._poll_one, t, today) for t in tickers}
+        parts = []
+        for t, fut in futures.items():
+            try:
+                parts.append(self._update(t, *fut.result(), now))
+            except Exception as e:
+                errors[t] = e
+        if not parts:
+            return pd.DataFrame(columns=DELTA_COLUMNS)
+        return pd.DataFrame({c: np.concatenate([p[c] for p in parts]) for c in DELTA_COLUMNS})
+
+    def summary(self, ticker):
+        return self.states[ticker].summary
+
+    def summaries(self):
+        return pd.DataFrame([{"ticker": t, **s.summary} for t, s in self.states.items()])
+
+    def payload(self, ticker, analysis_result=None):
+        # dashboard cards straight from the kept state; no fetch, no LLM call
+        return generate_lovable_payload(self.summary(ticker), analysis_result)
+
+    def run(self, tickers, interval=60, polls=None, on_poll=None, errors=None):
+        # fixed cadence on the monotonic clock; a slow poll delays, never doubles, the next
+        n = 0
+        next_at = time.monotonic()
+        while polls is None or n < polls:
+            deltas = self.poll(tickers, errors=errors)
+            n += 1
+            if on_poll:
+                on_poll(self, deltas)
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+            next_at = max(next_at, time.monotonic())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Poll options flow and keep per-strike deltas")
+    parser.add_argument("--tickers", nargs="+", default=["AAPL"])
+    parser.add_argument("--interval", type=float, default=60, help="seconds between polls")
+    parser.add_argument("--polls", type=int, default=None, help="stop after N polls (default: run forever)")
+    parser.add_argument("--window", type=int, default=WINDOW, help="polls in the rolling ratios")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--output", default="flow_payloads.json", help="latest payload per ticker")
+    parser.add_argument("--synthetic", action="store_true", help="use the offline synthetic data source")
+    args = parser.parse_args(argv)
+
+    source = None
+    if args.synthetic:
+        from synthetic_data import SyntheticChainSource
+        source = SyntheticChainSource(intraday=True)
+    tracker = FlowTracker(source, window=args.window, max_workers=args.workers)
+    errors = {}
+
+    def on_poll(tracker, deltas):
+        payloads = {t: tracker.payload(t) for t in args.tickers if t in tracker.states}
+        tmp = args.output + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(payloads, f, indent=2, default=str)
+        os.replace(tmp, args.output)
+        print(f"{pd.Timestamp.now():%H:%M:%S} {len(deltas)} contracts changed, "
+              f"{int(deltas['new_volume'].sum()) if len(deltas) else 0} new contracts traded"
+              + (f", failed: {', '.join(errors)}" if errors else ""))
+        errors.clear()
+
+    try:
+        tracker.run(args.tickers, args.interval, args.polls, on_poll, errors)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracker.close()
+
+
+if __name__ == "__main__":
+    main()
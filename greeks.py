@@ -1,17 +1,103 @@
 # 2. greeks.py
 import numpy as np
-from scipy.stats import norm
+from scipy.special import ndtr
+
+from instrumentation import timed
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+CALL_FLAGS = ['call', 'c', 'C', 'Call', 'CALL']
+GREEK_NAMES = ["price", "delta", "gamma", "vega", "theta", "rho", "vanna", "volga"]
+
 
 def black_scholes_greeks(S, K, T, r, sigma, option_type='call'):
-    d1 = (np.log(S / K) + (r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
-    d2 = d1 - sigma * np.sqrt(T)
-
-    if option_type == 'call':
-        delta = norm.cdf(d1)
-        theta = -(S * norm.pdf(d1) * sigma / (2 * np.sqrt(T))) - r * K * np.exp(-r * T) * norm.cdf(d2)
-    else:
-        delta = -norm.cdf(-d1)
-        theta = -(S * norm.pdf(d1) * sigma / (2 * np.sqrt(T))) + r * K * np.exp(-r * T) * norm.cdf(-d2)
-
-    vega = S * norm.pdf(d1) * np.sqrt(T)
-    return {"delta": delta, "theta": theta, "vega": vega}
+    g = chain_greeks(S, K, T, r, sigma, option_type)
+    return {"delta": float(g["delta"]), "theta": float(g["theta"]), "vega": float(g["vega"])}
+
+
+def _is_call(option_type, shape):
+    # accepts 'call'/'put' (or 'c'/'p'), a sequence of them, or a boolean mask
+    flags = np.asarray(option_type)
+    if flags.dtype == bool:
+        return np.broadcast_to(flags, shape)
+    return np.broadcast_to(np.isin(flags.astype(str), CALL_FLAGS), shape)
+
+
+def _d1_d2(S, K, T, r, q, sigma):
+    # shared terms; vst == 0 (expiry or zero vol) collapses d1/d2 to +-inf
+    sqrt_t = np.sqrt(T)
+    vst = sigma * sqrt_t
+    drift = np.log(S / K) + (r - q) * T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = np.where(vst > 0, (drift + 0.5 * vst * vst) / vst,
+                      np.where(drift > 0, np.inf, np.where(drift < 0, -np.inf, 0.0)))
+    d2 = d1 - vst
+    return sqrt_t, vst, d1, d2
+
+
+def chain_greeks(S, K, T, r, sigma, option_type='call', q=0.0):
+    # Black-Scholes-Merton price plus first and second order greeks for a whole
+    # array of contracts. Theta is per year, vega/volga per 1.00 of vol, rho per 1.00 of rate.
+    S, K, T, r, q, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (S, K, T, r, q, sigma)))
+    T = np.maximum(T, 0.0)
+    sigma = np.maximum(sigma, 0.0)
+    call = _is_call(option_type, S.shape)
+    sign = np.where(call, 1.0, -1.0)
+
+    sqrt_t, vst, d1, d2 = _d1_d2(S, K, T, r, q, sigma)
+    disc_r = np.exp(-r * T)
+    disc_q = np.exp(-q * T)
+    pdf = np.exp(-0.5 * d1 * d1) / SQRT_2PI
+    nd1 = ndtr(sign * d1)
+    nd2 = ndtr(sign * d2)
+    s_fwd = S * disc_q
+    k_disc = K * disc_r
+
+    live = vst > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_vst = np.where(live, 1.0 / vst, 0.0)
+        inv_sigma = np.where(sigma > 0, 1.0 / sigma, 0.0)
+        # d1 * d2 / sigma stays finite as vst -> 0 because pdf underflows first
+        d1d2 = np.where(live, d1 * d2, 0.0)
+        d2_safe = np.where(live, d2, 0.0)
+        theta_decay = np.where(T > 0, -s_fwd * pdf * sigma / (2 * np.where(T > 0, sqrt_t, 1.0)), 0.0)
+
+    vega = s_fwd * pdf * sqrt_t
+    return {
+        "price": sign * (s_fwd * nd1 - k_disc * nd2),
+        "delta": sign * disc_q * nd1,
+        "gamma": disc_q * pdf * inv_vst / S,
+        "vega": vega,
+        "theta": theta_decay - sign * r * k_disc * nd2 + sign * q * s_fwd * nd1,
+        "rho": sign * k_disc * T * nd2,
+        "vanna": -disc_q * pdf * d2_safe * inv_sigma,
+        "volga": vega * d1d2 * inv_sigma,
+    }
+
+
+def bs_price(S, K, T, r, sigma, option_type='call', q=0.0):
+    S, K, T, r, q, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (S, K, T, r, q, sigma)))
+    T = np.maximum(T, 0.0)
+    sigma = np.maximum(sigma, 0.0)
+    sign = np.where(_is_call(option_type, S.shape), 1.0, -1.0)
+    _, _, d1, d2 = _d1_d2(S, K, T, r, q, sigma)
+    return sign * (S * np.exp(-q * T) * ndtr(sign * d1) - K * np.exp(-r * T) * ndtr(sign * d2))
+
+
+def years_to_expiry(expiry, now=None):
+    # pandas is imported here so single-contract pricing doesn't pay for it
+    import pandas as pd
+
+    now = pd.Timestamp.now() if now is None else pd.Timestamp(now)
+    seconds = (pd.to_datetime(expiry) - now) / pd.Timedelta(seconds=1)
+    return np.maximum(np.asarray(seconds, dtype=float), 0.0) / (365 * 24 * 3600)
+
+
+@timed(rows=True)
+def greeks_for_chain(chain, S, r, q=0.0, iv_col='impliedVolatility', now=None):
+    # chain: long-format option chain with 'strike', a 'type' column ('call'/'put')
+    # and either 'T' (years) or 'expiry'. S may be a scalar or a per-row column name.
+    T = chain['T'].to_numpy(float) if 'T' in chain else years_to_expiry(chain['expiry'], now)
+    spot = chain[S].to_numpy(float) if isinstance(S, str) else S
+    g = chain_greeks(spot, chain['strike'].to_numpy(float), T, r,
+                     chain[iv_col].to_numpy(float), chain['type'].to_numpy(), q)
+    return chain.assign(**g)
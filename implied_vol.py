@@ -0,0 +1,135 @@
+# implied_vol.py
+# Vectorized Black-Scholes implied volatility for whole option chains
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from greeks import CALL_FLAGS, years_to_expiry
+from instrumentation import timed
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+VOL_LO, VOL_HI = 1e-4, 5.0
+
+
+def _price_vega_volga(S, K, T, r, q, sigma, sign):
+    sqrt_t = np.sqrt(T)
+    vst = sigma * sqrt_t
+    d1 = (np.log(S / K) + (r - q) * T) / vst + 0.5 * vst
+    d2 = d1 - vst
+    s_fwd = S * np.exp(-q * T)
+    price = sign * (s_fwd * ndtr(sign * d1) - K * np.exp(-r * T) * ndtr(sign * d2))
+    vega = s_fwd * np.exp(-0.5 * d1 * d1) / SQRT_2PI * sqrt_t
+    volga = vega * d1 * d2 / sigma
+    return price, vega, volga
+
+
+def _initial_guess(price, S, K, T, r, q, sign):
+    # Corrado-Miller rational approximation, applied to the call via put-call parity
+    s_fwd = S * np.exp(-q * T)
+    k_disc = K * np.exp(-r * T)
+    call = np.where(sign > 0, price, price + s_fwd - k_disc)
+    half = call - (s_fwd - k_disc) / 2
+    radicand = np.maximum(half * half - (s_fwd - k_disc) ** 2 / np.pi, 0.0)
+    guess = np.sqrt(2 * np.pi / T) / (s_fwd + k_disc) * (half + np.sqrt(radicand))
+    # far from the money the approximation degrades; fall back to the moneyness scale
+    guess = np.where(np.isfinite(guess) & (guess > 0), guess, np.sqrt(2 * np.abs(np.log(s_fwd / k_disc)) / T))
+    return np.clip(guess, 0.01, 3.0)
+
+
+def implied_volatility(price, S, K, T, r, option_type='call', q=0.0, tol=1e-8, max_iter=20,
+                       return_converged=False, min_vega=1e-6):
+    # Safeguarded Halley iterations run in lockstep over every contract, each keeping
+    # its own [lo, hi] bracket; anything still unconverged is finished by bisection.
+    # tol is on sigma: a contract is done once the step, or its price error over vega,
+    # is below it. Prices outside the no-arbitrage bounds come back as NaN; contracts
+    # whose vega at the solution is under min_vega (price per unit of vol) cannot pin
+    # sigma down from a quote and are flagged as not converged.
+    price, S, K, T, r, q = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (price, S, K, T, r, q)))
+    flags = np.asarray(option_type)
+    call = flags if flags.dtype == bool else np.isin(flags.astype(str), CALL_FLAGS)
+    sign = np.where(np.broadcast_to(call, price.shape), 1.0, -1.0)
+
+    s_fwd = S * np.exp(-q * T)
+    k_disc = K * np.exp(-r * T)
+    intrinsic = np.maximum(sign * (s_fwd - k_disc), 0.0)
+    upper = np.where(sign > 0, s_fwd, k_disc)
+    valid = (T > 0) & (S > 0) & (K > 0) & (price > intrinsic) & (price < upper)
+
+    iv = np.full(price.shape, np.nan)
+    converged = np.zeros(price.shape, dtype=bool)
+    idx = np.flatnonzero(valid)
+    if idx.size == 0:
+        return (iv, converged) if return_converged else iv
+
+    p, s, k, t, rr, qq, sg = (a.ravel()[idx] for a in (price, S, K, T, r, q, sign))
+    sigma = _initial_guess(p, s, k, t, rr, qq, sg)
+    lo = np.full(idx.size, VOL_LO)
+    hi = np.full(idx.size, VOL_HI)
+    done = np.zeros(idx.size, dtype=bool)
+
+    for _ in range(max_iter):
+        a = np.flatnonzero(~done)
+        if a.size == 0:
+            break
+        model, vega, volga = _price_vega_volga(s[a], k[a], t[a], rr[a], qq[a], sigma[a], sg[a])
+        diff = model - p[a]
+        hit = np.abs(diff) < tol * vega
+        done[a[hit]] = True
+        # price is increasing in sigma, so the sign of diff tightens the bracket
+        hi[a] = np.where(diff > 0, sigma[a], hi[a])
+        lo[a] = np.where(diff < 0, sigma[a], lo[a])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = diff / vega
+            step = newton / (1 - 0.5 * newton * volga / vega)
+            step = np.where(np.isfinite(step), step, newton)
+        nxt = sigma[a] - step
+        bad = ~np.isfinite(nxt) | (nxt <= lo[a]) | (nxt >= hi[a])
+        nxt = np.where(bad, 0.5 * (lo[a] + hi[a]), nxt)
+        small = np.abs(nxt - sigma[a]) < tol
+        done[a[small]] = True
+        sigma[a] = np.where(hit, sigma[a], nxt)
+
+    # bracketed fallback for stragglers (vega-starved deep ITM/OTM wings)
+    a = np.flatnonzero(~done)
+    if a.size:
+        lo_a, hi_a = lo[a], hi[a]
+        for _ in range(60):
+            mid = 0.5 * (lo_a + hi_a)
+            model, _, _ = _price_vega_volga(s[a], k[a], t[a], rr[a], qq[a], mid, sg[a])
+            above = model > p[a]
+            hi_a = np.where(above, mid, hi_a)
+            lo_a = np.where(above, lo_a, mid)
+            if np.max(hi_a - lo_a) < tol:
+                break
+        sigma[a] = 0.5 * (lo_a + hi_a)
+        done[a] = (hi_a - lo_a) < 1e-6
+
+    _, vega, _ = _price_vega_volga(s, k, t, rr, qq, sigma, sg)
+    iv.ravel()[idx] = sigma
+    converged.ravel()[idx] = done & (vega >= min_vega)
+    return (iv, converged) if return_converged else iv
+
+
+def chain_prices(chain):
+    # mid when there is a two-sided market, otherwise the last trade
+    bid = chain['bid'].to_numpy(float) if 'bid' in chain else np.full(len(chain), np.nan)
+    ask = chain['ask'].to_numpy(float) if 'ask' in chain else np.full(len(chain), np.nan)
+    mid = np.where((bid > 0) & (ask >= bid), 0.5 * (bid + ask), np.nan)
+    return np.where(np.isnan(mid), chain['lastPrice'].to_numpy(float), mid)
+
+
+@timed(rows=True)
+def implied_vol_for_chain(chain, S, r, q=0.0, now=None, out_col='iv'):
+    # chain: long-format chain with 'strike', 'type' and 'T' or 'expiry'; S scalar or column name
+    T = chain['T'].to_numpy(float) if 'T' in chain else years_to_expiry(chain['expiry'], now)
+    spot = chain[S].to_numpy(float) if isinstance(S, str) else S
+    iv = implied_volatility(chain_prices(chain), spot, chain['strike'].to_numpy(float), T, r,
+                            chain['type'].to_numpy(), q)
+    return chain.assign(**{out_col: iv})
+
+
+def solve_option_iv(option, S, T, r, option_type='call', q=0.0):
+    # single yfinance chain row -> recomputed IV, falling back to Yahoo's figure
+    price = chain_prices(pd.DataFrame([option]))[0]
+    iv = float(implied_volatility(price, S, option['strike'], T, r, option_type, q))
+    return iv if np.isfinite(iv) else float(option['impliedVolatility'])
@@ -0,0 +1,246 @@
+# instrumentation.py
+# Process-wide metrics for the fetch and analysis hot paths: per-call latency
+# histograms, counters (HTTP requests/bytes, retries, cache hits, rows, tokens)
+# and an optional sampling profiler for named stages. Disabled by default; every
+# hook then costs one attribute check. Enable with METRICS=1 / enable(), then
+# write_snapshot() as JSON or Prometheus text.
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# latency buckets in seconds (Prometheus `le` bounds)
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "n")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.n += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = os.getenv("METRICS") == "1"
+        self.profile_stages = set(filter(None, os.getenv("PROFILE_STAGES", "").split(",")))
+        self.profile_dir = os.getenv("PROFILE_DIR", "profiles")
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = defaultdict(_Histogram)
+            self.counters = Counter()
+            self.started = time.time()
+
+    # --- recording ---
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.histograms[key].observe(seconds)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    # --- export ---
+    def snapshot(self):
+        with self.lock:
+            hist = [{"name": name, "labels": dict(labels), "count": h.n, "sum": h.total,
+                     "buckets": {("+Inf" if b == float("inf") else str(b)): c
+                                 for b, c in zip(BUCKETS, h.counts)}}
+                    for (name, labels), h in sorted(self.histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": v}
+                        for (name, labels), v in sorted(self.counters.items())]
+        return {"started": self.started, "elapsed": time.time() - self.started,
+                "histograms": hist, "counters": counters}
+
+    def prometheus_text(self):
+        def fmt(labels, extra=None):
+            items = list(labels.items()) + ([extra] if extra else [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+        snap = self.snapshot()
+        lines, typed = [], set()
+        for h in snap["histograms"]:
+            if h["name"] not in typed:
+                lines.append(f"# TYPE {h['name']} histogram")
+                typed.add(h["name"])
+            running = 0
+            for le, c in h["buckets"].items():
+                running += c
+                lines.append(f"{h['name']}_bucket{fmt(h['labels'], ('le', le))} {running}")
+            lines.append(f"{h['name']}_sum{fmt(h['labels'])} {h['sum']:.6f}")
+            lines.append(f"{h['name']}_count{fmt(h['labels'])} {h['count']}")
+        for c in snap["counters"]:
+            if c["name"] not in typed:
+                lines.append(f"# TYPE {c['name']} counter")
+                typed.add(c["name"])
+            lines.append(f"{c['name']}{fmt(c['labels'])} {c['value']}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path):
+        # .prom / .txt -> Prometheus text exposition, anything else -> JSON
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.prometheus_text())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+        return path
+
+    def summary(self, top=15):
+        # slowest call sites by total time, for a quick look at the end of a run
+        rows = sorted(((h.total, h.n, name, dict(labels)) for (name, labels), h in self.histograms.items()),
+                      reverse=True, key=lambda r: r[0])[:top]
+        return "\n".join(f"{total:9.3f}s {n:7d}x  {name} {labels}" for total, n, name, labels in rows)
+
+
+METRICS = Metrics()
+
+
+def enable(profile_stages=(), profile_dir=None):
+    METRICS.enabled = True
+    METRICS.profile_stages |= set(profile_stages)
+    if profile_dir:
+        METRICS.profile_dir = profile_dir
+
+
+def disable():
+    METRICS.enabled = False
+
+
+def count(name, value=1, **labels):
+    METRICS.count(name, value, **labels)
+
+
+def _rows(result):
+    shape = getattr(result, "shape", None)
+    if shape:
+        return shape[0]
+    return len(result) if isinstance(result, list) else None
+
+
+def timed(name=None, rows=False):
+    # Decorator: latency histogram `call_seconds{fn=...}`, errors, and (rows=True)
+    # rows returned. When disabled the wrapper only checks METRICS.enabled.
+    def wrap(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                METRICS.count("call_errors_total", fn=label)
+                raise
+            finally:
+                METRICS.observe("call_seconds", time.perf_counter() - t0, fn=label)
+            if rows:
+                n = _rows(result)
+                if n is not None:
+                    METRICS.count("rows_total", n, fn=label)
+            return result
+        return inner
+    return wrap
+
+
+def record_response(response, service):
+    # request/byte counters for a requests.Response (hooked into pooled sessions)
+    if not METRICS.enabled:
+        return
+    METRICS.count("http_requests_total", service=service, status=response.status_code)
+    METRICS.count("http_bytes_total", len(response.content), service=service)
+
+
+def instrument_session(session, service):
+    # counts every response on a requests.Session; a no-op when disabled
+    hooks = getattr(session, "hooks", None)
+    if hooks is not None and "response" in hooks:
+        hooks["response"].append(lambda r, *a, **k: record_response(r, service))
+    return session
+
+
+# --- Stages and sampling profiler ---
+class _Sampler(threading.Thread):
+    # samples one thread's Python stack every `interval` seconds; folded output
+    # (one `frame;frame;frame count` line per stack) feeds flamegraph tools
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            self.stacks[";".join(f"{os.path.basename(f.filename)}:{f.name}" for f in stack)] += 1
+
+    def folded(self):
+        return "\n".join(f"{stack} {n}" for stack, n in self.stacks.most_common())
+
+
+@contextmanager
+def stage(name, profile=None):
+    # Times a named stage into `stage_seconds{stage=...}`; when the stage is listed
+    # in PROFILE_STAGES (or profile=True) a sampling profile is written to
+    # <profile_dir>/<name>.folded.
+    if not METRICS.enabled:
+        yield
+        return
+    # "AAPL/regress" is profiled by either its full name or the bare "regress"
+    if profile is None:
+        profile = bool({name, name.rsplit("/", 1)[-1]} & METRICS.profile_stages)
+    sampler = _Sampler(threading.get_ident()) if profile else None
+    if sampler:
+        sampler.start()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe("stage_seconds", time.perf_counter() - t0, stage=name)
+        if sampler:
+            sampler.stopped.set()
+            sampler.join()
+            os.makedirs(METRICS.profile_dir, exist_ok=True)
+            path = os.path.join(METRICS.profile_dir, name.replace("/", "_") + ".folded")
+            with open(path, "w") as f:
+                f.write(sampler.folded())
+
+
+def snapshot_at_exit(path):
+    atexit.register(METRICS.write_snapshot, path)
+
+
+# METRICS=1 METRICS_OUT=run.prom python <script>.py instruments any entry point
+if METRICS.enabled and os.getenv("METRICS_OUT"):
+    snapshot_at_exit(os.getenv("METRICS_OUT"))
@@ -0,0 +1,198 @@
+# llm_client.py
+# One client for every LLM call in the repo. Prompts run concurrently on asyncio
+# (blocking HTTP in a worker-thread pool over one pooled session) under a concurrency
+# cap, with timeouts and retry/backoff. Responses are cached on disk keyed by
+# provider, model and prompt, so re-running a day costs nothing. Providers are
+# pluggable: OpenAI-compatible chat endpoints (including a local stub server),
+# HuggingFace inference, or an in-process stub.
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from instrumentation import count, instrument_session, timed
+from market_cache import MarketDataCache
+from net_utils import RETRYABLE, check_response, make_session, retry_call
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".cache/llm")
+DEFAULT_MODELS = {
+    "openai": "gpt-3.5-turbo",
+    "huggingface": "google/gemma-7b-it",
+    "stub": "stub",
+}
+
+
+def _approx_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class OpenAIProvider:
+    # any OpenAI-compatible /chat/completions endpoint; point base_url at a stub server for tests
+    name = "openai"
+
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")).rstrip("/")
+
+    def complete(self, session, prompt, model, max_tokens, temperature, timeout):
+        r = check_response(session.post(
+            f"{self.base_url}/chat/completions",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={"model": model, "messages": [{"role": "user", "content": prompt}],
+                  "max_tokens": max_tokens, "temperature": temperature},
+            timeout=timeout,
+        ))
+        body = r.json()
+        usage = body.get("usage") or {}
+        text = body["choices"][0]["message"]["content"]
+        return text, usage.get("prompt_tokens", _approx_tokens(prompt)), \
+            usage.get("completion_tokens", _approx_tokens(text))
+
+
+class HuggingFaceProvider:
+    name = "huggingface"
+
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key or os.getenv("HUGGINGFACE_API_KEY")
+        self.base_url = (base_url or os.getenv("HF_BASE_URL", "https://api-inference.huggingface.co")).rstrip("/")
+
+    def complete(self, session, prompt, model, max_tokens, temperature, timeout):
+        r = check_response(session.post(
+            f"{self.base_url}/models/{model}",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={"inputs": prompt, "parameters": {"max_new_tokens": max_tokens, "temperature": temperature,
+                                                   "return_full_text": False}},
+            timeout=timeout,
+        ))
+        out = r.json()
+        text = (out[0] if isinstance(out, list) else out).get("generated_text", "")
+        # the inference API does not report usage
+        return text, _approx_tokens(prompt), _approx_tokens(text)
+
+
+class StubProvider:
+    # offline stand-in: deterministic text after `latency` seconds
+    name = "stub"
+
+    def __init__(self, latency=0.0, fail=()):
+        self.latency = latency
+        self.fail = set(fail)
+        self.calls = 0
+
+    def complete(self, session, prompt, model, max_tokens, temperature, timeout):
+        self.calls += 1
+        time.sleep(self.latency)
+        if prompt in self.fail:
+            raise RuntimeError("stub failure")
+        text = f"Neutral positioning. ({len(prompt)} chars)"
+        return text, _approx_tokens(prompt), _approx_tokens(text)
+
+
+PROVIDERS = {p.name: p for p in (OpenAIProvider, HuggingFaceProvider, StubProvider)}
+
+
+class LLMClient:
+    def __init__(self, provider=None, model=None, concurrency=8, timeout=60, retries=3, backoff=1.0,
+                 max_tokens=512, temperature=0.2, cache=None, session=None):
+        # provider: instance or name; cache=False disables the on-disk response cache
+        # read at call time so a .env loaded by the entry point still applies
+        provider = provider or os.getenv("LLM_PROVIDER", "openai")
+        self.provider = PROVIDERS[provider]() if isinstance(provider, str) else provider
+        self.model = model or os.getenv("LLM_MODEL") or DEFAULT_MODELS.get(self.provider.name)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.cache = MarketDataCache(LLM_CACHE_DIR, ttl={"llm": None}) if cache is None else cache
+        self.session = instrument_session(session or make_session(pool_size=concurrency), "llm")
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _params(self, prompt):
+        return {"model": self.model, "prompt": prompt, "max_tokens": self.max_tokens,
+                "temperature": self.temperature}
+
+    def _record(self, **row):
+        with self._lock:
+            self.calls.append({"provider": self.provider.name, "model": self.model, **row})
+        result = "cached" if row["cached"] else "ok" if row["ok"] else "error"
+        count("llm_calls_total", provider=self.provider.name, result=result)
+        if not row["cached"]:
+            count("llm_tokens_total", row["prompt_tokens"], provider=self.provider.name, kind="prompt")
+            count("llm_tokens_total", row["completion_tokens"], provider=self.provider.name, kind="completion")
+
+    @timed("llm_client.LLMClient.complete")
+    def _complete(self, prompt):
+        if self.cache:
+            hit = self.cache.get(self.provider.name, "llm", self._params(prompt))
+            if hit is not None:
+                self._record(latency=0.0, cached=True, ok=True, attempts=0, **hit["usage"])
+                return hit["text"]
+        attempts = 0
+
+        def attempt():
+            nonlocal attempts
+            attempts += 1
+            return self.provider.complete(self.session, prompt, self.model, self.max_tokens,
+                                          self.temperature, self.timeout)
+        t0 = time.perf_counter()
+        try:
+            text, prompt_tokens, completion_tokens = retry_call(
+                attempt, retries=self.retries, backoff=self.backoff, retry_on=RETRYABLE)
+        except Exception:
+            self._record(latency=time.perf_counter() - t0, cached=False, ok=False, attempts=attempts,
+                         prompt_tokens=0, completion_tokens=0)
+            raise
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        self._record(latency=time.perf_counter() - t0, cached=False, ok=True, attempts=attempts, **usage)
+        if self.cache:
+            self.cache.put(self.provider.name, "llm", self._params(prompt), {"text": text, "usage": usage})
+        return text
+
+    async def acomplete_many(self, prompts, return_exceptions=True):
+        # own thread pool sized to the cap: asyncio's default executor is limited
+        # by CPU count and would serialise slow network calls
+        sem = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            async def one(prompt):
+                async with sem:
+                    return await loop.run_in_executor(pool, self._complete, prompt)
+            return await asyncio.gather(*(one(p) for p in prompts), return_exceptions=return_exceptions)
+
+    def complete_many(self, prompts, return_exceptions=True):
+        # results in prompt order; failures come back as exception objects
+        return asyncio.run(self.acomplete_many(list(prompts), return_exceptions))
+
+    def complete(self, prompt):
+        return self._complete(prompt)
+
+    def stats(self):
+        calls = pd.DataFrame(self.calls, columns=["provider", "model", "latency", "cached", "ok", "attempts",
+                                                  "prompt_tokens", "completion_tokens"])
+        live = calls[~calls["cached"].astype(bool)]
+        return {
+            "calls": len(calls),
+            "cache_hits": int(calls["cached"].sum()),
+            "errors": int((~calls["ok"].astype(bool)).sum()),
+            "retries": int((live["attempts"] - 1).clip(lower=0).sum()),
+            # billed tokens only; cache hits cost nothing
+            "prompt_tokens": int(live["prompt_tokens"].sum()),
+            "completion_tokens": int(live["completion_tokens"].sum()),
+            "latency_p50": float(live["latency"].median()) if len(live) else 0.0,
+            "latency_max": float(live["latency"].max()) if len(live) else 0.0,
+        }
+
+
+def classify_sentiment(text):
+    lowered = text.lower()
+    if "bearish" in lowered:
+        return "Bearish"
+    if "bullish" in lowered:
+        return "Bullish"
+    return "Neutral"
@@ -1,75 +1,98 @@
-# IMPORT MODULES
-from data_fetch import fetch_stock_data, fetch_option_chain
-from greeks import black_scholes_greeks
-from signals import compute_signals
-from backtest import simple_backtest
-from valuation import get_valuation_metrics
-from risk_analysis import expected_move, breakeven_price, max_loss, max_gain
-from cluster_analysis import run_kmeans
-from portfolio_manager import rank_trades
+# main.py
+# End-to-end walkthrough for one ticker: data, signals, valuation, greeks, clustering.
+# Everything heavy is imported inside main() so importing this module is free.
 
-import matplotlib.pyplot as plt
-import numpy as np
 
-# SET PARAMETERS
-ticker = "AAPL"
-start_date = "2023-01-01"
-end_date = "2023-12-31"
-r = 0.05  # risk-free rate
+def main():
+    # IMPORT MODULES
+    from data_fetch import fetch_stock_data, fetch_option_chain, normalize_chain
+    from greeks import black_scholes_greeks
+    from vol_surface import surface_for
+    from signals import compute_signals
+    from backtest import simple_backtest
+    from valuation import get_valuation_metrics
+    from risk_analysis import expected_move, breakeven_price, max_loss, max_gain
+    from cluster_analysis import run_kmeans
+    from portfolio_manager import rank_trades
+    from spread_optimizer import optimize_spreads
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
 
-# FETCH DATA
-hist = fetch_stock_data(ticker, start_date, end_date)
-option_chain = fetch_option_chain(ticker)
-metrics = get_valuation_metrics(ticker)
+    # SET PARAMETERS
+    ticker = "AAPL"
+    start_date = "2023-01-01"
+    end_date = "2023-12-31"
+    r = 0.05  # risk-free rate
 
-# SIGNALS & BACKTEST
-signals = compute_signals(hist)
-portfolio = simple_backtest(signals)
-portfolio.plot(title="Backtest Portfolio Value")
-plt.show()
+    # FETCH DATA
+    hist = fetch_stock_data(ticker, start_date, end_date)
+    option_chain = fetch_option_chain(ticker)
+    metrics = get_valuation_metrics(ticker)
 
-# DISPLAY VALUATION
-print("Valuation Metrics:")
-print(metrics)
+    # SIGNALS & BACKTEST
+    signals = compute_signals(hist)
+    portfolio = simple_backtest(signals)
+    portfolio.plot(title="Backtest Portfolio Value")
+    plt.show()
 
-# CHOOSE OPTION EXAMPLE
-expiry = list(option_chain.keys())[0]
-option = option_chain[expiry]["calls"].iloc[0]  # example: first call
-S = hist['Close'].iloc[-1]
-K = option['strike']
-T = (pd.to_datetime(expiry) - pd.Timestamp.now()).days / 365
-IV = option['impliedVolatility']
-option_price = option['lastPrice']
+    # DISPLAY VALUATION
+    print("Valuation Metrics:")
+    print(metrics)
 
-# RISK & GREEKS
-greeks = black_scholes_greeks(S, K, T, r, IV, option_type='call')
-exp_move = expected_move(S, IV, T)
-bep = breakeven_price(option_price, K, 'call')
-loss = max_loss(option_price)
-gain = max_gain(S, K, option_price, 'call')
+    # CHOOSE OPTION EXAMPLE
+    expiry = list(option_chain.keys())[0]
+    S = hist['Close'].iloc[-1]
+    calls = option_chain[expiry]["calls"]
+    option = calls.iloc[(calls['strike'] - S).abs().argmin()]  # example: at-the-money call
+    K = option['strike']
+    T = (pd.to_datetime(expiry) - pd.Timestamp.now()).days / 365
+    option_price = option['lastPrice']
+    # one fitted surface for every vol below; Yahoo's per-contract IV is often stale
+    chain = pd.concat([normalize_chain(ticker, e, c["calls"], c["puts"]) for e, c in option_chain.items()],
+                      ignore_index=True)
+    surface = surface_for(ticker, chain, S, r)
+    IV = float(surface.iv(K, T))
 
-print("\nGreeks:", greeks)
-print("Expected Move:", round(exp_move, 2))
-print("Breakeven Price:", round(bep, 2))
-print("Max Loss:", round(loss, 2))
-print("Max Gain (at current price):", round(gain, 2))
+    # RISK & GREEKS
+    greeks = black_scholes_greeks(S, K, T, r, IV, option_type='call')
+    exp_move = expected_move(S, IV, T)
+    bep = breakeven_price(option_price, K, 'call')
+    loss = max_loss(option_price)
+    gain = max_gain(S, K, option_price, 'call')
 
-# CLUSTER EXAMPLE
-df_cluster_input = hist[['Close']].copy()
-df_cluster_input['volatility'] = hist['Close'].pct_change().rolling(10).std()
-clustered = run_kmeans(df_cluster_input.dropna())
-print("\nClustered Data Sample:")
-print(clustered.tail())
+    print("\nGreeks:", greeks)
+    print("Expected Move:", round(exp_move, 2))
+    print("Breakeven Price:", round(bep, 2))
+    print("Max Loss:", round(loss, 2))
+    print("Max Gain (at current price):", round(gain, 2))
 
-# TRADE RANKING
-trade_idea = {
-    "ticker": ticker,
-    "expected_gain": gain,
-    "max_loss": loss,
-    "option_price": option_price,
-    "strike": K,
-    "IV": IV
-}
-ranked_trades = rank_trades([trade_idea])
-print("\nRanked Trade:")
-print(ranked_trades)
+    # CLUSTER EXAMPLE
+    df_cluster_input = hist[['Close']].copy()
+    df_cluster_input['volatility'] = hist['Close'].pct_change().rolling(10).std()
+    clustered = run_kmeans(df_cluster_input.dropna())
+    print("\nClustered Data Sample:")
+    print(clustered.tail())
+
+    # TRADE RANKING
+    trade_idea = {
+        "ticker": ticker,
+        "expected_gain": gain,
+        "max_loss": loss,
+        "option_price": option_price,
+        "strike": K,
+        "IV": IV
+    }
+    ranked_trades = rank_trades([trade_idea])
+    print("\nRanked Trade:")
+    print(ranked_trades)
+
+    # SPREAD SEARCH
+    # multi-leg structures over the whole chain, same risk/reward ranking
+    spreads = optimize_spreads(chain, S, r, max_loss=5.0, delta_band=(-0.25, 0.25), surface=surface, top=10)
+    print("\nTop Spreads:")
+    print(spreads[["structure", "legs", "debit", "max_loss", "pop", "expected_gain", "risk_reward"]])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# market_cache.py
+# On-disk TTL cache for market data with an in-process LRU front.
+# DataFrames are stored as Arrow IPC files and memory-mapped on load; dict/list
+# payloads (ticker info, expiration lists) are stored as JSON.
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+
+from instrumentation import count
+
+# seconds; None never expires. History is handled separately (see history()).
+DEFAULT_TTL = {
+    "history_today": 15 * 60,
+    "expirations": 15 * 60,
+    "chain": 5 * 60,
+    "info": 24 * 3600,
+    "vol_surface": None,  # keyed by quote snapshot
+}
+CACHE_DIR = os.getenv("MARKET_CACHE_DIR", ".cache/market_data")
+
+
+class MarketDataCache:
+    def __init__(self, root=CACHE_DIR, ttl=None, max_bytes=512 * 1024 ** 2, lru_size=128, flush_every=64,
+                 flush_interval=5.0):
+        # index.json is rewritten after flush_every puts or flush_interval seconds
+        # (and at exit / close()), not on every put
+        self.root = root
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.max_bytes = max_bytes
+        self.lru_size = lru_size
+        self.lru = OrderedDict()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        self.lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "index.json")
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {}
+        self._dirty = False
+        self.flush_every, self.flush_interval = flush_every, flush_interval
+        self._pending = 0
+        self._flushed = time.time()
+        atexit.register(self.flush)
+
+    # --- keys & storage ---
+    @staticmethod
+    def key(ticker, endpoint, params=None):
+        raw = json.dumps([ticker, endpoint, params or {}], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _write(self, key, value):
+        if isinstance(value, pd.DataFrame):
+            path = os.path.join(self.root, key + ".arrow")
+            table = pa.Table.from_pandas(value, preserve_index=True)
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            path = os.path.join(self.root, key + ".json")
+            with open(path, "w") as f:
+                json.dump(value, f, default=str)
+        return path
+
+    @staticmethod
+    def _read(path):
+        if path.endswith(".arrow"):
+            with pa.memory_map(path, "r") as source:
+                return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+        with open(path) as f:
+            return json.load(f)
+
+    def _remember(self, key, value):
+        self.lru[key] = value
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.lru_size:
+            self.lru.popitem(last=False)
+
+    @staticmethod
+    def _out(value):
+        # shallow copy so callers adding columns don't alter the cached frame
+        return value.copy(deep=False) if isinstance(value, pd.DataFrame) else value
+
+    # --- public API ---
+    def get(self, ticker, endpoint, params=None):
+        key = self.key(ticker, endpoint, params)
+        with self.lock:
+            meta = self.index.get(key)
+            if meta is None:
+                self.stats["misses"] += 1
+                count("cache_requests_total", endpoint=endpoint, result="miss")
+                return None
+            ttl = self.ttl.get(endpoint)
+            if ttl is not None and time.time() - meta["created"] > ttl:
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                count("cache_requests_total", endpoint=endpoint, result="expired")
+                return None
+            meta["accessed"] = time.time()
+            self._dirty = True
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                self.stats["hits"] += 1
+                count("cache_requests_total", endpoint=endpoint, result="hit")
+                return self._out(self.lru[key])
+            try:
+                value = self._read(meta["path"])
+            except (FileNotFoundError, OSError, pa.ArrowInvalid):
+                self._drop(key)
+                self.stats["misses"] += 1
+                count("cache_requests_total", endpoint=endpoint, result="miss")
+                return None
+            self.stats["disk_hits"] += 1
+            count("cache_requests_total", endpoint=endpoint, result="disk_hit")
+            self._remember(key, value)
+            return self._out(value)
+
+    def put(self, ticker, endpoint, params, value, **extra):
+        key = self.key(ticker, endpoint, params)
+        with self.lock:
+            path = self._write(key, value)
+            now = time.time()
+            self.index[key] = {"ticker": ticker, "endpoint": endpoint, "path": path,
+                               "size": os.path.getsize(path), "created": now, "accessed": now, **extra}
+            self._remember(key, value)
+            self._evict()
+            self._dirty = True
+            self._pending += 1
+            if self._pending >= self.flush_every or time.time() - self._flushed > self.flush_interval:
+                self.flush()
+        return value
+
+    def get_or_fetch(self, ticker, endpoint, params, fetch):
+        value = self.get(ticker, endpoint, params)
+        if value is None:
+            value = self._out(self.put(ticker, endpoint, params, fetch()))
+        return value
+
+    def history(self, ticker, start, end, fetch, interval="1d"):
+        # Incremental daily history: only the dates outside the stored coverage are
+        # downloaded. Closed days never expire; a range reaching today is refreshed
+        # once the "history_today" TTL passes. fetch(start, end) uses exclusive end.
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        today = pd.Timestamp.today().normalize()
+        params = {"interval": interval}
+        key = self.key(ticker, "history", params)
+        with self.lock:
+            meta = self.index.get(key)
+            stored = None
+            if meta is not None:
+                stored = self.lru.get(key)
+                if stored is None:
+                    try:
+                        stored = self._read(meta["path"])
+                        self.stats["disk_hits"] += 1
+                        self._remember(key, stored)
+                    except (FileNotFoundError, OSError, pa.ArrowInvalid):
+                        self._drop(key)
+                        meta = None
+
+        if meta is None:
+            self.stats["misses"] += 1
+            count("cache_requests_total", endpoint="history", result="miss")
+            frame, cov_start, cov_end = fetch(start, end), start, end
+            fetched = today
+        else:
+            cov_start = pd.Timestamp(meta["cov_start"])
+            cov_end = pd.Timestamp(meta["cov_end"])
+            # the bar of the day the tail was fetched may have been partial: once that
+            # day is over it is fetched again, and while it is today after the TTL
+            fetched = pd.Timestamp(meta.get("fetched") or pd.Timestamp.fromtimestamp(meta["created"]).normalize())
+            if cov_end > fetched and (fetched < today or time.time() - meta["created"] > self.ttl["history_today"]):
+                cov_end = fetched
+            parts = [stored]
+            if start < cov_start:
+                parts.append(fetch(start, cov_start))
+            if end > cov_end:
+                parts.append(fetch(cov_end, end))
+                fetched = today
+            if len(parts) == 1:
+                self.stats["hits"] += 1
+                count("cache_requests_total", endpoint="history", result="hit")
+                meta["accessed"] = time.time()
+                self._dirty = True
+                return self._slice(stored, start, end)
+            self.stats["misses"] += 1
+            count("cache_requests_total", endpoint="history", result="partial")
+            parts = [p for p in parts if p is not None and len(p)]
+            frame = pd.concat(parts) if parts else stored
+            frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+            cov_start, cov_end = min(start, cov_start), max(end, cov_end)
+
+        self.put(ticker, "history", params, frame,
+                 cov_start=str(cov_start), cov_end=str(cov_end), fetched=str(fetched))
+        return self._slice(frame, start, end)
+
+    @staticmethod
+    def _slice(frame, start, end):
+        idx = frame.index
+        if getattr(idx, "tz", None) is not None:
+            start, end = start.tz_localize(idx.tz), end.tz_localize(idx.tz)
+        return frame[(idx >= start) & (idx < end)]
+
+    # --- maintenance ---
+    def _drop(self, key):
+        meta = self.index.pop(key, None)
+        self.lru.pop(key, None)
+        if meta:
+            try:
+                os.remove(meta["path"])
+            except FileNotFoundError:
+                pass
+        self._dirty = True
+
+    def _evict(self):
+        total = sum(m["size"] for m in self.index.values())
+        if total <= self.max_bytes:
+            return
+        for key, meta in sorted(self.index.items(), key=lambda kv: kv[1]["accessed"]):
+            if total <= self.max_bytes:
+                break
+            total -= meta["size"]
+            self._drop(key)
+            self.stats["evictions"] += 1
+
+    def flush(self):
+        with self.lock:
+            if not self._dirty:
+                return
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.index, f)
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+            self._pending = 0
+            self._flushed = time.time()
+
+    def close(self):
+        self.flush()
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.index):
+                self._drop(key)
+            self.flush()
+
+
+_default = None
+
+
+def default_cache():
+    # None when disabled via MARKET_CACHE_DISABLE=1
+    global _default
+    if os.getenv("MARKET_CACHE_DISABLE") == "1":
+        return None
+    if _default is None:
+        _default = MarketDataCache()
+    return _default
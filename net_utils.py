@@ -0,0 +1,79 @@
+# net_utils.py
+# Shared HTTP plumbing: pooled sessions, token-bucket rate limiting, retry with backoff
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import count
+
+
+class TokenBucket:
+    # thread-safe; acquire() blocks until a token is available
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RetryableHTTPError(requests.HTTPError):
+    pass
+
+
+def check_response(response):
+    # 429 and 5xx are worth retrying; other errors raise requests.HTTPError
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableHTTPError(f"{response.status_code} for {response.url}", response=response)
+    response.raise_for_status()
+    return response
+
+
+# transient failures for retry_call(retry_on=...)
+RETRYABLE = (RetryableHTTPError, requests.ConnectionError, requests.Timeout)
+
+
+def retry_call(fn, *args, retries=3, backoff=0.5, retry_on=(Exception,), **kwargs):
+    # exponential backoff with jitter; the last failure is re-raised
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except retry_on:
+            if attempt == retries:
+                raise
+            count("retries_total", fn=getattr(fn, "__qualname__", "call"))
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+
+def make_session(pool_size=16, user_agent=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if user_agent:
+        session.headers["User-Agent"] = user_agent
+    return session
+
+
+def yahoo_session():
+    # recent yfinance releases only accept curl_cffi sessions
+    try:
+        from curl_cffi import requests as curl_requests
+        return curl_requests.Session(impersonate="chrome")
+    except ImportError:
+        return make_session()
@@ -0,0 +1,339 @@
+# options_backtest.py
+# Event-driven options backtester over chain_store snapshots. Each ticker's days
+# are streamed in order with only that day's chain in memory. A strategy sees the
+# day and a book, and opens, rolls and closes contracts, which fill at the recorded
+# bid/ask. Expired contracts settle at intrinsic, and open positions are marked
+# at mid (Black-Scholes at the last IV when a contract is missing from the day's
+# chain) with greeks from greeks.chain_greeks. Tickers are independent, so
+# run_backtests fans them out across processes.
+#   python options_backtest.py --root chain_store --type put --side sell --delta 0.3 --dte 30
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from chain_store import STORE_DIR, ChainStore
+from greeks import bs_price, chain_greeks
+from instrumentation import timed
+
+CONTRACT_MULTIPLIER = 100
+FEE_PER_CONTRACT = 0.65
+LEDGER_COLUMNS = ["date", "action", "expiry", "type", "strike", "qty", "price", "fees", "cash_flow", "tag"]
+EQUITY_COLUMNS = ["date", "spot", "cash", "value", "equity", "delta", "gamma", "vega", "theta", "positions"]
+
+
+def _contract_codes(expiry, call, strike):
+    # one sortable int64 per contract: expiry day, put flag, strike in 1/1000ths
+    days = np.asarray(expiry, dtype="datetime64[D]").astype(np.int64)
+    milli = np.round(np.asarray(strike, float) * 1000).astype(np.int64)
+    return (days * 2 + ~np.asarray(call, dtype=bool)) * 10 ** 9 + milli
+
+
+class Day:
+    # one snapshot as a strategy sees it: the chain plus T, dte, mid and delta
+    def __init__(self, date, chain, r=0.04, q=0.0):
+        self.date = pd.Timestamp(date)
+        self.spot = float(chain["spot"].iloc[0])
+        self.r, self.q = r, q
+        expiry = chain["expiry"].to_numpy("datetime64[D]")
+        kind = chain["type"].to_numpy()
+        strike = chain["strike"].to_numpy(float)
+        bid, ask = chain["bid"].to_numpy(float), chain["ask"].to_numpy(float)
+        quoted = (bid > 0) & (ask >= bid)
+        dte = (expiry - np.datetime64(self.date, "D")).astype(np.int64)
+        iv = chain["impliedVolatility"].to_numpy(float)
+        cols = {c: chain[c].to_numpy() for c in chain.columns}
+        cols.update({
+            "T": np.maximum(dte, 0) / 365,
+            "dte": dte,
+            "mid": np.where(quoted, (bid + ask) / 2, chain["lastPrice"].to_numpy(float)),
+            "delta": chain_greeks(self.spot, strike, np.maximum(dte, 0) / 365, r, iv, kind, q)["delta"],
+        })
+        self._cols = cols
+        self._chain = None
+        codes = _contract_codes(expiry, kind == "call", strike)
+        self._order = np.argsort(codes)
+        self._codes = codes[self._order]
+
+    @property
+    def chain(self):
+        # built on first use; the book and the built-in strategy work off the arrays
+        if self._chain is None:
+            self._chain = pd.DataFrame(self._cols)
+        return self._chain
+
+    def rows(self, keys):
+        # row positions of (expiry, type, strike) keys in the chain, -1 when not listed today
+        if not len(keys):
+            return np.zeros(0, dtype=np.int64)
+        expiry, kind, strike = zip(*keys)
+        codes = _contract_codes(np.array(expiry, dtype="datetime64[D]"), np.array(kind) == "call", strike)
+        at = np.minimum(np.searchsorted(self._codes, codes), len(self._codes) - 1)
+        return np.where(self._codes[at] == codes, self._order[at], -1)
+
+    def quote(self, key):
+        # one contract's row as a dict; None when it is not in today's chain
+        i = self.rows([key])[0]
+        return None if i < 0 else {c: v[i] for c, v in self._cols.items()}
+
+    def select(self, option_type, dte, delta=None, strike=None):
+        # the listed expiry nearest `dte` days out, then the contract nearest the
+        # target |delta| (or strike, or at the money)
+        c = self._cols
+        live = np.flatnonzero((c["type"] == option_type) & (c["dte"] > 0))
+        if not len(live):
+            return None
+        expiry_dte = np.unique(c["dte"][live])
+        live = live[c["dte"][live] == expiry_dte[np.argmin(np.abs(expiry_dte - dte))]]
+        if delta is not None:
+            distance = np.abs(np.abs(c["delta"][live]) - delta)
+        else:
+            distance = np.abs(c["strike"][live] - (self.spot if strike is None else strike))
+        if np.isnan(distance).all():
+            return None
+        i = live[np.nanargmin(distance)]
+        return pd.Timestamp(c["expiry"][i]), str(c["type"][i]), float(c["strike"][i])
+
+
+class OptionBook:
+    # positions keyed by (expiry, type, strike) with signed contract counts; every
+    # fill, roll and expiry goes to the ledger
+    def __init__(self, cash=100_000.0, fee=FEE_PER_CONTRACT, fill="touch", multiplier=CONTRACT_MULTIPLIER):
+        self.cash = float(cash)
+        self.fee, self.fill, self.multiplier = fee, fill, multiplier
+        self.positions = {}
+        self.ledger = []
+        self.rejected = 0
+        self.day = None
+        self.last_spot = None
+
+    def _record(self, action, key, qty, price, fees, cash_flow, tag):
+        self.ledger.append((self.day.date, action, key[0], key[1], key[2], qty, price, fees, cash_flow, tag))
+
+    def _fill(self, key, qty):
+        # (quote, price) a trade of qty would fill at, or None without a usable quote:
+        # buys lift the ask, sells hit the bid (fill="mid": both at mid)
+        row = self.day.quote(key)
+        if row is None:
+            return None
+        price = float(row["mid"] if self.fill == "mid" else (row["ask"] if qty > 0 else row["bid"]))
+        return (row, price) if price > 0 else None
+
+    def trade(self, key, qty, action="trade", tag=None):
+        # returns the fill price, or None when the contract has no usable quote today
+        if qty == 0:
+            return None
+        fill = self._fill(key, qty)
+        if fill is None:
+            self.rejected += 1
+            return None
+        row, price = fill
+        fees = abs(qty) * self.fee
+        cash_flow = -qty * self.multiplier * price - fees
+        self.cash += cash_flow
+        pos = self.positions.get(key)
+        if pos is None:
+            self.positions[key] = {"qty": qty, "entry": price, "opened": self.day.date, "tag": tag,
+                                   "iv": float(row["impliedVolatility"])}
+        else:
+            if np.sign(pos["qty"]) == np.sign(qty):
+                pos["entry"] = (pos["entry"] * pos["qty"] + price * qty) / (pos["qty"] + qty)
+            pos["qty"] += qty
+            if pos["qty"] == 0:
+                del self.positions[key]
+        self._record(action, key, qty, price, fees, cash_flow, tag)
+        return price
+
+    def open(self, key, qty, tag=None):
+        return self.trade(key, qty, "open", tag)
+
+    def close(self, key, tag=None):
+        pos = self.positions.get(key)
+        return None if pos is None else self.trade(key, -pos["qty"], "close", tag or pos["tag"])
+
+    def roll(self, key, new_key, qty=None, tag=None):
+        # close `key` and open `new_key` (same size unless qty is given); nothing
+        # happens unless both legs have a usable price today, so a position is never
+        # closed without its replacement being opened
+        pos = self.positions.get(key)
+        if pos is None or new_key is None or new_key == key:
+            return None
+        qty = pos["qty"] if qty is None else qty
+        if qty == 0:
+            return None
+        if self._fill(key, -pos["qty"]) is None or self._fill(new_key, qty) is None:
+            self.rejected += 1
+            return None
+        tag = tag or pos["tag"]
+        self.trade(key, -pos["qty"], "roll_close", tag)
+        return self.trade(new_key, qty, "roll_open", tag)
+
+    def settle(self, day):
+        # contracts that expired before this snapshot settle at intrinsic against the
+        # last spot seen on or before their expiry
+        self.day = day
+        for key in [k for k in self.positions if k[0] < day.date]:
+            self._expire(key)
+        self.last_spot = day.spot
+
+    def _expire(self, key):
+        pos = self.positions.pop(key)
+        S = self.last_spot if self.last_spot is not None else self.day.spot
+        intrinsic = max(S - key[2], 0.0) if key[1] == "call" else max(key[2] - S, 0.0)
+        cash_flow = pos["qty"] * self.multiplier * intrinsic
+        self.cash += cash_flow
+        self._record("expire", key, -pos["qty"], intrinsic, 0.0, cash_flow, pos["tag"])
+
+    def mark(self):
+        # end-of-day value and position greeks: delta in shares, gamma in shares per
+        # $1, vega in $ per vol point, theta in $ per calendar day
+        day = self.day
+        row = {"date": day.date, "spot": day.spot, "cash": self.cash, "positions": len(self.positions)}
+        if not self.positions:
+            return {**row, "value": 0.0, "equity": self.cash, "delta": 0.0, "gamma": 0.0, "vega": 0.0, "theta": 0.0}
+        keys = list(self.positions)
+        qty = np.array([self.positions[k]["qty"] for k in keys], dtype=float) * self.multiplier
+        K = np.array([k[2] for k in keys], dtype=float)
+        kind = np.array([k[1] for k in keys])
+        days = np.array([k[0] for k in keys], dtype="datetime64[D]") - np.datetime64(day.date, "D")
+        T = np.maximum(days.astype(np.int64), 0) / 365
+        at = day.rows(keys)
+        listed = at >= 0
+        mid = np.where(listed, day._cols["mid"][at], np.nan)
+        quoted_iv = np.where(listed, day._cols["impliedVolatility"][at], np.nan)
+        for k, v in zip(keys, quoted_iv):
+            if v > 0:
+                self.positions[k]["iv"] = float(v)
+        iv = np.array([self.positions[k]["iv"] for k in keys], dtype=float)
+        g = chain_greeks(day.spot, K, T, day.r, iv, kind, day.q)
+        # contracts missing from today's chain are marked off the model at their last IV
+        mark = np.where(np.isfinite(mid), mid, bs_price(day.spot, K, T, day.r, iv, kind, day.q))
+        value = float(qty @ mark)
+        return {**row, "value": value, "equity": self.cash + value, "delta": float(qty @ g["delta"]),
+                "gamma": float(qty @ g["gamma"]), "vega": float(qty @ g["vega"]) / 100,
+                "theta": float(qty @ g["theta"]) / 365}
+
+
+class TargetDeltaStrategy:
+    # one rolling single-leg position: open `contracts` of the option nearest the
+    # target delta about `dte` days out (side -1 sells), take profit / stop out on
+    # the mid relative to entry, and roll to a fresh contract at `roll_dte`
+    def __init__(self, option_type="put", side=-1, delta=0.30, dte=30, roll_dte=7, take_profit=0.5,
+                 stop_loss=None, contracts=1):
+        self.option_type, self.side, self.delta, self.dte = option_type, side, delta, dte
+        self.roll_dte, self.take_profit, self.stop_loss, self.contracts = roll_dte, take_profit, stop_loss, contracts
+
+    def on_day(self, day, book):
+        for key, pos in list(book.positions.items()):
+            quote = day.quote(key)
+            if quote is None:
+                continue
+            gain = np.sign(pos["qty"]) * (quote["mid"] - pos["entry"]) / pos["entry"] if pos["entry"] > 0 else 0.0
+            if self.take_profit is not None and gain >= self.take_profit:
+                book.close(key, "take_profit")
+            elif self.stop_loss is not None and gain <= -self.stop_loss:
+                book.close(key, "stop_loss")
+            elif quote["dte"] <= self.roll_dte:
+                book.roll(key, day.select(self.option_type, self.dte, self.delta), tag="roll")
+        if not book.positions:
+            key = day.select(self.option_type, self.dte, self.delta)
+            if key is not None:
+                book.open(key, self.side * self.contracts, "entry")
+
+
+@timed(rows=True)
+def run_backtest(ticker, strategy, store=STORE_DIR, start=None, end=None, r=0.04, q=0.0, capital=100_000.0,
+                 fee=FEE_PER_CONTRACT, fill="touch"):
+    # replays one ticker; returns (daily equity and greeks, trade ledger). `store` is
+    # a ChainStore or its root directory.
+    store = store if isinstance(store, ChainStore) else ChainStore(store)
+    book = OptionBook(capital, fee, fill)
+    rows = []
+    for date, chain in store.iter_days(ticker, start, end):
+        if chain.empty:
+            continue
+        day = Day(date, chain, r, q)
+        book.settle(day)
+        strategy.on_day(day, book)
+        rows.append(book.mark())
+    if book.day is not None:
+        # contracts expiring on the last replayed day settle at its spot
+        for key in [k for k in book.positions if k[0] <= book.day.date]:
+            book._expire(key)
+        if rows:
+            rows[-1] = book.mark()
+    equity = pd.DataFrame(rows, columns=EQUITY_COLUMNS)
+    ledger = pd.DataFrame(book.ledger, columns=LEDGER_COLUMNS)
+    return equity, ledger
+
+
+def summarize(equity, ledger, periods_per_year=252):
+    if equity.empty:
+        return {"days": 0}
+    curve = equity["equity"].to_numpy(float)
+    ret = np.diff(curve) / curve[:-1]
+    std = ret.std() if len(ret) > 1 else 0.0
+    return {
+        "days": len(equity),
+        "total_return": float(curve[-1] / curve[0] - 1),
+        "sharpe": float(ret.mean() / std * np.sqrt(periods_per_year)) if std > 0 else np.nan,
+        "max_drawdown": float((curve / np.maximum.accumulate(curve) - 1).min()),
+        "trades": int(ledger["action"].ne("expire").sum()),
+        "fees": float(ledger["fees"].sum()),
+    }
+
+
+def _run_one(task):
+    ticker, strategy_factory, kwargs = task
+    return ticker, run_backtest(ticker, strategy_factory(), **kwargs)
+
+
+def run_backtests(tickers, strategy_factory, workers=1, **kwargs):
+    # one independent replay per ticker. strategy_factory builds a fresh strategy
+    # (a class or functools.partial, so it pickles); kwargs go to run_backtest with
+    # `store` as a root path when workers > 1
+    tasks = [(t, strategy_factory, kwargs) for t in tickers]
+    if workers == 1:
+        return dict(map(_run_one, tasks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(_run_one, tasks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored option chains through a rolling option strategy")
+    parser.add_argument("--root", default=STORE_DIR, help="chain_store directory")
+    parser.add_argument("--tickers", nargs="+", default=None, help="default: every ticker in the store")
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--type", choices=["call", "put"], default="put")
+    parser.add_argument("--side", choices=["buy", "sell"], default="sell")
+    parser.add_argument("--delta", type=float, default=0.30)
+    parser.add_argument("--dte", type=int, default=30)
+    parser.add_argument("--roll-dte", type=int, default=7)
+    parser.add_argument("--take-profit", type=float, default=0.5)
+    parser.add_argument("--stop-loss", type=float, default=None)
+    parser.add_argument("--contracts", type=int, default=1)
+    parser.add_argument("--capital", type=float, default=100_000.0)
+    parser.add_argument("--fee", type=float, default=FEE_PER_CONTRACT, help="per contract")
+    parser.add_argument("--fill", choices=["touch", "mid"], default="touch")
+    parser.add_argument("--rate", type=float, default=0.04)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default=None, help="write the daily equity curves (CSV)")
+    args = parser.parse_args(argv)
+
+    tickers = args.tickers or ChainStore(args.root).tickers()
+    factory = partial(TargetDeltaStrategy, args.type, -1 if args.side == "sell" else 1, args.delta, args.dte,
+                      args.roll_dte, args.take_profit, args.stop_loss, args.contracts)
+    results = run_backtests(tickers, factory, args.workers, store=args.root, start=args.start, end=args.end,
+                            r=args.rate, capital=args.capital, fee=args.fee, fill=args.fill)
+    summary = pd.DataFrame({t: summarize(*res) for t, res in results.items()}).T
+    print(summary.to_string(float_format=lambda x: f"{x:.4f}"))
+    if args.output:
+        pd.concat([eq.assign(ticker=t) for t, (eq, _) in results.items()]).to_csv(args.output, index=False)
+        print(f"equity curves -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,32 @@
 # options_flow_visualizer.py
 
 import os
-import yfinance as yf
+from data_fetch import YahooChainSource
+from instrumentation import timed
+from llm_client import LLMClient, classify_sentiment
 import pandas as pd
-import requests
-from datetime import datetime
-from dotenv import load_dotenv
-
-# Load API key from .env if needed for OpenAI or HuggingFace
-load_dotenv()
-
-# Replace with actual OpenAI or HuggingFace call later
-import requests
-
-def analyze_sentiment_with_llm(prompt):
-    HF_TOKEN = os.getenv("HUGGINGFACE_API_KEY")
-    headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-    payload = {"inputs": prompt}
-
-    response = requests.post(
-        "https://api-inference.huggingface.co/models/google/gemma-7b-it",
-        headers=headers,
-        json=payload
-    )
-    return {"summary": response.json()[0]['generated_text'], "sentiment": "Bullish"}  # Simplify for now
-
-#def analyze_sentiment_with_llm(prompt):
-    # Stub - replace with actual API call
-    #return {
-        #"summary": "Traders are positioning for downside on AAPL with high put volume at 170 strike.",
-        #"sentiment": "Bearish"
-   # }
-try:
-    response = requests.post(...)
-    output = response.json()
-    if isinstance(output, list):
-        summary = output[0].get('generated_text', '')
-    else:
-        summary = output.get('generated_text', '')
-except Exception as e:
-    summary = "Error in LLM call: " + str(e)
-if "bearish" in summary.lower():
-    sentiment = "Bearish"
-elif "bullish" in summary.lower():
-    sentiment = "Bullish"
-else:
-    sentiment = "Neutral"
-
-def fetch_options_flow(ticker_symbol):
-    ticker = yf.Ticker(ticker_symbol)
-    expiry = ticker.options[0]  # Nearest expiry
-    chain = ticker.option_chain(expiry)
+
+@timed()
+def analyze_sentiment_with_llm(prompt, client=None):
+    # HuggingFace by default; set LLM_PROVIDER / LLM_MODEL to use OpenAI or a local stub
+    client = client or LLMClient(os.getenv("LLM_PROVIDER", "huggingface"))
+    try:
+        summary = client.complete(prompt)
+    except Exception as e:
+        summary = "Error in LLM call: " + str(e)
+    return {"summary": summary, "sentiment": classify_sentiment(summary)}
+
+@timed()
+def fetch_options_flow(ticker_symbol, source=None):
+    source = source or YahooChainSource()
+    expiry = source.expirations(ticker_symbol)[0]  # Nearest expiry
+    calls, puts = source.chain(ticker_symbol, expiry)
 
     # Compute basic metrics
-    call_vol = chain.calls['volume'].sum()
-    put_vol = chain.puts['volume'].sum()
-    iv_calls = chain.calls['impliedVolatility'].mean()
-    iv_puts = chain.puts['impliedVolatility'].mean()
+    call_vol = calls['volume'].sum()
+    put_vol = puts['volume'].sum()
+    iv_calls = calls['impliedVolatility'].mean()
+    iv_puts = puts['impliedVolatility'].mean()
     vol_ratio = call_vol / put_vol if put_vol > 0 else None
     iv_skew = iv_calls - iv_puts
 
@@ -84,9 +54,19 @@ What does this imply about market sentiment and positioning?
 """
     return prompt
 
-def generate_lovable_payload(flow_summary, analysis_result):
-    return {
-        "cards": [
+# rows added when the summary comes from flow_tracker.FlowTracker
+INTRADAY_ROWS = [
+    ("New Call Volume", "new_call_vol"),
+    ("New Put Volume", "new_put_vol"),
+    ("Rolling Call/Put Ratio", "rolling_ratio"),
+    ("Rolling IV Skew", "rolling_skew"),
+]
+
+def generate_lovable_payload(flow_summary, analysis_result=None):
+    # analysis_result=None (intraday refreshes) emits only the metrics table
+    cards = []
+    if analysis_result is not None:
+        cards += [
             {
                 "type": "summary",
                 "title": "Options Flow Analysis",
@@ -98,32 +78,53 @@ def generate_lovable_payload(flow_summary, analysis_result):
                 "value": analysis_result["sentiment"],
                 "color": "green" if analysis_result["sentiment"] == "Bullish" else "red"
             },
-            {
-                "type": "table",
-                "title": "Options Flow Summary",
-                "columns": ["Metric", "Value"],
-                "rows": [
-                    ["Call Volume", flow_summary["call_vol"]],
-                    ["Put Volume", flow_summary["put_vol"]],
-                    ["Call/Put Ratio", flow_summary["vol_ratio"]],
-                    ["IV (Calls)", flow_summary["iv_calls"]],
-                    ["IV (Puts)", flow_summary["iv_puts"]],
-                    ["IV Skew", flow_summary["iv_skew"]]
-                ]
-            }
         ]
-    }
+    cards.append({
+        "type": "table",
+        "title": "Options Flow Summary",
+        "columns": ["Metric", "Value"],
+        "rows": [
+            ["Call Volume", flow_summary["call_vol"]],
+            ["Put Volume", flow_summary["put_vol"]],
+            ["Call/Put Ratio", flow_summary["vol_ratio"]],
+            ["IV (Calls)", flow_summary["iv_calls"]],
+            ["IV (Puts)", flow_summary["iv_puts"]],
+            ["IV Skew", flow_summary["iv_skew"]]
+        ] + [[label, flow_summary[key]] for label, key in INTRADAY_ROWS if key in flow_summary]
+    })
+    return {"cards": cards}
 
-if __name__ == "__main__":
-    ticker = "AAPL"
-    flow_summary = fetch_options_flow(ticker)
-    prompt = build_prompt(flow_summary, ticker)
-    analysis_result = analyze_sentiment_with_llm(prompt)
+def main(argv=None):
+    import argparse
+    import json
+
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Options flow sentiment card for the Lovable frontend")
+    parser.add_argument("--ticker", default="AAPL")
+    parser.add_argument("--output", default="lovable_output.json")
+    parser.add_argument("--synthetic", action="store_true", help="use the offline synthetic data source")
+    parser.add_argument("--llm-provider", choices=["openai", "huggingface", "stub"], default=None)
+    args = parser.parse_args(argv)
+
+    # Load API key from .env if needed for OpenAI or HuggingFace
+    load_dotenv()
+    source = None
+    if args.synthetic:
+        from synthetic_data import SyntheticChainSource
+        source = SyntheticChainSource()
+    client = LLMClient(args.llm_provider) if args.llm_provider else None
+    flow_summary = fetch_options_flow(args.ticker, source)
+    prompt = build_prompt(flow_summary, args.ticker)
+    analysis_result = analyze_sentiment_with_llm(prompt, client)
     payload = generate_lovable_payload(flow_summary, analysis_result)
 
     # Output to JSON or API call to Lovable frontend
-    import json
-    with open("lovable_output.json", "w") as f:
-        json.dump(payload, f, indent=2)
+    with open(args.output, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
 
-    print("✅ Sentiment analysis complete. Check lovable_output.json")
+    print(f"✅ Sentiment analysis complete. Check {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,141 +1,252 @@
 # options_volume_tracker.py
 # Track S&P 500 options volume for selected expiry and strike range, detect anomalies, visualize, LLM summary, and trade recommendation
 
-import yfinance as yf
-import pandas as pd
+import argparse
 import json
-from datetime import datetime
-from scipy.stats import zscore
 import os
-import matplotlib.pyplot as plt
-import openai
-from dotenv import load_dotenv
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_fetch import fetch_option_chains
+from greeks import greeks_for_chain
+from instrumentation import timed
+from volume_store import VolumeStore, chart_data, flag_anomalies
 
 # --- Config ---
 EXPIRY_INDEX = 0
-STRIKE_RANGE = (170, 180)
-MAX_TICKERS = 50
+MONEYNESS_BAND = (0.95, 1.05)  # strike / spot
+MAX_WORKERS = 16
+RISK_FREE_RATE = 0.04
 HISTORY_DIR = "sp500_volume_history"
-os.makedirs(HISTORY_DIR, exist_ok=True)
-load_dotenv()
-
-# Get S&P 500 tickers
-sp500 = pd.read_html("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies")[0]
-tickers = sp500['Symbol'].tolist()
+SP500_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
 
 # Ticker Watchlist (custom user-defined for priority scan)
 WATCHLIST = ["AAPL", "TSLA", "NVDA", "MSFT", "META"]
 
-# Today's date
-today = datetime.today().strftime("%Y-%m-%d")
-today_results = []
 
-# Loop through tickers
-for symbol in tickers[:MAX_TICKERS]:
-    try:
-        t = yf.Ticker(symbol)
-        expirations = t.options
-        if not expirations:
-            continue
-        expiry = expirations[EXPIRY_INDEX]
-        chain = t.option_chain(expiry)
-        calls = chain.calls
-        puts = chain.puts
-        call_filter = calls[(calls['strike'] >= STRIKE_RANGE[0]) & (calls['strike'] <= STRIKE_RANGE[1])]
-        put_filter = puts[(puts['strike'] >= STRIKE_RANGE[0]) & (puts['strike'] <= STRIKE_RANGE[1])]
-        call_vol = call_filter['volume'].sum()
-        put_vol = put_filter['volume'].sum()
-        total_vol = call_vol + put_vol
-        call_iv = call_filter['impliedVolatility'].mean()
-        put_iv = put_filter['impliedVolatility'].mean()
-
-        today_results.append({
-            "ticker": symbol,
-            "expiry": expiry,
-            "strike_range": f"{STRIKE_RANGE[0]}-{STRIKE_RANGE[1]}",
-            "call_volume": int(call_vol),
-            "put_volume": int(put_vol),
-            "total_volume": int(total_vol),
-            "call_iv": round(call_iv, 4) if not pd.isna(call_iv) else None,
-            "put_iv": round(put_iv, 4) if not pd.isna(put_iv) else None
-        })
-
-    except Exception as e:
-        print(f"{symbol}: failed ({str(e)})")
-
-# Save today's data
-filename_today = f"{HISTORY_DIR}/sp500_options_volume_{today}.json"
-with open(filename_today, "w") as f:
-    json.dump(today_results, f, indent=2)
-print(f"✅ Volume tracking complete. Saved to {filename_today}")
-
-# Anomaly detection
-history_file = f"{HISTORY_DIR}/volume_history.csv"
-try:
-    df_hist = pd.read_csv(history_file)
-except FileNotFoundError:
-    df_hist = pd.DataFrame(columns=["date", "ticker", "total_volume"])
-
-df_today = pd.DataFrame(today_results)[["ticker", "total_volume"]]
-df_today["date"] = today
-df_combined = pd.concat([df_hist, df_today], ignore_index=True)
-df_combined = df_combined.sort_values(by=["ticker", "date"])
-df_combined = df_combined.groupby("ticker").tail(30)
-df_combined.to_csv(history_file, index=False)
-
-df_anomalies = df_combined.groupby("ticker")["total_volume"].apply(zscore).reset_index()
-df_anomalies = df_anomalies.rename(columns={"total_volume": "z_score"})
-df_final = df_combined.merge(df_anomalies, on=["ticker", "date"])
-df_final_today = df_final[df_final["date"] == today]
-anomalies_detected = df_final_today[df_final_today["z_score"].abs() >= 2.5]
-anomaly_output_file = f"{HISTORY_DIR}/anomalies_{today}.json"
-anomalies_detected.to_json(anomaly_output_file, orient="records", indent=2)
-
-print(f"🚨 Anomaly detection complete. {len(anomalies_detected)} tickers flagged.\nSaved to {anomaly_output_file}")
-
-# Visualization
-plt.figure(figsize=(10, 6))
-plot_df = df_final_today.sort_values(by="z_score", ascending=False).head(15)
-plt.barh(plot_df['ticker'], plot_df['z_score'], color='red')
-plt.xlabel("Z-Score")
-plt.title(f"Top Options Volume Anomalies – {today}")
-plt.gca().invert_yaxis()
-plt.tight_layout()
-plt.savefig(f"{HISTORY_DIR}/anomalies_plot_{today}.png")
-print(f"📊 Saved anomaly plot to anomalies_plot_{today}.png")
-
-# LLM Summary and Trade Idea
-if "OPENAI_API_KEY" in os.environ:
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    llm_summaries = []
-    for row in anomalies_detected.to_dict(orient="records"):
-        prompt = f"""
+def load_universe(path=None):
+    # universe file: one ticker per line, or a CSV with a Symbol/ticker column;
+    # without a file the S&P 500 list is scraped from Wikipedia
+    if path is None:
+        symbols = pd.read_html(SP500_URL)[0]['Symbol']
+    elif path.endswith(".csv"):
+        df = pd.read_csv(path)
+        symbols = df['Symbol'] if 'Symbol' in df else df['ticker']
+    else:
+        with open(path) as f:
+            symbols = pd.Series([line.strip() for line in f if line.strip() and not line.startswith("#")])
+    # Yahoo uses BRK-B where the index lists BRK.B
+    return symbols.astype(str).str.replace(".", "-", regex=False).str.upper().drop_duplicates().tolist()
+
+
+@timed(rows=True)
+def select_strikes(chain, moneyness=MONEYNESS_BAND, delta_band=None, r=RISK_FREE_RATE):
+    # keep strikes relative to each ticker's own spot, by moneyness or by |delta|
+    if delta_band is not None:
+        delta = np.abs(greeks_for_chain(chain, "spot", r)["delta"].to_numpy())
+        return chain[(delta >= delta_band[0]) & (delta <= delta_band[1])]
+    m = chain['strike'].to_numpy() / chain['spot'].to_numpy()
+    return chain[(m >= moneyness[0]) & (m <= moneyness[1])]
+
+
+@timed(rows=True)
+def aggregate_scan(selected):
+    grouped = selected.groupby(['ticker', 'type'])
+    agg = pd.DataFrame({
+        'volume': grouped['volume'].sum(),
+        'iv': grouped['impliedVolatility'].mean(),
+    }).unstack('type')
+    out = pd.DataFrame(index=agg.index)
+    for side in ('call', 'put'):
+        out[f'{side}_volume'] = agg['volume'][side].fillna(0).astype(int) if ('volume', side) in agg else 0
+        out[f'{side}_iv'] = agg['iv'][side].round(4) if ('iv', side) in agg else np.nan
+    out['total_volume'] = out['call_volume'] + out['put_volume']
+    info = selected.groupby('ticker').agg(expiry=('expiry', 'first'), spot=('spot', 'first'),
+                                          strike_lo=('strike', 'min'), strike_hi=('strike', 'max'))
+    out = info.join(out).reset_index()
+    out['expiry'] = out['expiry'].dt.strftime("%Y-%m-%d")
+    out['strike_range'] = out['strike_lo'].astype(str) + "-" + out['strike_hi'].astype(str)
+    cols = ["ticker", "expiry", "spot", "strike_range", "call_volume", "put_volume",
+            "total_volume", "call_iv", "put_iv"]
+    return out[cols]
+
+
+def scan_chains(tickers, source=None, max_workers=MAX_WORKERS, expiry_index=EXPIRY_INDEX,
+                moneyness=MONEYNESS_BAND, delta_band=None, store=None):
+    # Returns (selected strikes, errors, fetch seconds). Failed tickers land in errors.
+    # With a chain_store.ChainStore the full fetched chains are snapshotted first.
+    errors = {}
+    t0 = time.perf_counter()
+    chains = fetch_option_chains(tickers, source=source, max_workers=max_workers, errors=errors,
+                                 expiry_index=expiry_index, with_spot=True)
+    elapsed = time.perf_counter() - t0
+    if len(chains):
+        chains['volume'] = chains['volume'].fillna(0)
+        if store is not None:
+            store.write_chains(chains, pd.Timestamp.today())
+        chains = select_strikes(chains, moneyness, delta_band)
+    return chains, errors, elapsed
+
+
+@timed(rows=True)
+def scan_universe(tickers, source=None, max_workers=MAX_WORKERS, expiry_index=EXPIRY_INDEX,
+                  moneyness=MONEYNESS_BAND, delta_band=None, verbose=True, return_strikes=False, store=None):
+    # Returns (per-ticker results, errors, timings[, selected strikes]).
+    # Failed tickers are reported and skipped.
+    t0 = time.perf_counter()
+    selected, errors, fetch_time = scan_chains(tickers, source, max_workers, expiry_index, moneyness, delta_band,
+                                               store)
+    t1 = time.perf_counter()
+    if len(selected):
+        results = aggregate_scan(selected)
+    else:
+        results = pd.DataFrame(columns=["ticker", "total_volume"])
+    timings = {'fetch': fetch_time, 'aggregate': time.perf_counter() - t1, 'total': time.perf_counter() - t0}
+
+    if verbose:
+        for key, e in errors.items():
+            print(f"{key}: failed ({str(e)})")
+        print(f"⏱️ Scanned {len(tickers)} tickers ({len(results)} ok, {len(errors)} failed) in "
+              f"{timings['total']:.2f}s [fetch {timings['fetch']:.2f}s, aggregate {timings['aggregate']:.3f}s]")
+    if return_strikes:
+        return results, errors, timings, selected
+    return results, errors, timings
+
+
+@timed(rows=True)
+def detect_anomalies(today_results, today, history_dir=HISTORY_DIR, strikes=None):
+    # z-scores come from the running 30-day state in the volume store; history is
+    # only appended to (one Parquet partition per day), never re-read
+    store = VolumeStore(history_dir)
+    store.bootstrap_from_csv(f"{history_dir}/volume_history.csv")
+    df_final_today = store.score_day(today, today_results)
+    anomalies_detected = flag_anomalies(df_final_today)
+    anomaly_output_file = f"{history_dir}/anomalies_{today}.json"
+    anomalies_detected.to_json(anomaly_output_file, orient="records", indent=2)
+    print(f"🚨 Anomaly detection complete. {len(anomalies_detected)} tickers flagged.\nSaved to {anomaly_output_file}")
+
+    if strikes is not None and len(strikes):
+        cols = ["ticker", "expiry", "type", "strike", "spot", "volume", "openInterest", "impliedVolatility"]
+        strike_scores = store.score_day(today, strikes[cols], key_cols=("ticker", "expiry", "type", "strike"),
+                                        value_col="volume", level="strikes")
+        store.stats("strikes").prune(today)
+        store.save_state()
+        strike_file = f"{history_dir}/strike_anomalies_{today}.json"
+        flag_anomalies(strike_scores).to_json(strike_file, orient="records", indent=2, date_format="iso")
+        print(f"🚨 Per-strike anomalies saved to {strike_file}")
+    return df_final_today, anomalies_detected
+
+
+@timed()
+def plot_anomalies(df_final_today, today, history_dir=HISTORY_DIR):
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 6))
+    plot_df = df_final_today.sort_values(by="z_score", ascending=False).head(15)
+    plt.barh(plot_df['ticker'], plot_df['z_score'], color='red')
+    plt.xlabel("Z-Score")
+    plt.title(f"Top Options Volume Anomalies – {today}")
+    plt.gca().invert_yaxis()
+    plt.tight_layout()
+    plt.savefig(f"{history_dir}/anomalies_plot_{today}.png")
+    print(f"📊 Saved anomaly plot to anomalies_plot_{today}.png")
+    return plot_df
+
+
+def anomaly_prompt(row):
+    return f"""
 The options volume for {row['ticker']} rose by {round(row['z_score'], 2)} standard deviations today.
-Strike range: {STRIKE_RANGE[0]}–{STRIKE_RANGE[1]}, Expiry: {today}.
+Strike range: {row['strike_range']}, Expiry: {row['expiry']}.
 Call IV: {row['call_iv']:.2%}, Put IV: {row['put_iv']:.2%}.
 
 1. Explain the sentiment or possible cause.
 2. Suggest a potential options trade a trader might consider.
 3. Include reasoning for the trade idea.
 """
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            summary = response.choices[0].message['content']
-            row['llm_summary'] = summary
-            llm_summaries.append(row)
-        except Exception as e:
-            print(f"LLM failed for {row['ticker']}: {str(e)}")
-
-    llm_file = f"{HISTORY_DIR}/llm_anomalies_{today}.json"
+
+
+@timed()
+def summarize_with_llm(anomalies_detected, today, history_dir=HISTORY_DIR, client=None):
+    # all anomalies are summarised concurrently; cached answers are reused on re-runs
+    from llm_client import LLMClient
+
+    client = client or LLMClient()
+    rows = anomalies_detected.to_dict(orient="records")
+    results = client.complete_many([anomaly_prompt(row) for row in rows])
+    llm_summaries = []
+    for row, summary in zip(rows, results):
+        if isinstance(summary, Exception):
+            print(f"LLM failed for {row['ticker']}: {str(summary)}")
+            continue
+        row['llm_summary'] = summary
+        llm_summaries.append(row)
+
+    llm_file = f"{history_dir}/llm_anomalies_{today}.json"
     with open(llm_file, "w") as f:
-        json.dump(llm_summaries, f, indent=2)
-    print(f"🧠 LLM summaries saved to {llm_file}")
-
-# Save a simplified JSON for graphing directly (charting in Lovable)
-chart_data = plot_df[['ticker', 'z_score']].to_dict(orient="records")
-with open(f"{HISTORY_DIR}/graph_data_{today}.json", "w") as f:
-    json.dump(chart_data, f, indent=2)
-print("📊 Saved chart-ready JSON for Lovable")
+        json.dump(llm_summaries, f, indent=2, default=str)
+    stats = client.stats()
+    print(f"🧠 LLM summaries saved to {llm_file} ({stats['calls']} calls, {stats['cache_hits']} cached, "
+          f"{stats['prompt_tokens'] + stats['completion_tokens']} tokens, slowest {stats['latency_max']:.1f}s)")
+    return llm_summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan options volume across a ticker universe")
+    parser.add_argument("--universe", help="ticker file (one per line) or CSV; default: S&P 500 from Wikipedia")
+    parser.add_argument("--max-tickers", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--moneyness", type=float, nargs=2, default=MONEYNESS_BAND, metavar=("LO", "HI"))
+    parser.add_argument("--delta-band", type=float, nargs=2, default=None, metavar=("LO", "HI"))
+    parser.add_argument("--synthetic", action="store_true", help="use the offline synthetic data source")
+    parser.add_argument("--history-dir", default=HISTORY_DIR)
+    parser.add_argument("--per-strike", action="store_true", help="also score volume per strike")
+    parser.add_argument("--chain-store", metavar="DIR", default=None,
+                        help="also snapshot the fetched chains for options_backtest")
+    parser.add_argument("--llm-provider", choices=["openai", "huggingface", "stub"], default=None,
+                        help="default: openai when OPENAI_API_KEY is set")
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    os.makedirs(args.history_dir, exist_ok=True)
+    today = datetime.today().strftime("%Y-%m-%d")
+
+    source = None
+    if args.synthetic:
+        from synthetic_data import SyntheticChainSource
+        source = SyntheticChainSource()
+    tickers = load_universe(args.universe)
+    # watchlist names go first so --max-tickers never cuts them off
+    tickers = [t for t in WATCHLIST if t in tickers] + [t for t in tickers if t not in WATCHLIST]
+    tickers = tickers[:args.max_tickers] if args.max_tickers else tickers
+
+    store = None
+    if args.chain_store:
+        from chain_store import ChainStore
+        store = ChainStore(args.chain_store)
+    today_results, _, _, strikes = scan_universe(tickers, source=source, max_workers=args.workers,
+                                                 moneyness=args.moneyness, delta_band=args.delta_band,
+                                                 return_strikes=True, store=store)
+
+    df_final_today, anomalies_detected = detect_anomalies(
+        today_results, today, args.history_dir, strikes if args.per_strike else None)
+    plot_anomalies(df_final_today, today, args.history_dir)
+
+    # LLM Summary and Trade Idea
+    if args.llm_provider or "OPENAI_API_KEY" in os.environ:
+        from llm_client import LLMClient
+        summarize_with_llm(anomalies_detected, today, args.history_dir,
+                           LLMClient(args.llm_provider, concurrency=args.llm_concurrency))
+
+    # Save a simplified JSON for graphing directly (charting in Lovable)
+    with open(f"{args.history_dir}/graph_data_{today}.json", "w") as f:
+        json.dump(chart_data(df_final_today), f, indent=2)
+    print("📊 Saved chart-ready JSON for Lovable")
+
+
+if __name__ == "__main__":
+    main()
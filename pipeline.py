@@ -0,0 +1,328 @@
+# pipeline.py
+# Declarative company-data pipeline. Each stage names its inputs; a stage's cache
+# key is the hash of its function, params and the *content* of its inputs, so a
+# stage only reruns when something it depends on actually changed. Stages whose
+# inputs are ready run concurrently (insider and options fetches overlap), and
+# --tickers fans the same per-ticker DAG out across a universe.
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import pandas as pd
+
+from data_fetch import YahooChainSource
+from feature_store import FeatureStore
+from fetch_form4_insider import Form4Store, SecClient, insider_sell_7d, lookup_ciks
+from instrumentation import stage as timed_stage
+from market_cache import MarketDataCache
+from run_regression import FEATURES, PANEL_COLUMNS, TARGET, fit_ols, summarize
+from utils import merge_external_data, save_company_data
+
+DATA_DIR = "data/"
+OUTPUT_DIR = "output/regression_results/"
+PIPELINE_CACHE_DIR = os.getenv("PIPELINE_CACHE_DIR", ".cache/pipeline")
+REPORT_COLUMNS = ["stage", "status", "seconds", "rows", "digest"]
+# how each source lines up with the macro dates: insider sums go stale after their
+# 7-day window (no filings since then means no selling), options snapshots after 5 days
+FEATURE_SOURCES = {
+    "macro": {"spine": True},
+    "insider": {"tolerance": "7D", "fill": 0.0},
+    "options": {"tolerance": "5D"},
+}
+
+
+class Stage:
+    # fn(*input_values, **params, **resources). params are part of the cache key,
+    # resources (shared clients, sessions) are not. ttl (seconds) bounds how long a
+    # cached output is trusted; None means it only changes when its inputs do.
+    def __init__(self, name, fn, inputs=(), params=None, resources=None, ttl=None, version=1,
+                 allow_failed_inputs=False):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.resources = resources or {}
+        self.ttl = ttl
+        self.version = version
+        self.allow_failed_inputs = allow_failed_inputs
+
+    def key(self, input_digests):
+        raw = json.dumps([self.name, f"{self.fn.__module__}.{self.fn.__qualname__}", self.version,
+                          self.params, input_digests], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def content_digest(value):
+    h = hashlib.sha1()
+    if isinstance(value, pd.DataFrame):
+        h.update(json.dumps([list(map(str, value.columns)), list(map(str, value.dtypes))]).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _rows(value):
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+
+class Pipeline:
+    def __init__(self, stages, cache=None, max_workers=8):
+        self.stages = {s.name: s for s in stages}
+        for s in stages:
+            missing = [i for i in s.inputs if i not in self.stages]
+            if missing:
+                raise ValueError(f"stage {s.name} has unknown inputs {missing}")
+        self.cache = cache or MarketDataCache(PIPELINE_CACHE_DIR, max_bytes=2 * 1024 ** 3)
+        self.cache.ttl.update({s.name: s.ttl for s in stages})
+        self.max_workers = max_workers
+        self.keys, self.errors, self._values = {}, {}, {}
+
+    def _cached(self, stage, key):
+        meta = self.cache.index.get(MarketDataCache.key(stage.name, stage.name, {"key": key}))
+        if meta is None or not os.path.exists(meta["path"]):
+            return None
+        if stage.ttl is not None and time.time() - meta["created"] > stage.ttl:
+            return None
+        return meta
+
+    def _value(self, name):
+        # outputs of cached stages are only loaded when a downstream stage has to run
+        if name not in self._values:
+            stored = self.cache.get(name, name, {"key": self.keys[name]})
+            if stored is None:
+                raise KeyError(f"cached output of {name} is gone")
+            self._values[name] = stored if isinstance(stored, pd.DataFrame) else stored["value"]
+        return self._values[name]
+
+    def _run_stage(self, stage, key):
+        t0 = time.perf_counter()
+        args = [None if i in self.errors else self._value(i) for i in stage.inputs]
+        with timed_stage(stage.name):
+            value = stage.fn(*args, **stage.params, **stage.resources)
+        digest = content_digest(value)
+        stored = value if isinstance(value, pd.DataFrame) else {"value": value}
+        self.cache.put(stage.name, stage.name, {"key": key}, stored, digest=digest, rows=_rows(value))
+        self._values[stage.name] = value
+        return digest, _rows(value), time.perf_counter() - t0
+
+    def run(self, targets=None, force=()):
+        # Runs every stage needed for `targets` (default: all) and returns the report,
+        # one row per stage. A failed stage marks everything downstream skipped,
+        # except stages built with allow_failed_inputs, which receive None for it.
+        needed = self._closure(targets or list(self.stages))
+        self.keys, self.errors, self._values = {}, {}, {}
+        digests, report = {}, {}
+        pending = {n: self.stages[n] for n in needed}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                progressed = False
+                for name, stage in list(pending.items()):
+                    if not all(i in digests or i in self.errors for i in stage.inputs):
+                        continue
+                    del pending[name]
+                    progressed = True
+                    if not stage.allow_failed_inputs and any(i in self.errors for i in stage.inputs):
+                        self.errors[name] = "upstream failed"
+                        report[name] = {"stage": name, "status": "skipped"}
+                        continue
+                    key = self.keys[name] = stage.key([digests.get(i, "failed") for i in stage.inputs])
+                    meta = None if name in force else self._cached(stage, key)
+                    if meta is not None:
+                        digests[name] = meta["digest"]
+                        report[name] = {"stage": name, "status": "cached", "seconds": 0.0,
+                                        "rows": meta.get("rows"), "digest": meta["digest"][:12]}
+                    else:
+                        running[pool.submit(self._run_stage, stage, key)] = name
+                if progressed:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        digest, rows, seconds = fut.result()
+                    except Exception as e:
+                        self.errors[name] = e
+                        report[name] = {"stage": name, "status": "failed", "error": repr(e)}
+                        continue
+                    digests[name] = digest
+                    report[name] = {"stage": name, "status": "ran", "seconds": round(seconds, 3),
+                                    "rows": rows, "digest": digest[:12]}
+        columns = REPORT_COLUMNS + (["error"] if any("error" in r for r in report.values()) else [])
+        report = pd.DataFrame([report[n] for n in self.stages if n in report]).reindex(columns=columns)
+        return report.astype({"rows": "Int64"})
+
+    def output(self, name):
+        # value of a stage from the last run, loaded from the cache if it was not rerun
+        return self._value(name)
+
+    def _closure(self, targets):
+        needed, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.stages[name].inputs)
+        return needed
+
+
+# --- Stage functions ---
+def fetch_options_data_yf(ticker, source=None, asof=None):
+    source = source or YahooChainSource()
+    expiry = source.expirations(ticker)[0]
+    calls, puts = source.chain(ticker, expiry)
+    call_vol = calls['volume'].sum()
+    put_vol = puts['volume'].sum()
+    call_put_vol_ratio = call_vol / put_vol if put_vol > 0 else 1
+    iv = calls['impliedVolatility'].mean()
+    today = pd.Timestamp(asof) if asof else pd.to_datetime("today").normalize()
+    return pd.DataFrame([{
+        "date": today,
+        "implied_volatility_30d": iv,
+        "call_put_vol_ratio": call_put_vol_ratio
+    }]).set_index("date")
+
+
+def generate_macro_stock_data(start_date, days=60):
+    # synthetic macro + return series (placeholder for a real macro feed)
+    dates = [pd.Timestamp(start_date) + timedelta(days=i) for i in range(days)]
+    df = pd.DataFrame({
+        "date": dates,
+        "stock_return": [0.001 * ((i % 5) - 2) for i in range(days)],
+        "interest_rate": [0.04 + 0.002 * (i % 3) for i in range(days)],
+        "inflation": [0.02 + 0.001 * (i % 4) for i in range(days)],
+        "sentiment_score": [0.7 + 0.05 * ((i % 4) - 2) for i in range(days)],
+        "trading_volume": [1.1e7 + 5e5 * ((i % 6) - 3) for i in range(days)],
+        "institutional_net_buy": [-100000 + 5000 * ((i % 5) - 2) for i in range(days)],
+    })
+    df['date'] = pd.to_datetime(df['date'])
+    df.set_index('date', inplace=True)
+    return df
+
+
+def resolve_ciks(tickers, client=None, asof=None):
+    ciks = lookup_ciks(tickers, client)
+    return pd.DataFrame({"ticker": list(ciks), "cik": list(ciks.values())})
+
+
+def fetch_insider(ciks, ticker, store=None, client=None, asof=None):
+    match = ciks.loc[ciks["ticker"] == ticker, "cik"]
+    if match.empty:
+        raise KeyError(f"no CIK for {ticker}")
+    return insider_sell_7d(match.iloc[0], store=store, client=client, ticker=ticker)
+
+
+def join_features(macro, insider, options, ticker=None, store=None):
+    # point-in-time: each macro date gets the latest insider / options values dated on
+    # or before it. With a FeatureStore the observations are appended to the ticker's
+    # sources and its materialized table is returned, so options snapshots from
+    # earlier runs stay in the history.
+    frames = {"macro": macro, "insider": insider, "options": options}
+    if store is not None:
+        for name, frame in frames.items():
+            store.write(ticker, name, frame, **FEATURE_SOURCES[name])
+        store.materialize(ticker)
+        return store.load(ticker)
+    out = macro
+    for name in ("insider", "options"):
+        config = FEATURE_SOURCES[name]
+        out = merge_external_data(out, frames[name], tolerance=config.get("tolerance"))
+        if config.get("fill") is not None:
+            out[frames[name].columns] = out[frames[name].columns].fillna(config["fill"])
+    return out
+
+
+def save_features(df, path):
+    save_company_data(df, path)
+    return {"path": path, "rows": len(df)}
+
+
+def regress(df, ticker, output_dir=OUTPUT_DIR, summary=True):
+    complete = df.dropna(subset=FEATURES + [TARGET])
+    if complete.empty:
+        raise ValueError(f"{ticker}: no dates with every feature present")
+    if summary:
+        summarize(df, ticker, output_dir)
+    return fit_ols(df, ticker=ticker)
+
+
+def collect_panel(*panels, path):
+    # failed tickers arrive as None
+    frames = [p for p in panels if p is not None and len(p)]
+    panel = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PANEL_COLUMNS)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    panel.to_parquet(path, index=False)
+    return panel
+
+
+def company_stages(ticker, start_date, asof, data_dir=DATA_DIR, output_dir=OUTPUT_DIR, summary=True,
+                   sec=None, store=None, source=None, features=None):
+    # one ticker's DAG; stage names are prefixed so many tickers share one Pipeline
+    p = f"{ticker}/"
+    day = f"{asof:%Y-%m-%d}"
+    return [
+        Stage(p + "macro", generate_macro_stock_data, params={"start_date": f"{start_date:%Y-%m-%d}"}),
+        # fetches are keyed by day and re-checked every few hours
+        Stage(p + "insider", fetch_insider, inputs=["ciks"], params={"ticker": ticker, "asof": day},
+              resources={"store": store, "client": sec}, ttl=6 * 3600),
+        Stage(p + "options", fetch_options_data_yf, params={"ticker": ticker, "asof": day},
+              resources={"source": source}, ttl=3600),
+        Stage(p + "features", join_features, inputs=[p + "macro", p + "insider", p + "options"],
+              params={"ticker": ticker}, resources={"store": features}),
+        Stage(p + "save", save_features, inputs=[p + "features"],
+              params={"path": os.path.join(data_dir, f"{ticker}.xlsx")}),
+        Stage(p + "regress", regress, inputs=[p + "features"],
+              params={"ticker": ticker, "output_dir": output_dir, "summary": summary}),
+    ]
+
+
+def build_pipeline(tickers, days=60, data_dir=DATA_DIR, output_dir=OUTPUT_DIR, summary=True,
+                   max_workers=8, cache=None, sec=None, source=None):
+    today = pd.Timestamp.today().normalize()
+    start_date = today - timedelta(days=days)
+    # shared clients so every ticker draws from the same SEC / Yahoo rate limits
+    sec = sec or SecClient(pool_size=max_workers)
+    source = source or YahooChainSource()
+    store = Form4Store()
+    features = FeatureStore(os.path.join(data_dir, "features"))
+    stages = [Stage("ciks", resolve_ciks, params={"tickers": sorted(tickers), "asof": f"{today:%Y-%m-%d}"},
+                    resources={"client": sec}, ttl=24 * 3600)]
+    for t in tickers:
+        stages += company_stages(t, start_date, today, data_dir, output_dir, summary, sec, store, source, features)
+    stages.append(Stage("panel", collect_panel, inputs=[f"{t}/regress" for t in tickers],
+                        params={"path": os.path.join(output_dir, "panel.parquet")}, allow_failed_inputs=True))
+    return Pipeline(stages, cache=cache, max_workers=max_workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Company data pipeline: fetch, join, save, regress")
+    parser.add_argument("--tickers", nargs="+", default=["AAPL"])
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-summary", action="store_true", help="skip statsmodels summary text")
+    parser.add_argument("--force", nargs="*", default=[], help="stage names to rerun regardless of cache")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    tickers = [t.upper() for t in args.tickers]
+    pipeline = build_pipeline(tickers, args.days, args.data_dir, args.output_dir, not args.no_summary,
+                              args.workers)
+    t0 = time.perf_counter()
+    report = pipeline.run(force=args.force)
+    print(report.to_string(index=False))
+    print(f"{len(report)} stages in {time.perf_counter() - t0:.2f}s, "
+          f"{(report['status'] == 'ran').sum()} ran, {(report['status'] == 'cached').sum()} cached")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,170 @@
 # 8. portfolio_manager.py
+import numpy as np
 import pandas as pd
+from scipy.special import ndtr
 
+from greeks import chain_greeks
+from instrumentation import timed
+
+@timed(rows=True)
 def rank_trades(trade_data):
     df = pd.DataFrame(trade_data)
     df['risk_reward'] = df['expected_gain'] / df['max_loss']
     df_sorted = df.sort_values(by='risk_reward', ascending=False)
     return df_sorted
+
+
+# --- Position book ---
+BOOK_GREEKS = ["delta", "gamma", "vega", "theta"]
+LEG_FIELDS = {"und": np.int32, "call": bool, "stock": bool, "strike": float, "expiry_t": float,
+              "qty": float, "mult": float, "iv": float, "active": bool}
+
+
+class PositionBook:
+    # Columnar book of option/stock legs across many underlyings. Net greeks per
+    # underlying are kept as running sums: adding or removing a leg only prices that
+    # leg. Book greeks are in position units: delta in shares, gamma in shares per
+    # $1, vega in $ per vol point, theta in $ per calendar day.
+    def __init__(self, spots=None, r=0.04, capacity=1024):
+        self.r = r
+        self.underlyings = []
+        self.spot = np.zeros(0)
+        self.legs = {name: np.zeros(capacity, dtype=dt) for name, dt in LEG_FIELDS.items()}
+        self.contrib = np.zeros((capacity, len(BOOK_GREEKS)))
+        self.net = np.zeros((0, len(BOOK_GREEKS)))
+        self.free = list(range(capacity - 1, -1, -1))
+        for und, S in (spots or {}).items():
+            self.set_spot(und, S)
+
+    def __len__(self):
+        return int(self.legs["active"].sum())
+
+    def _und_index(self, underlying):
+        if underlying not in self.underlyings:
+            self.underlyings.append(underlying)
+            self.spot = np.append(self.spot, np.nan)
+            self.net = np.vstack([self.net, np.zeros(len(BOOK_GREEKS))])
+        return self.underlyings.index(underlying)
+
+    def _grow(self):
+        cap = len(self.legs["active"])
+        for name, arr in self.legs.items():
+            self.legs[name] = np.concatenate([arr, np.zeros(cap, dtype=arr.dtype)])
+        self.contrib = np.vstack([self.contrib, np.zeros_like(self.contrib)])
+        self.free.extend(range(2 * cap - 1, cap - 1, -1))
+
+    def _leg_greeks(self, slots):
+        legs = self.legs
+        S = self.spot[legs["und"][slots]]
+        g = chain_greeks(S, legs["strike"][slots], legs["expiry_t"][slots], self.r, legs["iv"][slots],
+                         legs["call"][slots])
+        stock = legs["stock"][slots]
+        per_unit = np.column_stack([
+            np.where(stock, 1.0, g["delta"]),
+            np.where(stock, 0.0, g["gamma"]),
+            np.where(stock, 0.0, g["vega"] / 100),
+            np.where(stock, 0.0, g["theta"] / 365),
+        ])
+        return per_unit * (legs["qty"][slots] * legs["mult"][slots])[:, None]
+
+    def add(self, underlying, option_type, qty, strike=np.nan, T=0.0, iv=0.0, multiplier=None):
+        # option_type: 'call', 'put' or 'stock'; T in years. Returns the leg id.
+        if not self.free:
+            self._grow()
+        slot = self.free.pop()
+        u = self._und_index(underlying)
+        stock = option_type == "stock"
+        values = {"und": u, "call": option_type == "call", "stock": stock,
+                  "strike": 1.0 if stock else strike, "expiry_t": T, "qty": qty,
+                  "mult": multiplier if multiplier is not None else (1.0 if stock else 100.0),
+                  "iv": iv, "active": True}
+        for name, v in values.items():
+            self.legs[name][slot] = v
+        self.contrib[slot] = self._leg_greeks(np.array([slot]))[0]
+        self.net[u] += self.contrib[slot]
+        return slot
+
+    def remove(self, leg_id):
+        if not self.legs["active"][leg_id]:
+            raise KeyError(f"leg {leg_id} is not in the book")
+        self.net[self.legs["und"][leg_id]] -= self.contrib[leg_id]
+        self.contrib[leg_id] = 0.0
+        self.legs["active"][leg_id] = False
+        self.free.append(leg_id)
+
+    def set_spot(self, underlying, S):
+        # a spot move changes every greek on that name: reprice only its legs
+        u = self._und_index(underlying)
+        self.spot[u] = S
+        slots = np.flatnonzero(self.legs["active"] & (self.legs["und"] == u))
+        if len(slots):
+            self.contrib[slots] = self._leg_greeks(slots)
+        self.net[u] = self.contrib[slots].sum(axis=0)
+
+    def set_vols(self, underlying, surface):
+        # re-mark every leg on `underlying` from a vol_surface.VolSurface so greeks and
+        # scenarios share one consistent set of vols
+        u = self._und_index(underlying)
+        slots = np.flatnonzero(self.legs["active"] & (self.legs["und"] == u) & ~self.legs["stock"])
+        if len(slots):
+            iv = surface.iv(self.legs["strike"][slots], self.legs["expiry_t"][slots])
+            self.legs["iv"][slots] = np.where(np.isfinite(iv), iv, self.legs["iv"][slots])
+            self.contrib[slots] = self._leg_greeks(slots)
+        self.net[u] = self.contrib[self.legs["active"] & (self.legs["und"] == u)].sum(axis=0)
+
+    def net_greeks(self):
+        df = pd.DataFrame(self.net, index=pd.Index(self.underlyings, name="underlying"), columns=BOOK_GREEKS)
+        df.loc["TOTAL"] = df.sum()
+        return df
+
+    def scenario_grid(self, spot_shocks=np.linspace(-0.2, 0.2, 21), vol_shocks=np.linspace(-0.1, 0.1, 11),
+                      days=(0, 1, 7)):
+        # Reprices every active leg on spot shocks (relative) x vol shocks (absolute
+        # vol points) x elapsed days in one broadcast pass. Returns P&L with shape
+        # (underlyings, spot shocks, vol shocks, days) plus the total book matrix.
+        slots = np.flatnonzero(self.legs["active"])
+        legs = {name: arr[slots] for name, arr in self.legs.items()}
+        units = legs["qty"] * legs["mult"]
+        S0 = self.spot[legs["und"]]
+        K = legs["strike"]
+        ss = np.asarray(spot_shocks, dtype=float)
+        dt = np.asarray(days, dtype=float) / 365
+
+        opt = ~legs["stock"]
+        n_und = len(self.underlyings)
+        shape = (len(ss), len(vol_shocks), len(dt))
+        # stock legs are linear in spot and need no repricing
+        stock_pnl = np.zeros((n_und, len(ss)))
+        np.add.at(stock_pnl, legs["und"][~opt], np.outer(S0[~opt] * units[~opt], ss))
+        pnl = np.broadcast_to(stock_pnl[:, :, None, None], (n_und,) + shape).copy()
+
+        if opt.any():
+            S0, K, units = S0[opt], K[opt], units[opt]
+            base = chain_greeks(S0, K, legs["expiry_t"][opt], self.r, legs["iv"][opt], legs["call"][opt])["price"]
+            # log-moneyness is (leg, spot) and vol/time terms are (leg, vol, day); only the
+            # final combination runs at full (leg, spot, vol, day) size
+            sign = np.where(legs["call"][opt], 1.0, -1.0)[:, None, None, None]
+            S = (S0[:, None] * (1 + ss))[:, :, None, None]
+            log_m = np.log(S0[:, None] * (1 + ss) / K[:, None])[:, :, None, None]
+            tau = np.maximum(legs["expiry_t"][opt][:, None] - dt, 0.0)[:, None, :]
+            vol = np.maximum(legs["iv"][opt][:, None] + np.asarray(vol_shocks, dtype=float), 1e-4)[:, :, None]
+            vst = vol * np.sqrt(tau)
+            inv = (1 / np.maximum(vst, 1e-12))[:, None]
+            drift = ((self.r + 0.5 * vol * vol) * tau)[:, None]
+            d1 = (log_m + drift) * inv
+            d2 = d1 - vst[:, None]
+            k_disc = (K[:, None, None] * np.exp(-self.r * tau))[:, None]
+            price = sign * (S * ndtr(sign * d1) - k_disc * ndtr(sign * d2))
+            leg_pnl = ((price - base[:, None, None, None]) * units[:, None, None, None]).reshape(len(K), -1)
+            # per-underlying sums as one matrix product instead of a scatter-add
+            owner = np.zeros((n_und, len(K)))
+            owner[legs["und"][opt], np.arange(len(K))] = 1.0
+            pnl += (owner @ leg_pnl).reshape((n_und,) + shape)
+        return pnl, pnl.sum(axis=0)
+
+    def risk_matrix(self, spot_shocks=np.linspace(-0.2, 0.2, 21), vol_shocks=np.linspace(-0.1, 0.1, 11),
+                    day=0):
+        # total-book P&L table for one time step: rows spot shock, columns vol shock
+        _, total = self.scenario_grid(spot_shocks, vol_shocks, (day,))
+        return pd.DataFrame(total[:, :, 0], index=pd.Index(spot_shocks, name="spot_shock"),
+                            columns=pd.Index(vol_shocks, name="vol_shock"))
@@ -1,34 +1,212 @@
+# run_regression.py
+# Factor regressions of stock_return on the company feature set, for one frame or
+# for many tickers in a process pool. Besides the full-sample fit there is a
+# rolling / expanding mode that reuses cumulative sums of X'X and X'y, so every
+# window costs one small k x k solve instead of a refit. All results go to one
+# long-format Parquet panel; statsmodels summary text is only rendered on request.
+import argparse
+import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-from analysis.utils import load_company_data
 
-COMPANIES = ['AAPL']
+from instrumentation import timed
+from utils import load_company_data
+
 DATA_DIR = 'data/'
 OUTPUT_DIR = 'output/regression_results/'
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-features = [
+TARGET = 'stock_return'
+FEATURES = [
     'interest_rate', 'inflation', 'sentiment_score',
     'trading_volume', 'insider_sell_7d', 'institutional_net_buy',
     'implied_volatility_30d', 'call_put_vol_ratio'
 ]
+PANEL_COLUMNS = ["ticker", "mode", "date", "term", "coef", "stderr", "tstat", "r2", "nobs"]
+
+
+def _design(df, features, target):
+    df = df.dropna(subset=features + [target])
+    X = np.column_stack([np.ones(len(df)), df[features].to_numpy(float)])
+    return df.index, X, df[target].to_numpy(float)
+
+
+def _solve(xtx, xty, yty, ysum, n):
+    # stacked normal equations -> coef, stderr, r2 for every window at once
+    k = xtx.shape[-1]
+    try:
+        inv = np.linalg.inv(xtx)
+    except np.linalg.LinAlgError:
+        inv = np.linalg.pinv(xtx)
+    beta = np.einsum("...ij,...j->...i", inv, xty)
+    rss = np.maximum(yty - np.einsum("...i,...i->...", beta, xty), 0.0)
+    tss = yty - ysum * ysum / n
+    dof = n - k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma2 = np.where(dof > 0, rss / dof, np.nan)
+        stderr = np.sqrt(np.maximum(np.diagonal(inv, axis1=-2, axis2=-1), 0.0) * sigma2[..., None])
+        r2 = np.where(tss > 0, 1 - rss / tss, np.nan)
+    return beta, stderr, r2
+
+
+def _panel(ticker, mode, dates, terms, beta, stderr, r2, nobs):
+    k = len(terms)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tstat = beta / stderr
+    return pd.DataFrame({
+        "ticker": ticker,
+        "mode": mode,
+        "date": np.repeat(np.asarray(dates), k),
+        "term": np.tile(terms, len(dates)),
+        "coef": beta.ravel(),
+        "stderr": stderr.ravel(),
+        "tstat": tstat.ravel(),
+        "r2": np.repeat(r2, k),
+        "nobs": np.repeat(nobs, k),
+    })
+
+
+@timed()
+def fit_ols(df, features=FEATURES, target=TARGET, ticker=None):
+    # full-sample OLS; one panel row per term, dated at the last observation
+    index, X, y = _design(df, features, target)
+    if len(y) == 0:
+        return pd.DataFrame(columns=PANEL_COLUMNS)
+    beta, stderr, r2 = _solve(X.T @ X, X.T @ y, y @ y, y.sum(), len(y))
+    terms = ["const"] + list(features)
+    return _panel(ticker, "full", index[-1:], terms, beta[None], stderr[None], np.atleast_1d(r2), [len(y)])
+
+
+@timed()
+def rolling_ols(df, features=FEATURES, target=TARGET, window=None, min_periods=None, ticker=None):
+    # window=None is an expanding fit. Windows count usable observations (rows
+    # left after dropping NaNs), matching pandas rolling on the cleaned frame.
+    index, X, y = _design(df, features, target)
+    T, k = X.shape
+    min_periods = min_periods or window or k + 1
+    if T < min_periods:
+        return pd.DataFrame(columns=PANEL_COLUMNS)
+
+    def cum(a):
+        return np.concatenate([np.zeros((1,) + a.shape[1:]), np.cumsum(a, axis=0)])
+
+    # running sums of the rank-one updates x x', x y, y y
+    c_xtx = cum(X[:, :, None] * X[:, None, :])
+    c_xty = cum(X * y[:, None])
+    c_yty = cum(y * y)
+    c_y = cum(y)
+    end = np.arange(min_periods, T + 1)
+    start = np.zeros_like(end) if window is None else np.maximum(end - window, 0)
+    n = (end - start).astype(float)
+    beta, stderr, r2 = _solve(c_xtx[end] - c_xtx[start], c_xty[end] - c_xty[start],
+                              c_yty[end] - c_yty[start], c_y[end] - c_y[start], n)
+    mode = "expanding" if window is None else f"rolling_{window}"
+    return _panel(ticker, mode, index[end - 1], ["const"] + list(features), beta, stderr, r2, n.astype(int))
+
+
+def summarize(df, ticker, output_dir=OUTPUT_DIR, features=FEATURES, target=TARGET):
+    # full statsmodels summary, written next to the panel; slow, so opt-in
+    import statsmodels.api as sm
+
+    df = df.dropna(subset=features + [target])
+    model = sm.OLS(df[target], sm.add_constant(df[features])).fit()
+    text = model.summary().as_text()
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, f"{ticker}_regression.txt"), "w") as f:
+        f.write(text)
+    return text
+
+
+@timed()
+def regress_ticker(ticker, data_dir=DATA_DIR, mode="full", window=None, summary=False,
+                   output_dir=OUTPUT_DIR, features=FEATURES, target=TARGET, store=None):
+    # store: a feature_store root; its materialized table replaces the company file
+    if store is not None:
+        from feature_store import FeatureStore
+        df = FeatureStore(store).load(ticker, columns=features + [target])
+    else:
+        df = load_company_data(os.path.join(data_dir, f"{ticker}.xlsx"), columns=features + [target])
+    if mode == "full":
+        panel = fit_ols(df, features, target, ticker)
+    else:
+        panel = rolling_ols(df, features, target, window if mode == "rolling" else None, ticker=ticker)
+    if summary:
+        summarize(df, ticker, output_dir, features, target)
+    return panel
+
+
+def _regress_task(args):
+    ticker, kwargs = args
+    try:
+        return ticker, regress_ticker(ticker, **kwargs), None
+    except Exception as e:
+        return ticker, None, e
+
+
+@timed(rows=True)
+def run_regressions(tickers, data_dir=DATA_DIR, mode="full", window=None, summary=False,
+                    output_dir=OUTPUT_DIR, workers=None, errors=None, out_file="panel.parquet", store=None):
+    # Fits every ticker in a process pool (workers=1 runs inline) and writes one
+    # long-format panel to output_dir/out_file. Failures are collected in `errors`.
+    if mode == "rolling" and not window:
+        raise ValueError("rolling mode needs a window")
+    errors = {} if errors is None else errors
+    kwargs = dict(data_dir=data_dir, mode=mode, window=window, summary=summary, output_dir=output_dir, store=store)
+    tasks = [(t, kwargs) for t in tickers]
+    if workers == 1:
+        results = list(map(_regress_task, tasks))
+    else:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_regress_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    frames = []
+    for ticker, panel, err in results:
+        if err is not None:
+            errors[ticker] = err
+        elif len(panel):
+            frames.append(panel)
+    panel = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=PANEL_COLUMNS)
+    if out_file:
+        os.makedirs(output_dir, exist_ok=True)
+        panel.to_parquet(os.path.join(output_dir, out_file), index=False)
+    return panel
+
+
+def available_tickers(data_dir=DATA_DIR):
+    stems = {os.path.splitext(os.path.basename(p))[0]
+             for p in glob.glob(os.path.join(data_dir, "*.xlsx")) + glob.glob(os.path.join(data_dir, "*.parquet"))}
+    return sorted(stems)
 
-def run_regression(ticker):
-    filepath = os.path.join(DATA_DIR, f"{ticker}.xlsx")
-    df = load_company_data(filepath)
-    df = df.dropna(subset=features + ['stock_return'])
 
-    X = df[features]
-    y = df['stock_return']
-    X = sm.add_constant(X)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Factor regressions across tickers")
+    parser.add_argument("--tickers", nargs="*", help="default: every dataset in --data-dir")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--mode", choices=["full", "rolling", "expanding"], default="full")
+    parser.add_argument("--window", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--summary", action="store_true", help="also write statsmodels summary text")
+    parser.add_argument("--feature-store", metavar="DIR", default=None,
+                        help="read materialized features (feature_store.py) instead of company files")
+    args = parser.parse_args(argv)
 
-    model = sm.OLS(y, X).fit()
-    print(f"--- {ticker} ---")
-    print(model.summary())
+    if args.tickers:
+        tickers = args.tickers
+    elif args.feature_store:
+        from feature_store import FeatureStore
+        tickers = FeatureStore(args.feature_store).tickers()
+    else:
+        tickers = available_tickers(args.data_dir)
+    errors = {}
+    panel = run_regressions(tickers, args.data_dir, args.mode, args.window, args.summary,
+                            args.output_dir, args.workers, errors, store=args.feature_store)
+    print(f"{panel['ticker'].nunique()} tickers, {len(panel)} rows -> "
+          f"{os.path.join(args.output_dir, 'panel.parquet')}")
+    for ticker, err in errors.items():
+        print(f"{ticker}: {err}")
 
-    with open(os.path.join(OUTPUT_DIR, f"{ticker}_regression.txt"), "w") as f:
-        f.write(model.summary().as_text())
 
-for ticker in COMPANIES:
-    run_regression(ticker)
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,271 @@
- 3. signals.py
-def compute_signals(stock_df):
+# 3. signals.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+@timed(rows=True)
+def compute_signals(stock_df, fast=20, slow=50):
     signals = pd.DataFrame(index=stock_df.index)
     signals['price'] = stock_df['Close']
-    signals['sma20'] = stock_df['Close'].rolling(window=20).mean()
-    signals['sma50'] = stock_df['Close'].rolling(window=50).mean()
-    signals['signal'] = 0
-    signals['signal'][signals['sma20'] > signals['sma50']] = 1
-    signals['signal'][signals['sma20'] < signals['sma50']] = -1
+    signals[f'sma{fast}'] = stock_df['Close'].rolling(window=fast).mean()
+    signals[f'sma{slow}'] = stock_df['Close'].rolling(window=slow).mean()
+    signals['signal'] = np.sign(signals[f'sma{fast}'] - signals[f'sma{slow}']).fillna(0).astype(int)
     return signals
+
+
+def windowed(x, w):
+    # trailing w-row sums of x along axis 0 from cumulative sums, with the number of
+    # finite values in each window (NaNs count as missing, not as zero)
+    ok = np.isfinite(x)
+    cs = np.cumsum(np.concatenate([np.zeros((1,) + x.shape[1:]), np.where(ok, x, 0.0)]), axis=0)
+    cn = np.cumsum(np.concatenate([np.zeros((1,) + x.shape[1:], dtype=np.int64), ok]), axis=0)
+    return cs[w:] - cs[:-w], cn[w:] - cn[:-w]
+
+
+# --- Panel engine ---
+# The same rule plus EMAs, rolling volatility and RSI for a whole (dates x tickers)
+# close panel. run() does the history in one vectorized pass and leaves the carried
+# state (ring buffers, running sums, EMA/RSI recursions) at the last row; update()
+# then appends one bar in O(1) per ticker, and save()/load() checkpoint the state.
+# A NaN close is a missing bar: window indicators need a full window of closes,
+# EMAs carry through it, and RSI skips the change.
+SMA_WINDOWS = (20, 50)
+EMA_SPANS = (12, 26)
+VOL_WINDOW = 20
+RSI_PERIOD = 14
+PERIODS_PER_YEAR = 252
+# per-ticker state (ticker axis last) and the value a new ticker starts from
+_FILL = {"px": np.nan, "ret": np.nan, "sma_sum": 0.0, "sma_n": 0, "ret_sum": 0.0, "ret_sq": 0.0, "ret_n": 0,
+         "ema": np.nan, "gain": 0.0, "loss": 0.0, "changes": 0, "prev": np.nan, "prev_signal": 0}
+_CARRIED = ("sma_sum", "sma_n", "ret_sum", "ret_sq", "ret_n", "ema", "gain", "loss", "changes", "prev", "prev_signal")
+
+
+class SignalEngine:
+    def __init__(self, sma=SMA_WINDOWS, ema=EMA_SPANS, vol_window=VOL_WINDOW, rsi_period=RSI_PERIOD,
+                 periods_per_year=PERIODS_PER_YEAR):
+        # sma[0] / sma[-1] (after sorting) are the fast / slow pair behind signal and cross
+        self.sma_windows = tuple(sorted(int(w) for w in sma))
+        self.ema_spans = tuple(int(s) for s in ema)
+        self._alpha = 2.0 / (np.array(self.ema_spans, dtype=float)[:, None] + 1)
+        self.vol_window, self.rsi_period = int(vol_window), int(rsi_period)
+        self.periods_per_year = periods_per_year
+        self._reset(pd.Index([], dtype=object))
+
+    @property
+    def columns(self):
+        return ([f"sma{w}" for w in self.sma_windows] + [f"ema{s}" for s in self.ema_spans]
+                + [f"vol{self.vol_window}", f"rsi{self.rsi_period}", "signal", "cross"])
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def _shape(self, name):
+        return {"px": (max(self.sma_windows),), "ret": (self.vol_window,), "sma_sum": (len(self.sma_windows),),
+                "sma_n": (len(self.sma_windows),), "ema": (len(self.ema_spans),)}.get(name, ())
+
+    def _empty(self, name, n):
+        fill = _FILL[name]
+        return np.full(self._shape(name) + (n,), fill, dtype=float if isinstance(fill, float) else np.int64)
+
+    def _reset(self, tickers):
+        self.tickers = tickers
+        for name in _FILL:
+            setattr(self, name, self._empty(name, len(tickers)))
+        self.bars = 0
+        self.last_date = None
+        self._undo = None
+
+    def _ensure(self, keys):
+        new = keys[~keys.isin(self.tickers)]
+        if len(new):
+            self.tickers = self.tickers.append(new)
+            for name in _FILL:
+                setattr(self, name, np.concatenate([getattr(self, name), self._empty(name, len(new))], axis=-1))
+
+    def _recursive(self, p):
+        # EMAs (seeded at the first close) and Wilder's RSI averages (plain means over
+        # the first rsi_period changes, then 1/period smoothing)
+        ok = np.isfinite(p)
+        self.ema = np.where(ok, np.where(np.isnan(self.ema), p, self.ema + self._alpha * (p - self.ema)), self.ema)
+        d = p - self.prev
+        moved = np.isfinite(d)
+        self.changes += moved
+        n = np.maximum(np.minimum(self.changes, self.rsi_period), 1)
+        self.gain = np.where(moved, self.gain + (np.maximum(d, 0) - self.gain) / n, self.gain)
+        self.loss = np.where(moved, self.loss + (np.maximum(-d, 0) - self.loss) / n, self.loss)
+        self.prev = p.copy()
+
+    def _rsi(self):
+        total = self.gain + self.loss
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = np.where(total > 0, 100 * self.gain / total, 50.0)
+        return np.where(self.changes >= self.rsi_period, rsi, np.nan)
+
+    def _crossing(self, fast, slow):
+        # signal as in compute_signals; cross is +1/-1 on the bar the fast SMA moves
+        # above/below the slow one (not when the slow SMA first becomes available)
+        signal = np.nan_to_num(np.sign(fast - slow)).astype(np.int64)
+        cross = np.where((signal != self.prev_signal) & (self.prev_signal != 0), signal, 0)
+        self.prev_signal = signal
+        return signal, cross
+
+    def _advance(self, p):
+        # one bar for every ticker; returns (len(columns), N) values
+        Wp, Wv, b = self.px.shape[0], self.ret.shape[0], self.bars
+        ok = np.isfinite(p)
+        for i, w in enumerate(self.sma_windows):
+            old = self.px[(b - w) % Wp]  # the close leaving window w (NaN until it has filled)
+            gone = np.isfinite(old)
+            self.sma_sum[i] += np.where(ok, p, 0.0) - np.where(gone, old, 0.0)
+            self.sma_n[i] += ok.astype(np.int64) - gone
+        self.px[b % Wp] = p
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = np.log(p / self.prev)
+        ok_r = np.isfinite(r)
+        old = self.ret[b % Wv]
+        gone = np.isfinite(old)
+        self.ret_sum += np.where(ok_r, r, 0.0) - np.where(gone, old, 0.0)
+        self.ret_sq += np.where(ok_r, r * r, 0.0) - np.where(gone, old * old, 0.0)
+        self.ret_n += ok_r.astype(np.int64) - gone
+        self.ret[b % Wv] = r
+        self._recursive(p)
+        self.bars += 1
+        if self.bars % Wp == 0:
+            self._resync()
+
+        w = np.array(self.sma_windows, dtype=float)[:, None]
+        sma = np.where(self.sma_n == w, self.sma_sum / w, np.nan)
+        var = (self.ret_sq - self.ret_sum ** 2 / Wv) / max(Wv - 1, 1)
+        vol = np.where(self.ret_n == Wv, np.sqrt(np.maximum(var, 0.0) * self.periods_per_year), np.nan)
+        signal, cross = self._crossing(sma[0], sma[-1])
+        return np.vstack([sma, self.ema, vol, self._rsi(), signal, cross])
+
+    def _resync(self):
+        # exact window sums from the ring buffers, flushing float drift
+        Wp, Wv = self.px.shape[0], self.ret.shape[0]
+        for i, w in enumerate(self.sma_windows):
+            window = self.px[(self.bars - 1 - np.arange(w)) % Wp]
+            self.sma_sum[i] = np.nansum(window, axis=0)
+            self.sma_n[i] = np.isfinite(window).sum(axis=0)
+        self.ret_sum = np.nansum(self.ret, axis=0)
+        self.ret_sq = np.nansum(self.ret * self.ret, axis=0)
+        self.ret_n = np.isfinite(self.ret).sum(axis=0)
+
+    @timed(rows=True)
+    def run(self, prices):
+        # whole history (dates x tickers closes) -> frame with (indicator, ticker)
+        # columns; replaces any carried state with the state after the last row
+        prices = pd.DataFrame(prices)
+        panel = prices.to_numpy(dtype=float)
+        T, N = panel.shape
+        self._reset(pd.Index(prices.columns, dtype=object))
+        n_sma, n_ema = len(self.sma_windows), len(self.ema_spans)
+        out = np.full((len(self.columns), T, N), np.nan)
+
+        # window indicators: NaN unless the window is full
+        for i, w in enumerate(self.sma_windows):
+            if w <= T:
+                s, n = windowed(panel, w)
+                out[i, w - 1:] = np.where(n == w, s / w, np.nan)
+        ret = np.full((T, N), np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret[1:] = np.log(panel[1:] / panel[:-1])
+        Wv = self.vol_window
+        if Wv <= T:
+            s, n = windowed(ret, Wv)
+            s2, _ = windowed(ret * ret, Wv)
+            var = (s2 - s * s / Wv) / max(Wv - 1, 1)
+            out[n_sma + n_ema, Wv - 1:] = np.where(n == Wv, np.sqrt(np.maximum(var, 0.0) * self.periods_per_year),
+                                                   np.nan)
+        # recursive indicators walk the rows, vectorized across tickers
+        for t in range(T):
+            self._recursive(panel[t])
+            out[n_sma:n_sma + n_ema, t] = self.ema
+            out[n_sma + n_ema + 1, t] = self._rsi()
+        signal = np.nan_to_num(np.sign(out[0] - out[n_sma - 1])).astype(np.int64)
+        before = np.vstack([np.zeros((1, N), dtype=np.int64), signal[:-1]])
+        out[-2] = signal
+        out[-1] = np.where((signal != before) & (before != 0), signal, 0)
+
+        # carried state for update(): the buffers hold bar b in slot b % window
+        for buf, hist in ((self.px, panel), (self.ret, ret)):
+            W = buf.shape[0]
+            for b in range(max(0, T - W), T):
+                buf[b % W] = hist[b]
+        self.bars = T
+        self._resync()
+        if T:
+            self.prev_signal = signal[-1]
+            self.last_date = pd.Timestamp(prices.index[-1])
+        columns = pd.MultiIndex.from_product([self.columns, self.tickers])
+        return pd.DataFrame(out.transpose(1, 0, 2).reshape(T, -1), index=prices.index, columns=columns)
+
+    @timed(rows=True)
+    def update(self, date, prices):
+        # one new bar (ticker -> close) -> frame of today's values by ticker. Known
+        # tickers missing from `prices` get a NaN bar; unknown ones start empty.
+        # Re-applying the last date replaces that bar, so a re-run does not double count.
+        date = pd.Timestamp(date)
+        prices = pd.Series(prices, dtype=float)
+        if self.last_date is not None and date <= self.last_date:
+            if date < self.last_date or self._undo is None:
+                raise ValueError(f"bar for {date:%Y-%m-%d} is not after the last bar ({self.last_date:%Y-%m-%d})")
+            self._rollback()
+        self._ensure(pd.Index(prices.index, dtype=object))
+        Wp, Wv = self.px.shape[0], self.ret.shape[0]
+        self._undo = {name: getattr(self, name).copy() for name in _CARRIED}
+        self._undo.update(px=self.px[self.bars % Wp].copy(), ret=self.ret[self.bars % Wv].copy(),
+                          bars=self.bars, last_date=self.last_date, n=len(self.tickers))
+        values = self._advance(prices.reindex(self.tickers).to_numpy(dtype=float))
+        self.last_date = date
+        return pd.DataFrame(values.T, index=self.tickers, columns=self.columns)
+
+    def _rollback(self):
+        undo, self._undo = self._undo, None
+        n = undo["n"]
+        self.bars, self.last_date = undo["bars"], undo["last_date"]
+        for name in _FILL:
+            arr = getattr(self, name)
+            arr[..., n:] = _FILL[name]
+            if name in _CARRIED:
+                arr[..., :n] = undo[name]
+        self.px[self.bars % self.px.shape[0], :n] = undo["px"]
+        self.ret[self.bars % self.ret.shape[0], :n] = undo["ret"]
+
+    def save(self, path):
+        stamp = lambda d: np.array([pd.NaT if d is None else d], dtype="datetime64[ns]")
+        arrays = {name: getattr(self, name) for name in _FILL}
+        if self._undo is not None:
+            arrays.update({f"undo_{k}": np.asarray(v) for k, v in self._undo.items() if k != "last_date"})
+            arrays["undo_last_date"] = stamp(self._undo["last_date"])
+        meta = np.array([self.vol_window, self.rsi_period, self.periods_per_year, self.bars], dtype=float)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, tickers=self.tickers.to_numpy(dtype=str), sma_windows=np.array(self.sma_windows),
+                 ema_spans=np.array(self.ema_spans), meta=meta, last_date=stamp(self.last_date), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            vol_window, rsi_period, periods_per_year, bars = f["meta"]
+            engine = cls(f["sma_windows"], f["ema_spans"], vol_window, rsi_period, periods_per_year)
+            engine.tickers = pd.Index(f["tickers"].astype(object), dtype=object)
+            for name in _FILL:
+                setattr(engine, name, f[name])
+            engine.bars = int(bars)
+            last = pd.Timestamp(f["last_date"][0])
+            engine.last_date = None if pd.isna(last) else last
+            if "undo_n" in f:
+                engine._undo = {k[5:]: f[k] for k in f.files if k.startswith("undo_")}
+                engine._undo.update(n=int(f["undo_n"]), bars=int(f["undo_bars"]))
+                last = pd.Timestamp(f["undo_last_date"][0])
+                engine._undo["last_date"] = None if pd.isna(last) else last
+        return engine
+
+
+def compute_panel_signals(prices, **params):
+    # one-shot vectorized pass over a (dates x tickers) close panel
+    return SignalEngine(**params).run(prices)
@@ -0,0 +1,398 @@
+# spread_optimizer.py
+# Multi-leg structure search over a full option chain: verticals, straddles,
+# strangles, butterflies, iron condors and calendars. Every contract's payoff is
+# precomputed once on a price grid, together with its expectation under a lognormal
+# at the expiry's ATM vol, so a structure's expected P&L is a sum over its legs.
+# Same-expiry payoffs are piecewise linear, so max gain/loss come exactly from the
+# strikes. Candidates are pruned on those cheap numbers (debit, delta, max loss) and
+# on dominance (a Pareto frontier of max loss vs expected P&L per structure and
+# expiry) before the survivors get probability of profit and breakevens from the
+# grid. All money figures are per share, like risk_analysis.
+#   python spread_optimizer.py --synthetic --max-loss 5 --delta -0.2 0.2
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from greeks import CALL_FLAGS, bs_price, chain_greeks, years_to_expiry
+from implied_vol import chain_prices
+from instrumentation import timed
+from portfolio_manager import rank_trades
+
+STRUCTURES = ("vertical", "straddle", "strangle", "butterfly", "iron_condor", "calendar")
+GRID_POINTS = 256
+GRID_SD = 5.0       # grid spans +-5 ATM standard deviations at the longest expiry
+CHUNK = 20_000      # structures scored on the grid per batch
+CONDOR_SIDE = 60    # credit spreads per side combined into iron condors
+MIN_RISK = 0.01     # structures risking less than a tick are stale-quote artefacts
+MAX_LEGS = 4
+RESULT_COLUMNS = ["structure", "expiry", "back_expiry", "legs", "debit", "max_gain", "max_loss",
+                  "breakeven_low", "breakeven_high", "pop", "expected_gain", "delta", "risk_reward"]
+
+
+def _contracts(chain, S, r, q, now, surface, fill, moneyness):
+    # one row per quotable contract with entry prices for each side and delta
+    T = chain["T"].to_numpy(float) if "T" in chain else years_to_expiry(chain["expiry"], now)
+    K = chain["strike"].to_numpy(float)
+    call = np.isin(chain["type"].astype(str).to_numpy(), CALL_FLAGS)
+    iv = surface.iv(K, T) if surface is not None else chain["impliedVolatility"].to_numpy(float)
+    mid = chain_prices(chain)
+    buy, sell = mid.copy(), mid.copy()
+    if fill == "touch" and {"bid", "ask"} <= set(chain.columns):
+        bid, ask = chain["bid"].to_numpy(float), chain["ask"].to_numpy(float)
+        quoted = (bid > 0) & (ask >= bid)
+        buy, sell = np.where(quoted, ask, mid), np.where(quoted, bid, mid)
+    keep = ((T > 0) & np.isfinite(iv) & (iv > 0) & (buy > 0) & (sell > 0)
+            & (K >= moneyness[0] * S) & (K <= moneyness[1] * S))
+    c = pd.DataFrame({"expiry": pd.to_datetime(chain["expiry"]).to_numpy(), "T": T, "call": call, "strike": K,
+                      "buy": buy, "sell": sell, "iv": iv})[keep]
+    c = c.sort_values(["expiry", "call", "strike"]).drop_duplicates(["expiry", "call", "strike"])
+    c = c.reset_index(drop=True)
+    c["delta"] = chain_greeks(S, c["strike"].to_numpy(), c["T"].to_numpy(), r, c["iv"].to_numpy(),
+                              c["call"].to_numpy(), q)["delta"]
+    c["exp_id"] = pd.factorize(c["expiry"], sort=True)[0]
+    return c
+
+
+def _atm_vols(c, S, r, q):
+    # per expiry: the vol of the contract nearest the forward
+    out = []
+    for _, g in c.groupby("exp_id", sort=True):
+        F = S * np.exp((r - q) * g["T"].iloc[0])
+        out.append(float(g["iv"].iloc[np.argmin(np.abs(g["strike"].to_numpy() - F))]))
+    return np.array(out)
+
+
+def _grid_weights(S, T_exp, vols, r, q, drift, points):
+    # price grid (with 0, so downside payoffs are exact) and, per expiry, the
+    # lognormal probability mass of each grid point's cell (for expectations) and of
+    # each segment between grid points, the last column being the tail above the grid
+    span = GRID_SD * np.max(vols * np.sqrt(T_exp))
+    grid = np.r_[0.0, S * np.exp(np.linspace(-span, span, points - 1))]
+    mu = (r if drift is None else drift) - q
+    loc = np.log(S) + (mu - 0.5 * vols ** 2) * T_exp
+    scale = vols * np.sqrt(T_exp)
+    cdf = lambda x: ndtr((np.log(x)[None, :] - loc[:, None]) / scale[:, None])
+    n = len(T_exp)
+    # the 0 point carries no lognormal mass; the outer cells take the tails
+    edges = np.sqrt(grid[1:-1] * grid[2:])
+    weights = np.c_[np.zeros(n), np.diff(np.c_[np.zeros(n), cdf(edges), np.ones(n)], axis=1)]
+    at = np.c_[np.zeros(n), cdf(grid[1:]), np.ones(n)]
+    return grid, weights, np.diff(at, axis=1)
+
+
+def _pairs(strikes, max_width):
+    # all i < j with strikes[j] - strikes[i] <= max_width (strikes sorted)
+    n = len(strikes)
+    hi = np.searchsorted(strikes, strikes + max_width + 1e-9, side="right")
+    counts = np.maximum(hi - np.arange(n) - 1, 0)
+    i = np.repeat(np.arange(n), counts)
+    j = i + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return i, j
+
+
+def _both_ways(name, legs, qty):
+    # a structure and its mirror (every leg's side flipped)
+    qty = np.asarray(qty, dtype=float)
+    return {"structure": name, "legs": np.r_[legs, legs],
+            "qty": np.r_[np.tile(qty, (len(legs), 1)), np.tile(-qty, (len(legs), 1))]}
+
+
+def _enumerate(a, S, structures, max_width):
+    # yields candidate families as leg-index arrays into the contract arrays `a`
+    strike, call, exp_id = a["strike"], a["call"], a["exp_id"]
+    bounds = np.r_[0, np.flatnonzero(np.diff(exp_id)) + 1, len(exp_id)]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        rows = np.arange(lo, hi)
+        calls, puts = rows[call[rows]], rows[~call[rows]]
+        for side in (calls, puts):
+            k = strike[side]
+            i, j = _pairs(k, max_width)
+            if "vertical" in structures and len(i):
+                yield _both_ways("vertical", np.c_[side[i], side[j]], [1, -1])
+            if "butterfly" in structures and len(i):
+                # wing at the same distance above j as i is below it
+                wing = np.minimum(np.searchsorted(k, 2 * k[j] - k[i]), len(k) - 1)
+                ok = (np.abs(k[wing] - (2 * k[j] - k[i])) < 1e-6) & (k[wing] - k[i] <= max_width)
+                if ok.any():
+                    yield _both_ways("butterfly", np.c_[side[i[ok]], side[j[ok]], side[wing[ok]]], [1, -2, 1])
+        if not (len(calls) and len(puts)):
+            continue
+        kp, kc = strike[puts], strike[calls]
+        if "straddle" in structures:
+            _, pi, ci = np.intersect1d(kp, kc, return_indices=True)
+            if len(pi):
+                yield _both_ways("straddle", np.c_[puts[pi], calls[ci]], [1, 1])
+        if "strangle" in structures:
+            # out-of-the-money put below spot, call above it, at most max_width apart
+            otm_p = np.flatnonzero(kp < S)
+            first = np.searchsorted(kc, S, side="right")
+            last = np.searchsorted(kc, kp[otm_p] + max_width + 1e-9, side="right")
+            counts = np.maximum(last - first, 0)
+            p = np.repeat(otm_p, counts)
+            cc = first + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            if len(p):
+                yield _both_ways("strangle", np.c_[puts[p], calls[cc]], [1, 1])
+        if "iron_condor" in structures:
+            sides = []
+            for side, short_high in ((puts, True), (calls, False)):
+                i, j = _pairs(strike[side], max_width)
+                long_, short = (side[i], side[j]) if short_high else (side[j], side[i])
+                otm = strike[short] < S if short_high else strike[short] > S
+                credit = a["sell"][short] - a["buy"][long_]
+                ratio = credit / np.abs(strike[short] - strike[long_])
+                ok = np.flatnonzero(otm & (credit > 0))
+                # the spreads paying the most credit per unit of width; the rest only
+                # add risk for less premium
+                best = ok[np.argsort(-ratio[ok], kind="stable")[:CONDOR_SIDE]]
+                sides.append((long_[best], short[best]))
+            (pl, ps), (cl, cs) = sides
+            if len(pl) and len(cs):
+                x, y = (g.ravel() for g in np.meshgrid(np.arange(len(pl)), np.arange(len(cs)), indexing="ij"))
+                yield {"structure": "iron_condor", "legs": np.c_[pl[x], ps[x], cs[y], cl[y]],
+                       "qty": np.tile([1.0, -1.0, -1.0, 1.0], (len(x), 1))}
+    if "calendar" in structures:
+        # same strike and type: short the front expiry, long a later one
+        for e1 in range(len(bounds) - 1):
+            for e2 in range(e1 + 1, len(bounds) - 1):
+                front, back = np.arange(bounds[e1], bounds[e1 + 1]), np.arange(bounds[e2], bounds[e2 + 1])
+                key_f = strike[front] * np.where(call[front], 1, -1)
+                key_b = strike[back] * np.where(call[back], 1, -1)
+                _, fi, bi = np.intersect1d(key_f, key_b, return_indices=True)
+                if len(fi):
+                    yield {"structure": "calendar", "legs": np.c_[front[fi], back[bi]],
+                           "qty": np.tile([-1.0, 1.0], (len(fi), 1))}
+
+
+def _extremes(a, legs, qty):
+    # exact payoff range at expiry for same-expiry legs: the payoff is piecewise
+    # linear, so extremes sit at 0 or a strike, or run off with the slope above the top strike
+    K, sign = a["strike"][legs], np.where(a["call"][legs], 1.0, -1.0)
+    low = high = None
+    for x in [np.zeros(len(legs))] + [K[:, m] for m in range(legs.shape[1])]:
+        value = sum(qty[:, l] * np.maximum(sign[:, l] * (x - K[:, l]), 0.0) for l in range(legs.shape[1]))
+        low = value if low is None else np.minimum(low, value)
+        high = value if high is None else np.maximum(high, value)
+    slope = (qty * (sign > 0)).sum(axis=1)
+    return np.where(slope < 0, -np.inf, low), np.where(slope > 0, np.inf, high)
+
+
+def _leg_values(a, legs, grid, eval_T, r, q):
+    # value of each leg at the structure's front expiry over the grid: intrinsic for
+    # legs expiring then, Black-Scholes for legs that live on (calendars)
+    K, call, T, iv = a["strike"][legs], a["call"][legs], a["T"][legs], a["iv"][legs]
+    values = np.maximum(np.where(call[..., None], grid - K[..., None], K[..., None] - grid), 0.0)
+    remaining = T - eval_T[:, None]
+    # only legs that outlive the front expiry in some structure need pricing
+    for l in np.flatnonzero((remaining > 1e-9).any(axis=0)):
+        live = remaining[:, l] > 1e-9
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values[live, l] = bs_price(grid, K[live, l, None], remaining[live, l, None], r,
+                                          iv[live, l, None], call[live, l, None], q)
+    return values
+
+
+def _grid_metrics(pnl, segments, grid):
+    # probability of profit, breakevens and grid extremes from a (structures, grid)
+    # P&L, linear between grid points
+    win = pnl > 0
+    cross = win[:, 1:] != win[:, :-1]
+    has = cross.any(axis=1)
+    rows = np.arange(len(pnl))
+    p0, p1 = pnl[:, :-1], pnl[:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # share of each segment where the interpolated P&L is positive
+        share = np.where(cross, np.maximum(p0, p1) / (np.abs(p0) + np.abs(p1)), win[:, 1:])
+    pop = (share * segments[:, :-1]).sum(axis=1) + win[:, -1] * segments[:, -1]
+
+    def breakeven(i):
+        q0, q1 = pnl[rows, i], pnl[rows, i + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = grid[i] + (grid[i + 1] - grid[i]) * (-q0) / (q1 - q0)
+        return np.where(has, x, np.nan)
+    # a slope at the top edge of the grid means the payoff keeps going
+    slope = pnl[:, -1] - pnl[:, -2]
+    return {"max_gain": np.where(slope > 1e-9, np.inf, pnl.max(axis=1)),
+            "max_loss": np.where(slope < -1e-9, np.inf, np.maximum(-pnl.min(axis=1), 0.0)),
+            "pop": pop,
+            "breakeven_low": breakeven(np.argmax(cross, axis=1)),
+            "breakeven_high": breakeven(cross.shape[1] - 1 - np.argmax(cross[:, ::-1], axis=1))}
+
+
+def _pareto(*costs, block=512):
+    # indices not dominated on the costs (all minimized): no other candidate is <= on
+    # every cost and < on one. In lexicographic order only earlier candidates can
+    # dominate, and only through the frontier kept so far, so blocks of candidates
+    # are tested against it (and each other) vectorized.
+    X = np.column_stack(costs)
+    order = np.lexsort(X.T[::-1])
+    front = np.zeros(0, dtype=np.int64)
+    for lo in range(0, len(order), block):
+        idx = order[lo:lo + block]
+        rivals = X[np.concatenate([front, idx])]
+        B = X[idx][:, None, :]
+        dominated = ((rivals <= B).all(axis=2) & (rivals < B).any(axis=2)).any(axis=1)
+        front = np.concatenate([front, idx[~dominated]])
+    return np.sort(front)
+
+
+def _costs(m, rank_by):
+    # Pareto costs: less risk, more expected gain, and the ranking key itself, so
+    # pruning never drops the candidate the ranking would put first
+    costs = [m["max_loss"], -m["expected_gain"]]
+    if rank_by == "risk_reward":
+        costs.append(-m["expected_gain"] / m["max_loss"])
+    elif rank_by != "expected_gain":
+        costs.append(-m[rank_by])
+    return costs
+
+
+def _describe(a, legs, qty):
+    kinds = np.where(a["call"], "C", "P")
+    expiry = pd.to_datetime(a["expiry"]).strftime("%Y-%m-%d")
+    return [" / ".join(f"{int(n):+d} {kinds[i]} {a['strike'][i]:g} {expiry[i]}" for i, n in zip(ls, qs) if n)
+            for ls, qs in zip(legs, qty)]
+
+
+@timed(rows=True)
+def optimize_spreads(chain, S, r=0.04, q=0.0, structures=STRUCTURES, max_debit=None, max_loss=None,
+                     delta_band=None, min_pop=None, max_width=None, moneyness=(0.7, 1.3), fill="mid",
+                     rank_by="risk_reward", pareto=True, top=50, drift=None, surface=None, now=None,
+                     min_risk=MIN_RISK, grid_points=GRID_POINTS):
+    # chain: long format (expiry, type, strike, bid/ask/lastPrice, impliedVolatility).
+    # Constraints are per share: max_debit (negative admits only credits), max_loss,
+    # delta_band=(lo, hi) in deltas per 1-lot, min_pop. max_width caps the strike
+    # distance inside a structure (default 10% of spot). fill="touch" buys at the ask
+    # and sells at the bid. drift=None scores under the risk-neutral rate; a surface
+    # (vol_surface.VolSurface) replaces the quoted IVs. rank_by: "risk_reward"
+    # (portfolio_manager.rank_trades), "pop" or "expected_gain".
+    c = _contracts(chain, S, r, q, now, surface, fill, moneyness)
+    if c.empty:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    a = {col: c[col].to_numpy() for col in c.columns}
+    max_width = 0.1 * S if max_width is None else max_width
+    exp_T = c.groupby("exp_id", sort=True)["T"].first().to_numpy()
+    vols = surface.atm_iv(exp_T) if surface is not None else _atm_vols(c, S, r, q)
+    grid, weights, segments = _grid_weights(S, exp_T, vols, r, q, drift, grid_points)
+    # expected payoff of every contract held to its own expiry, from the payoff matrix
+    payoff = _leg_values(a, np.arange(len(c))[:, None], grid, a["T"], r, q)[:, 0]
+    expected = (payoff * weights[a["exp_id"]]).sum(axis=1)
+
+    # pruning before the grid pass is only safe when no remaining constraint or
+    # ranking key depends on the grid (min_pop, rank_by="pop")
+    early_pareto = pareto and min_pop is None and rank_by in ("risk_reward", "expected_gain")
+    kept = []
+    for fam in _enumerate(a, S, set(structures), max_width):
+        legs, qty = fam["legs"], fam["qty"]
+        calendar = fam["structure"] == "calendar"
+        # cheap pass: debit, delta, expected P&L and (same expiry) exact max gain/loss
+        debit = (qty * np.where(qty > 0, a["buy"][legs], a["sell"][legs])).sum(axis=1)
+        m = {"debit": debit, "delta": (qty * a["delta"][legs]).sum(axis=1)}
+        ok = np.ones(len(legs), dtype=bool)
+        if max_debit is not None:
+            ok &= debit <= max_debit
+        if delta_band is not None:
+            ok &= (m["delta"] >= delta_band[0]) & (m["delta"] <= delta_band[1])
+        sel = np.flatnonzero(ok)
+        legs, qty = legs[sel], qty[sel]
+        m = {k: v[sel] for k, v in m.items()}
+        if not calendar:
+            m["expected_gain"] = (qty * expected[legs]).sum(axis=1) - m["debit"]
+            low, high = _extremes(a, legs, qty)
+            m["max_loss"], m["max_gain"] = m["debit"] - low, high - m["debit"]
+            ok = m["max_loss"] >= min_risk
+            if max_loss is not None:
+                ok &= m["max_loss"] <= max_loss
+            sel = np.flatnonzero(ok)
+            if early_pareto:
+                sel = sel[_pareto(*_costs({k: v[sel] for k, v in m.items()}, rank_by))]
+        else:
+            sel = np.arange(len(legs))
+        # grid pass on the survivors, in bounded chunks
+        for lo in range(0, len(sel), CHUNK):
+            part = sel[lo:lo + CHUNK]
+            front = a["exp_id"][legs[part]].min(axis=1)
+            values = _leg_values(a, legs[part], grid, a["T"][legs[part]].min(axis=1), r, q)
+            pnl = np.einsum("nl,nlg->ng", qty[part], values) - m["debit"][part, None]
+            g = _grid_metrics(pnl, segments[front], grid)
+            out = {k: v[part] for k, v in m.items()}
+            out.update({k: v for k, v in g.items() if k not in out})
+            if calendar:
+                # the back leg keeps time value, so only the grid knows the P&L
+                out["expected_gain"] = (pnl * weights[front]).sum(axis=1)
+            good = out["max_loss"] >= min_risk
+            if max_loss is not None:
+                good &= out["max_loss"] <= max_loss
+            if min_pop is not None:
+                good &= out["pop"] >= min_pop
+            if not good.any():
+                continue
+            pad_legs = np.zeros((good.sum(), MAX_LEGS), dtype=np.int64)
+            pad_qty = np.zeros((good.sum(), MAX_LEGS))
+            pad_legs[:, :legs.shape[1]], pad_qty[:, :legs.shape[1]] = legs[part[good]], qty[part[good]]
+            kept.append({"structure": np.full(good.sum(), fam["structure"], dtype=object), "exp_id": front[good],
+                         "legs": pad_legs, "qty": pad_qty, **{k: v[good] for k, v in out.items()}})
+    if not kept:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    cols = {k: np.concatenate([p[k] for p in kept]) for k in kept[0]}
+    legs, qty = cols.pop("legs"), cols.pop("qty")
+    cand = pd.DataFrame(cols)
+    if pareto:
+        # after every hard constraint: one frontier per structure and front expiry
+        keep = [g.index.to_numpy()[_pareto(*_costs({k: g[k].to_numpy() for k in g}, rank_by))]
+                for _, g in cand.groupby(["structure", "exp_id"], sort=False)]
+        cand = cand.loc[np.sort(np.concatenate(keep))]
+    if rank_by == "risk_reward":
+        cand = rank_trades(cand)
+    else:
+        cand = cand.assign(risk_reward=cand["expected_gain"] / cand["max_loss"])
+        cand = cand.sort_values(rank_by, ascending=False, kind="stable")
+    cand = cand.head(top)
+    legs, qty = legs[cand.index.to_numpy()], qty[cand.index.to_numpy()]
+    cand = cand.reset_index(drop=True)
+
+    expiry = a["expiry"][np.where(qty != 0, legs, legs[:, :1])]
+    cand["expiry"] = expiry.min(axis=1)
+    back = expiry.max(axis=1)
+    cand["back_expiry"] = pd.Series(back).where(back > cand["expiry"].to_numpy())
+    cand["legs"] = _describe(a, legs, qty)
+    return cand[RESULT_COLUMNS]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search multi-leg option structures over a full chain")
+    parser.add_argument("--ticker", default="AAPL")
+    parser.add_argument("--structures", nargs="+", choices=STRUCTURES, default=list(STRUCTURES))
+    parser.add_argument("--max-debit", type=float, default=None, help="per share; negative = credits only")
+    parser.add_argument("--max-loss", type=float, default=None, help="per share")
+    parser.add_argument("--delta", type=float, nargs=2, default=None, metavar=("LO", "HI"))
+    parser.add_argument("--min-pop", type=float, default=None)
+    parser.add_argument("--max-width", type=float, default=None, help="strike distance inside a structure")
+    parser.add_argument("--fill", choices=["mid", "touch"], default="mid")
+    parser.add_argument("--rank-by", choices=["risk_reward", "pop", "expected_gain"], default="risk_reward")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.04)
+    parser.add_argument("--synthetic", action="store_true", help="use the offline synthetic data source")
+    args = parser.parse_args(argv)
+
+    from data_fetch import YahooChainSource, normalize_chain
+    if args.synthetic:
+        from synthetic_data import SyntheticChainSource
+        source = SyntheticChainSource()
+    else:
+        source = YahooChainSource()
+    S = source.spot(args.ticker)
+    chain = pd.concat([normalize_chain(args.ticker, e, *source.chain(args.ticker, e))
+                       for e in source.expirations(args.ticker)], ignore_index=True)
+    best = optimize_spreads(chain, S, args.rate, structures=args.structures, max_debit=args.max_debit,
+                            max_loss=args.max_loss, delta_band=args.delta, min_pop=args.min_pop,
+                            max_width=args.max_width, fill=args.fill, rank_by=args.rank_by, top=args.top)
+    with pd.option_context("display.width", 200, "display.max_colwidth", 90):
+        print(f"{args.ticker} spot {S:.2f}, {len(chain)} contracts")
+        print(best.drop(columns=["back_expiry"]).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
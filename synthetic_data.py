@@ -0,0 +1,168 @@
+# synthetic_data.py
+# Deterministic offline stand-ins for market data (tests, benchmarks, dry runs)
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from greeks import bs_price
+
+
+def _seed(*parts):
+    return zlib.crc32("|".join(str(p) for p in parts).encode())
+
+
+class SyntheticChainSource:
+    # Same interface as data_fetch.YahooChainSource. Chains are a function of
+    # (ticker, expiry, seed) so repeated calls return identical data;
+    # `latency` simulates the network round trip per call. intraday=True makes each
+    # chain() call a later poll of the same session: volume accrues, IV drifts.
+    def __init__(self, n_expiries=8, strikes_per_expiry=40, seed=0, latency=0.0, fail=(), intraday=False):
+        self.n_expiries = n_expiries
+        self.strikes_per_expiry = strikes_per_expiry
+        self.seed = seed
+        self.latency = latency
+        self.fail = set(fail)
+        self.intraday = intraday
+        self.polls = {}
+        self.calls = 0
+
+    def _wait(self, symbol):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if symbol in self.fail:
+            raise ConnectionError(f"synthetic failure for {symbol}")
+
+    def spot(self, symbol):
+        rng = np.random.default_rng(_seed(symbol, self.seed))
+        return float(np.round(rng.uniform(10, 600), 2))
+
+    def expirations(self, symbol):
+        self._wait(symbol)
+        today = pd.Timestamp.today().normalize()
+        fridays = pd.date_range(today + pd.Timedelta(days=1), periods=self.n_expiries, freq="W-FRI")
+        return [d.strftime("%Y-%m-%d") for d in fridays]
+
+    def chain(self, symbol, expiry):
+        self._wait(symbol)
+        S = self.spot(symbol)
+        rng = np.random.default_rng(_seed(symbol, expiry, self.seed))
+        T = max((pd.Timestamp(expiry) - pd.Timestamp.today()).days, 1) / 365
+        strikes = np.round(S * np.linspace(0.7, 1.3, self.strikes_per_expiry), 1)
+        base_vol = rng.uniform(0.15, 0.6)
+        poll = None
+        if self.intraday:
+            poll = self.polls[(symbol, expiry)] = self.polls.get((symbol, expiry), 0) + 1
+            base_vol += 0.002 * np.random.default_rng(_seed(symbol, expiry, self.seed, poll)).standard_normal()
+        return (self._side(rng, S, strikes, T, base_vol, "call", poll),
+                self._side(rng, S, strikes, T, base_vol, "put", poll))
+
+    def _side(self, rng, S, strikes, T, base_vol, option_type, poll=None):
+        m = np.log(strikes / S)
+        iv = base_vol + 0.4 * m * m - 0.1 * m
+        price = bs_price(S, strikes, T, 0.04, iv, option_type)
+        spread = np.maximum(0.01, 0.02 * price)
+        volume = rng.poisson(2000 * np.exp(-8 * m * m))
+        if poll is not None:
+            # a 390-minute session: volume so far grows with the poll number
+            volume = np.floor(volume * min(poll, 390) / 390)
+        return pd.DataFrame({
+            "strike": strikes,
+            "lastPrice": np.round(price, 2),
+            "bid": np.round(np.maximum(price - spread / 2, 0), 2),
+            "ask": np.round(price + spread / 2, 2),
+            "volume": volume.astype(float),
+            "openInterest": rng.poisson(5000 * np.exp(-6 * m * m)).astype(float),
+            "impliedVolatility": iv,
+            "inTheMoney": strikes < S if option_type == "call" else strikes > S,
+        })
+
+
+# --- Bulk generators (benchmarks) ---
+def synthetic_chain(n_contracts, seed=0):
+    # one flat chain of independent contracts: S, strike, T (years), iv, type
+    rng = np.random.default_rng(seed)
+    S = rng.uniform(10, 600, n_contracts)
+    return pd.DataFrame({
+        "S": S,
+        "strike": np.round(S * rng.uniform(0.7, 1.3, n_contracts), 1),
+        "T": rng.uniform(1, 730, n_contracts) / 365,
+        "impliedVolatility": rng.uniform(0.1, 0.9, n_contracts),
+        "type": np.where(rng.random(n_contracts) < 0.5, "call", "put"),
+    })
+
+
+def synthetic_chain_history(symbol="SYN", n_days=252, n_expiries=6, strikes=40, start="2022-01-03", seed=0):
+    # (date, chain) per business day along one GBM path, for the chain store and
+    # replays. Monthly expiries (third Friday) roll forward and strikes sit on a fixed
+    # grid, so the same contract is quoted day after day until it expires.
+    rng = np.random.default_rng(_seed(symbol, seed, "history"))
+    S0 = float(np.round(rng.uniform(50, 400), 2))
+    base_vol = rng.uniform(0.2, 0.45)
+    dates = pd.bdate_range(start, periods=n_days)
+    path = S0 * np.exp(np.cumsum((0.06 - 0.5 * base_vol ** 2) / 252
+                                 + base_vol / np.sqrt(252) * rng.standard_normal(n_days)))
+    months = pd.date_range(dates[0] - pd.offsets.MonthBegin(1), periods=n_days // 15 + n_expiries + 2, freq="MS")
+    third_fridays = pd.DatetimeIndex([m + pd.offsets.WeekOfMonth(week=2, weekday=4) for m in months])
+    step = float(np.round(S0 * 0.6 / strikes, 1)) or 0.5
+    for date, S in zip(dates, path):
+        expiries = third_fridays[third_fridays >= date][:n_expiries]
+        grid = step * np.arange(np.ceil(0.7 * S / step), np.floor(1.3 * S / step) + 1)
+        T = np.repeat(np.maximum((expiries - date).days, 0) / 365, len(grid))
+        K = np.tile(grid, len(expiries))
+        frames = []
+        for option_type in ("call", "put"):
+            m = np.log(K / S)
+            iv = base_vol + 0.4 * m * m - 0.1 * m + 0.01 * rng.standard_normal()
+            price = bs_price(S, K, T, 0.04, iv, option_type)
+            spread = np.maximum(0.01, 0.02 * price)
+            frames.append(pd.DataFrame({
+                "expiry": np.repeat(expiries, len(grid)),
+                "type": option_type,
+                "strike": np.round(K, 2),
+                "bid": np.round(np.maximum(price - spread / 2, 0), 2),
+                "ask": np.round(price + spread / 2, 2),
+                "lastPrice": np.round(price, 2),
+                "volume": rng.poisson(2000 * np.exp(-8 * m * m)).astype(float),
+                "openInterest": rng.poisson(5000 * np.exp(-6 * m * m)).astype(float),
+                "impliedVolatility": iv,
+            }))
+        yield date, pd.concat(frames, ignore_index=True).assign(ticker=symbol, spot=round(float(S), 2))
+
+
+def synthetic_prices(n_tickers=500, n_days=252 * 30, seed=0):
+    # business-day close panel (dates x tickers) of independent GBM paths
+    rng = np.random.default_rng(seed)
+    mu = rng.normal(0.06, 0.05, n_tickers) / 252
+    vol = rng.uniform(0.15, 0.6, n_tickers) / np.sqrt(252)
+    log_ret = (mu - 0.5 * vol ** 2) + vol * rng.standard_normal((n_days, n_tickers))
+    prices = rng.uniform(10, 500, n_tickers) * np.exp(np.cumsum(log_ret, axis=0))
+    dates = pd.bdate_range(end="2024-12-31", periods=n_days)
+    return pd.DataFrame(prices, index=dates, columns=[f"T{i:04d}" for i in range(n_tickers)])
+
+
+def synthetic_volume_history(n_keys=500, n_days=60, seed=0, spike_rate=0.01):
+    # long frame date, ticker, total_volume with occasional spikes to flag
+    rng = np.random.default_rng(seed)
+    base = rng.lognormal(10, 1, n_keys)
+    vol = base * rng.lognormal(0, 0.3, (n_days, n_keys))
+    vol *= np.where(rng.random((n_days, n_keys)) < spike_rate, 6.0, 1.0)
+    dates = pd.bdate_range(end="2024-12-31", periods=n_days)
+    return pd.DataFrame({
+        "date": np.repeat(dates, n_keys),
+        "ticker": np.tile(np.array([f"T{i:06d}" for i in range(n_keys)], dtype=object), n_days),
+        "total_volume": np.round(vol.ravel()),
+    })
+
+
+def synthetic_features(n_rows, features, target="stock_return", seed=0, dated=True):
+    # factor frame with a linear target, for regression and clustering; dated=False
+    # keeps a RangeIndex (business-day indexes run out of range past ~80k rows)
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_rows, len(features)))
+    index = pd.bdate_range(end="2024-12-31", periods=n_rows, name="date") if dated else None
+    frame = pd.DataFrame(X, columns=features, index=index)
+    frame[target] = X @ rng.normal(0, 0.01, len(features)) + rng.normal(0, 0.02, n_rows)
+    return frame
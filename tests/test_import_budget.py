@@ -0,0 +1,23 @@
+# test_import_budget.py
+# Import-time budget: every module imports in a clean interpreter without network
+# access or creating files, and `cli.py greeks` on one contract stays under budget.
+# `python cli.py import-check` runs the same checks with a per-module report.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli  # noqa: E402
+
+
+@pytest.mark.parametrize("module", cli._modules())
+def test_import_has_no_side_effects(module, tmp_path):
+    _, created = cli._import_in_clean_interpreter(module, tmp_path)
+    assert created == [], f"importing {module} created {created}"
+
+
+def test_greeks_within_budget():
+    elapsed = cli._time_command(cli.GREEKS_ARGV)
+    assert elapsed <= cli.GREEKS_BUDGET, f"`cli.py greeks` took {elapsed:.3f}s > {cli.GREEKS_BUDGET:.3f}s"
@@ -1,12 +1,174 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+
+# Company data lives in a Parquet dataset next to the workbook (data/AAPL.xlsx ->
+# data/AAPL.parquet/), one part file per save/append. A workbook that is newer than
+# the one recorded in the dataset manifest is re-imported; otherwise Excel is never
+# read. Excel is only written by export_excel.
+MANIFEST = "_source.json"
+
+
+def _paths(filepath):
+    stem, ext = os.path.splitext(filepath)
+    if ext == ".parquet":
+        return None, filepath
+    return (filepath if ext in (".xlsx", ".xls") else stem + ".xlsx"), stem + ".parquet"
+
+
+def _fingerprint(path, with_hash=False):
+    st = os.stat(path)
+    fp = {"mtime": st.st_mtime, "size": st.st_size}
+    if with_hash:
+        with open(path, "rb") as f:
+            fp["sha1"] = hashlib.sha1(f.read()).hexdigest()
+    return fp
+
+
+def _parts(store):
+    return sorted(glob.glob(os.path.join(store, "part-*.parquet")))
+
+
+def _date_keyed(df):
+    # parts are date-keyed: a datetime index becomes the "date" column, a default
+    # range index is dropped, and anything else would be lost silently
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.rename_axis("date").reset_index()
+    if isinstance(df.index, pd.RangeIndex) and df.index.name is None:
+        return df
+    raise ValueError(f"cannot store a frame indexed by {type(df.index).__name__} {df.index.name!r}; "
+                     "expected a DatetimeIndex or a date column")
+
+
+def _write_part(store, df, schema=None):
+    os.makedirs(store, exist_ok=True)
+    frame = _date_keyed(df)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if schema is not None:
+        table = table.select(schema.names).cast(schema)
+    parts = _parts(store)
+    n = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 0
+    pq.write_table(table, os.path.join(store, f"part-{n:05d}.parquet"))
 
-def load_company_data(filepath):
-    df = pd.read_excel(filepath)
+
+def _import_excel(xlsx, store, check_hash=False):
+    df = pd.read_excel(xlsx)
     df['date'] = pd.to_datetime(df['date'])
+    for old in _parts(store):
+        os.remove(old)
+    _write_part(store, df)
+    with open(os.path.join(store, MANIFEST), "w") as f:
+        json.dump(_fingerprint(xlsx, check_hash), f)
+
+
+def _stale(xlsx, store, check_hash=False):
+    if xlsx is None or not os.path.exists(xlsx):
+        return False
+    try:
+        with open(os.path.join(store, MANIFEST)) as f:
+            recorded = json.load(f)
+    except FileNotFoundError:
+        return True
+    current = _fingerprint(xlsx, check_hash and "sha1" in recorded)
+    if current["mtime"] == recorded["mtime"] and current["size"] == recorded["size"]:
+        return False
+    # touched but unchanged content is not a reason to re-import
+    return not (check_hash and current.get("sha1") == recorded.get("sha1"))
+
+
+@timed(rows=True)
+def load_company_data(filepath, columns=None, start=None, end=None, check_hash=False):
+    xlsx, store = _paths(filepath)
+    if not _parts(store) or _stale(xlsx, store, check_hash):
+        _import_excel(xlsx, store, check_hash)
+    filters = []
+    if start is not None:
+        filters.append(("date", ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append(("date", "<=", pd.Timestamp(end)))
+    cols = None if columns is None else ["date"] + [c for c in columns if c != "date"]
+    table = pq.read_table(store, columns=cols, filters=filters or None, memory_map=True)
+    df = table.to_pandas()
+    df['date'] = pd.to_datetime(df['date'])
+    # later appends win for repeated dates
+    df = df.drop_duplicates("date", keep="last").sort_values("date")
     df = df.set_index('date')
     return df
 
-def merge_external_data(stock_df, external_df, on='date'):
-    external_df['date'] = pd.to_datetime(external_df['date'])
-    external_df = external_df.set_index('date')
-    return stock_df.merge(external_df, how='left', left_index=True, right_index=True)
+
+@timed()
+def save_company_data(df, filepath):
+    # replaces the stored history with df (date column or date index)
+    xlsx, store = _paths(filepath)
+    for old in _parts(store):
+        os.remove(old)
+    _write_part(store, df)
+    manifest = os.path.join(store, MANIFEST)
+    if xlsx and os.path.exists(xlsx):
+        with open(manifest, "w") as f:
+            json.dump(_fingerprint(xlsx), f)
+    elif os.path.exists(manifest):
+        os.remove(manifest)
+
+
+@timed()
+def append_company_data(df, filepath):
+    # adds rows as a new part file; existing history is not rewritten
+    xlsx, store = _paths(filepath)
+    parts = _parts(store)
+    if not parts:
+        if xlsx and os.path.exists(xlsx):
+            _import_excel(xlsx, store)
+        else:
+            return save_company_data(df, filepath)
+    schema = pq.read_schema(_parts(store)[0])
+    frame = _date_keyed(df)
+    if set(frame.columns) != set(schema.names):
+        # new or missing columns: rewrite once with the unified layout
+        merged = pd.concat([load_company_data(filepath).reset_index(), frame], ignore_index=True)
+        return save_company_data(merged, filepath)
+    _write_part(store, frame, schema)
+
+
+@timed()
+def export_excel(filepath, out_path=None):
+    xlsx, store = _paths(filepath)
+    out_path = out_path or xlsx
+    load_company_data(filepath).to_excel(out_path)
+    if out_path == xlsx:
+        # the export mirrors the store, so it must not trigger a re-import
+        with open(os.path.join(store, MANIFEST), "w") as f:
+            json.dump(_fingerprint(xlsx), f)
+    return out_path
+
+
+def merge_external_data(stock_df, external_df, on='date', tolerance=None):
+    # as-of left join on the date index: every stock_df row gets the latest external
+    # row dated on or before it (never a later one), or NaN when that row is older
+    # than `tolerance` (e.g. "7D"). Neither input is modified; repeated external
+    # dates keep the last row.
+    if on in external_df.columns:
+        external_df = external_df.assign(**{on: pd.to_datetime(external_df[on])}).set_index(on)
+    overlap = stock_df.columns.intersection(external_df.columns)
+    if len(overlap):
+        raise ValueError(f"columns overlap: {list(overlap)}")
+    right = external_df[~external_df.index.duplicated(keep="last")].sort_index(kind="stable")
+    right_dates = pd.DatetimeIndex(right.index).as_unit("ns").asi8
+    left_dates = pd.DatetimeIndex(stock_df.index).as_unit("ns").asi8
+    pos = np.searchsorted(right_dates, left_dates, side="right") - 1
+    found = pos >= 0
+    if tolerance is not None:
+        found &= left_dates - right_dates[np.maximum(pos, 0)] <= pd.Timedelta(tolerance).value
+    joined = right.iloc[np.maximum(pos, 0)] if len(right) else right.reindex(range(len(stock_df)))
+    if not found.all():
+        joined = joined.where(np.broadcast_to(found[:, None], joined.shape))
+    joined.index = stock_df.index
+    return pd.concat([stock_df, joined], axis=1)
@@ -1,9 +1,14 @@
 # 5. valuation.py
 import yfinance as yf
 
-def get_valuation_metrics(ticker):
+from instrumentation import timed
+from market_cache import default_cache
+
+@timed()
+def get_valuation_metrics(ticker, cache=None):
     stock = yf.Ticker(ticker)
-    info = stock.info
+    cache = default_cache() if cache is None else cache
+    info = cache.get_or_fetch(ticker, "info", None, lambda: stock.info) if cache else stock.info
     metrics = {
         'pe_ratio': info.get('trailingPE'),
         'peg_ratio': info.get('pegRatio'),
@@ -0,0 +1,194 @@
+# vol_surface.py
+# Implied-volatility surface: one raw-SVI smile per expiry, fitted to out-of-the-money
+# IVs in log-forward-moneyness, and total variance interpolated linearly in T across
+# expiries. Each smile respects the Lee wing bound b(1 + |rho|) <= 2 and a >= 0, and
+# total variance is made non-decreasing in T, so queries are free of the obvious
+# butterfly / calendar arbitrage. Fitting is a few milliseconds per expiry; queries
+# for arbitrary (K, T) arrays are plain numpy.
+#   w(k) = a + b * (rho * (k - m) + sqrt((k - m)^2 + sigma^2)),  k = log(K / F)
+import numpy as np
+import pandas as pd
+
+from greeks import CALL_FLAGS, years_to_expiry
+from implied_vol import chain_prices, implied_volatility
+from instrumentation import timed
+from market_cache import default_cache
+
+SVI_PARAMS = ["a", "b", "rho", "m", "sigma"]
+SURFACE_COLUMNS = ["expiry", "T", *SVI_PARAMS, "rmse", "n", "spot", "r", "q"]
+MIN_POINTS = 5
+SIGMA_MIN, SIGMA_MAX = 1e-3, 2.0
+QUERY_CHUNK = 65536
+ZOOM_ROUNDS = 7
+
+
+def svi_total_variance(params, k):
+    a, b, rho, m, sigma = params
+    x = k - m
+    return a + b * (rho * x + np.sqrt(x * x + sigma * sigma))
+
+
+def _inner(k, w, wt, m, sigma):
+    # Quasi-explicit step: for fixed (m, sigma) the smile is linear in (a, d, c) with
+    # y = (k - m) / sigma, d = rho * b * sigma, c = b * sigma. m and sigma broadcast
+    # (leading axes), k / w / wt are the points. The Lee bound and |rho| <= 1 become
+    # the box u = c + d, v = c - d in [0, 2 sigma]; the unconstrained solution is
+    # projected into it and `a` re-fitted.
+    m, sigma = np.asarray(m, dtype=float)[..., None], np.asarray(sigma, dtype=float)[..., None]
+    y = (k - m) / sigma
+    z = np.sqrt(y * y + 1)
+    X = np.stack([np.ones_like(y), y, z], axis=-1)
+    XtW = X * wt[:, None]
+    A = np.swapaxes(XtW, -1, -2) @ X + 1e-12 * np.eye(3)
+    rhs = np.swapaxes(XtW, -1, -2) @ w
+    sol = np.linalg.solve(A, rhs[..., None])[..., 0]
+    d, c = sol[..., 1], sol[..., 2]
+    u = np.clip(c + d, 0, 2 * sigma[..., 0])
+    v = np.clip(c - d, 0, 2 * sigma[..., 0])
+    c, d = (u + v) / 2, (u - v) / 2
+    resid = w - d[..., None] * y - c[..., None] * z
+    a = np.clip((resid * wt).sum(-1) / wt.sum(), 0, w.max())
+    sse = (((resid - a[..., None]) ** 2) * wt).sum(-1)
+    return sse, a, d, c
+
+
+def fit_svi(k, w, weights=None):
+    # k: log-forward-moneyness, w: total implied variance (iv^2 T). Returns the five
+    # raw-SVI parameters and the weighted RMSE in total variance.
+    k, w = np.asarray(k, dtype=float), np.asarray(w, dtype=float)
+    wt = np.ones_like(w) if weights is None else np.asarray(weights, dtype=float)
+    wt = wt / wt.sum()
+    # coarse grid over (m, log sigma) in one batched solve, then zoom grids around
+    # the best point; each round is one vectorized call, so no per-step Python cost
+    m_step = max(k.max() - k.min(), 1e-3) / 14
+    ls_step = np.log(SIGMA_MAX / SIGMA_MIN) / 14
+    m0, ls0 = (k.max() + k.min()) / 2, np.log(SIGMA_MIN * SIGMA_MAX) / 2
+    ls_lo, ls_hi = np.log(SIGMA_MIN), np.log(SIGMA_MAX)
+    half = 7
+    for _ in range(ZOOM_ROUNDS):
+        offsets = np.arange(-half, half + 1)
+        mg, lg = np.meshgrid(m0 + offsets * m_step, np.clip(ls0 + offsets * ls_step, ls_lo, ls_hi), indexing="ij")
+        sse = _inner(k, w, wt, mg, np.exp(lg))[0]
+        i = np.unravel_index(np.argmin(sse), sse.shape)
+        m0, ls0 = mg[i], lg[i]
+        half = 4
+        m_step, ls_step = m_step / 4, ls_step / 4
+    m, sigma = float(m0), float(np.exp(ls0))
+    sse, a, d, c = (float(v) for v in _inner(k, w, wt, m, sigma))
+    b = c / sigma
+    rho = d / c if c > 0 else 0.0
+    return np.array([a, b, rho, m, sigma]), float(np.sqrt(sse))
+
+
+def _otm_quotes(chain, S, r, q, now, iv_col):
+    # one IV per strike and expiry: puts below the forward, calls at or above it
+    T = chain["T"].to_numpy(float) if "T" in chain else years_to_expiry(chain["expiry"], now)
+    K = chain["strike"].to_numpy(float)
+    call = np.isin(chain["type"].astype(str).to_numpy(), CALL_FLAGS)
+    F = S * np.exp((r - q) * T)
+    if iv_col is None:
+        iv = implied_volatility(chain_prices(chain), S, K, T, r, call, q)
+    else:
+        iv = chain[iv_col].to_numpy(float)
+    keep = (call == (K >= F)) & np.isfinite(iv) & (iv > 0) & (T > 0)
+    if "bid" in chain:
+        keep &= chain["bid"].to_numpy(float) > 0
+    return pd.DataFrame({"expiry": chain["expiry"].to_numpy(), "T": T, "k": np.log(K / F),
+                         "w": iv * iv * T})[keep]
+
+
+class VolSurface:
+    def __init__(self, params, spot, r=0.0, q=0.0):
+        # params: one row per expiry with T and the SVI parameters, sorted by T
+        self.params = params.sort_values("T").reset_index(drop=True)
+        self.spot, self.r, self.q = float(spot), float(r), float(q)
+        self._T = self.params["T"].to_numpy(float)
+        self._p = self.params[SVI_PARAMS].to_numpy(float).T[:, :, None]
+
+    @classmethod
+    @timed()
+    def fit(cls, chain, S, r=0.0, q=0.0, now=None, iv_col=None, min_points=MIN_POINTS):
+        # chain: long format (expiry, type, strike, bid/ask/lastPrice or iv_col). By
+        # default IVs are re-solved from mid prices rather than taken from the feed.
+        quotes = _otm_quotes(chain, S, r, q, now, iv_col)
+        rows = []
+        for expiry, g in quotes.groupby("expiry", sort=True):
+            if len(g) < min_points:
+                continue
+            params, rmse = fit_svi(g["k"].to_numpy(), g["w"].to_numpy())
+            rows.append([expiry, float(g["T"].iloc[0]), *params, rmse, len(g), S, r, q])
+        if not rows:
+            raise ValueError(f"no expiry has {min_points} usable quotes")
+        return cls(pd.DataFrame(rows, columns=SURFACE_COLUMNS), S, r, q)
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls(frame, frame["spot"].iloc[0], frame["r"].iloc[0], frame["q"].iloc[0])
+
+    def to_frame(self):
+        return self.params.copy()
+
+    def forward(self, T):
+        return self.spot * np.exp((self.r - self.q) * np.asarray(T, dtype=float))
+
+    def total_variance(self, k, T):
+        # k: log-forward-moneyness at T. Between expiries w is linear in T; before the
+        # first and after the last the nearest smile's implied vol is held flat.
+        k, T = np.broadcast_arrays(np.asarray(k, dtype=float), np.asarray(T, dtype=float))
+        out = np.empty(k.shape)
+        flat_k, flat_T, flat_out = k.ravel(), T.ravel(), out.reshape(-1)
+        n = len(self._T)
+        for lo in range(0, flat_k.size, QUERY_CHUNK):
+            kk, tt = flat_k[lo:lo + QUERY_CHUNK], flat_T[lo:lo + QUERY_CHUNK]
+            # every smile at every point, then a running max so w never falls with T
+            W = np.maximum.accumulate(svi_total_variance(self._p, kk[None, :]), axis=0)
+            hi = np.clip(np.searchsorted(self._T, tt), 1, max(n - 1, 1))
+            cols = np.arange(kk.size)
+            if n == 1:
+                w = W[0] * tt / self._T[0]
+            else:
+                t0, t1 = self._T[hi - 1], self._T[hi]
+                w0, w1 = W[hi - 1, cols], W[hi, cols]
+                w = w0 + (tt - t0) / (t1 - t0) * (w1 - w0)
+                w = np.where(tt < self._T[0], W[0] * tt / self._T[0], w)
+                w = np.where(tt > self._T[-1], W[-1] * tt / self._T[-1], w)
+            flat_out[lo:lo + QUERY_CHUNK] = w
+        return out
+
+    def iv(self, K, T):
+        # implied vol for any broadcastable strikes and year fractions
+        K, T = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(T, dtype=float))
+        k = np.log(K / self.forward(T))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            iv = np.sqrt(np.maximum(self.total_variance(k, T), 0.0) / T)
+        return np.where(T > 0, iv, np.nan)
+
+    def iv_for_chain(self, chain, now=None, out_col="surface_iv"):
+        T = chain["T"].to_numpy(float) if "T" in chain else years_to_expiry(chain["expiry"], now)
+        return chain.assign(**{out_col: self.iv(chain["strike"].to_numpy(float), T)})
+
+    def atm_iv(self, T):
+        return self.iv(self.forward(T), T)
+
+    def skew(self, T, width=0.1):
+        # put-wing minus call-wing vol at +/- width log-moneyness around the forward
+        F = self.forward(T)
+        return self.iv(F * np.exp(-width), T) - self.iv(F * np.exp(width), T)
+
+
+def snapshot_id(chain):
+    # content hash of the quotes, for callers without their own snapshot label
+    cols = [c for c in ("expiry", "type", "strike", "bid", "ask", "lastPrice", "impliedVolatility") if c in chain]
+    return format(int(pd.util.hash_pandas_object(chain[cols], index=False).sum()) & (2 ** 64 - 1), "016x")
+
+
+def surface_for(ticker, chain, S, r=0.0, q=0.0, snapshot=None, cache=None, now=None, iv_col=None):
+    # fitted once per (ticker, snapshot) and reused from the market-data cache; a
+    # snapshot's quotes never change, so cached surfaces do not expire
+    cache = default_cache() if cache is None else cache
+    if not cache:
+        return VolSurface.fit(chain, S, r, q, now, iv_col)
+    params = {"snapshot": snapshot or snapshot_id(chain), "S": float(S), "r": r, "q": q, "iv_col": iv_col}
+    frame = cache.get_or_fetch(ticker, "vol_surface", params,
+                               lambda: VolSurface.fit(chain, S, r, q, now, iv_col).to_frame())
+    return VolSurface.from_frame(frame)
@@ -0,0 +1,189 @@
+# volume_store.py
+# Date-partitioned Parquet store for daily scan results plus O(1)-per-observation
+# rolling statistics, so today's volume z-scores never re-read history.
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+WINDOW = 30
+Z_THRESHOLD = 2.5
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+class RollingStats:
+    # Per-key ring buffer of the last `window` observations with running sum and
+    # sum of squares. Re-applying the same date replaces that day's value, so a
+    # re-run of today's scan does not double count. Matches scipy.stats.zscore
+    # (ddof=0) over the window including today's value.
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.keys = pd.Index([], dtype=object)
+        self.buf = np.zeros((0, window), dtype=np.float32)
+        self.count = np.zeros(0, dtype=np.int32)
+        self.pos = np.zeros(0, dtype=np.int32)
+        self.total = np.zeros(0)
+        self.total_sq = np.zeros(0)
+        self.last_date = np.zeros(0, dtype="datetime64[D]")
+        self.updates = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _ensure(self, keys):
+        idx = self.keys.get_indexer(keys)
+        missing = idx < 0
+        if missing.any():
+            new = keys[missing]
+            n = len(new)
+            idx[missing] = np.arange(len(self.keys), len(self.keys) + n)
+            self.keys = self.keys.append(new)
+            self.buf = np.vstack([self.buf, np.zeros((n, self.window), dtype=np.float32)])
+            self.count = np.concatenate([self.count, np.zeros(n, dtype=np.int32)])
+            self.pos = np.concatenate([self.pos, np.zeros(n, dtype=np.int32)])
+            self.total = np.concatenate([self.total, np.zeros(n)])
+            self.total_sq = np.concatenate([self.total_sq, np.zeros(n)])
+            self.last_date = np.concatenate([self.last_date, np.full(n, np.datetime64("NaT"), dtype="datetime64[D]")])
+        return idx
+
+    def update(self, date, keys, values):
+        # keys must be unique within one update; returns z-scores aligned to keys
+        keys = pd.Index(keys, dtype=object)
+        values = np.asarray(values, dtype=float)
+        idx = self._ensure(keys)
+        date = np.datetime64(pd.Timestamp(date).date(), "D")
+        W = self.window
+
+        same = self.last_date[idx] == date
+        slot = np.where(same, (self.pos[idx] - 1) % W, self.pos[idx])
+        old = self.buf[idx, slot].astype(float)
+        evict = same | (self.count[idx] == W)
+        self.total[idx] += values - np.where(evict, old, 0.0)
+        self.total_sq[idx] += values * values - np.where(evict, old * old, 0.0)
+        self.buf[idx, slot] = values
+        self.pos[idx] = np.where(same, self.pos[idx], (self.pos[idx] + 1) % W)
+        self.count[idx] = np.where(same, self.count[idx], np.minimum(self.count[idx] + 1, W))
+        self.last_date[idx] = date
+
+        self.updates += 1
+        if self.updates % W == 0:
+            self.resync()
+        return self.zscore(idx, values)
+
+    def zscore(self, idx, values):
+        n = self.count[idx].astype(float)
+        mean = self.total[idx] / n
+        var = np.maximum(self.total_sq[idx] / n - mean * mean, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = (values - mean) / np.sqrt(var)
+        return np.where((n > 1) & (var > 1e-12 * np.maximum(mean * mean, 1.0)), z, np.nan)
+
+    def resync(self):
+        # exact recompute from the buffers to flush float drift from the running sums
+        buf = self.buf.astype(float)
+        self.total = buf.sum(axis=1)
+        self.total_sq = (buf * buf).sum(axis=1)
+
+    def prune(self, as_of, max_age_days=WINDOW):
+        # drop keys (e.g. expired strikes) not seen for max_age_days
+        age = (np.datetime64(pd.Timestamp(as_of).date(), "D") - self.last_date).astype(int)
+        keep = age <= max_age_days
+        for name in ("buf", "count", "pos", "total", "total_sq", "last_date"):
+            setattr(self, name, getattr(self, name)[keep])
+        self.keys = self.keys[keep]
+
+    def save(self, path):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, keys=self.keys.to_numpy(dtype=str), buf=self.buf, count=self.count, pos=self.pos,
+                 total=self.total, total_sq=self.total_sq, last_date=self.last_date,
+                 meta=np.array([self.window, self.updates]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, window=WINDOW):
+        stats = cls(window)
+        if not os.path.exists(path):
+            return stats
+        with np.load(path) as f:
+            stats.window, stats.updates = (int(x) for x in f["meta"])
+            stats.keys = pd.Index(f["keys"].astype(object), dtype=object)
+            for name in ("buf", "count", "pos", "total", "total_sq", "last_date"):
+                setattr(stats, name, f[name])
+        return stats
+
+
+class VolumeStore:
+    # <root>/scans/date=YYYY-MM-DD/part-0.parquet     per-ticker scan results
+    # <root>/strikes/date=YYYY-MM-DD/part-0.parquet   optional per-strike volumes
+    # <root>/state/<level>.npz                    RollingStats per level
+    def __init__(self, root, window=WINDOW):
+        self.root = root
+        self.window = window
+        for sub in ("scans", "strikes", "state"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+        self._stats = {}
+
+    def write_day(self, date, frame, level="scans"):
+        # rewriting a day replaces its partition; earlier days are never touched
+        part = os.path.join(self.root, level, f"date={pd.Timestamp(date):%Y-%m-%d}")
+        os.makedirs(part, exist_ok=True)
+        table = pa.Table.from_pandas(frame.drop(columns=["date"], errors="ignore"), preserve_index=False)
+        pq.write_table(table, os.path.join(part, "part-0.parquet"))
+
+    def read(self, start=None, end=None, tickers=None, columns=None, level="scans"):
+        path = os.path.join(self.root, level)
+        if not os.listdir(path):
+            return pd.DataFrame(columns=columns)
+        dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+        expr = None
+        for cond in (
+            ds.field("date") >= f"{pd.Timestamp(start):%Y-%m-%d}" if start is not None else None,
+            ds.field("date") <= f"{pd.Timestamp(end):%Y-%m-%d}" if end is not None else None,
+            ds.field("ticker").isin(list(tickers)) if tickers is not None else None,
+        ):
+            if cond is not None:
+                expr = cond if expr is None else expr & cond
+        cols = None if columns is None else list(dict.fromkeys(["date", *columns]))
+        return dataset.to_table(columns=cols, filter=expr).to_pandas()
+
+    def stats(self, level="scans"):
+        if level not in self._stats:
+            self._stats[level] = RollingStats.load(os.path.join(self.root, "state", f"{level}.npz"), self.window)
+        return self._stats[level]
+
+    def save_state(self):
+        for level, stats in self._stats.items():
+            stats.save(os.path.join(self.root, "state", f"{level}.npz"))
+
+    def score_day(self, date, frame, key_cols=("ticker",), value_col="total_volume", level="scans"):
+        # persist the day, update the running state and return frame + z_score
+        self.write_day(date, frame, level)
+        keys = frame[key_cols[0]].astype(str)
+        for col in key_cols[1:]:
+            keys = keys + "|" + frame[col].astype(str)
+        z = self.stats(level).update(date, keys, frame[value_col].to_numpy(float))
+        self.save_state()
+        return frame.assign(z_score=z)
+
+    def bootstrap_from_csv(self, csv_path, level="scans"):
+        # seed the running state from the legacy volume_history.csv layout
+        stats = self.stats(level)
+        if len(stats) or not os.path.exists(csv_path):
+            return
+        hist = pd.read_csv(csv_path).sort_values("date")
+        for date, day in hist.groupby("date", sort=True):
+            day = day.drop_duplicates("ticker", keep="last")
+            stats.update(date, day["ticker"].astype(str), day["total_volume"].astype(float))
+        self.save_state()
+
+
+def flag_anomalies(scored, threshold=Z_THRESHOLD):
+    return scored[scored["z_score"].abs() >= threshold]
+
+
+def chart_data(scored, top=15):
+    top_rows = scored.dropna(subset=["z_score"]).sort_values("z_score", ascending=False).head(top)
+    return top_rows[["ticker", "z_score"]].to_dict(orient="records")